@@ -0,0 +1,111 @@
+#
+# What answering the thermostat's .../config fetch costs.
+#
+# The 8 zone configuration in tests/fixtures is sent back the way
+# urlSystemsConfig() does it, from a ConfigTemplate serialized once with the
+# timestamp and any zone changes filled in, and the way it was done before,
+# a deepcopy() of the whole configuration changed and serialized each time.
+# Both are timed with no changes pending and with a hold for one zone, along
+# with their peak allocation.
+#
+#   python benchmarks/bench_config.py [--seconds N]
+#
+
+import argparse
+import copy
+from datetime import datetime
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity.configoverlay import ConfigTemplate
+
+SERIAL_NUMBER = "2118W123456"
+
+HOLD = {"1": ("away", "22:00")}
+HOLD_PATCHES = {("1", "hold"): "on", ("1", "holdActivity"): "away", ("1", "otmr"): "22:00"}
+
+
+def timestamp():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# How the response was made before ConfigTemplate
+def deepcopyConfig(configRoot, holds):
+    newConfigRoot = copy.deepcopy(configRoot)
+
+    newConfigRoot.set("version", "1.42")
+    newConfigRoot.set("xmlns:atom", "http://www.w3.org/2005/Atom")
+
+    tsEl = ET.Element("timestamp")
+    tsEl.text = timestamp()
+    newConfigRoot.insert(0, tsEl)
+
+    atomLink = ET.Element("atom:link")
+    atomLink.set("rel", "http://www.api.ing.carrier.com/rels/system")
+    atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + SERIAL_NUMBER)
+    newConfigRoot.insert(0, atomLink)
+
+    atomLink = ET.Element("atom:link")
+    atomLink.set("rel", "self")
+    atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + SERIAL_NUMBER + "/config")
+    newConfigRoot.insert(0, atomLink)
+
+    for zone in newConfigRoot.findall("./zones/zone"):
+        hold = holds.get(zone.attrib["id"])
+        if zone.find("./enabled").text != "on" or not hold:
+            continue
+        zone.find("./hold").text = "on"
+        zone.find("./holdActivity").text = hold[0]
+        zone.find("./otmr").text = hold[1]
+
+    return ET.tostring(newConfigRoot, "utf-8")
+
+
+def allocated(func):
+    tracemalloc.start()
+    func()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure(name, func, seconds):
+    func()
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(10):
+            func()
+        count += 10
+    elapsed = time.perf_counter() - start
+    print("{:<20}  {:8.3f} ms/fetch  {:6.1f} KB peak".format(
+        name, elapsed / count * 1000, allocated(func) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "tests", "fixtures", "config.xml")) as fixture:
+        configRoot = ET.fromstring(fixture.read()).find("config")
+
+    template = ConfigTemplate(configRoot, SERIAL_NUMBER)
+
+    print("{} zones, {} bytes".format(len(configRoot.findall("./zones/zone")), len(deepcopyConfig(configRoot, {}))))
+    measure("deepcopy", lambda: deepcopyConfig(configRoot, {}), args.seconds)
+    measure("deepcopy, hold", lambda: deepcopyConfig(configRoot, HOLD), args.seconds)
+    measure("template", lambda: template.render({}, timestamp()), args.seconds)
+    measure("template, hold", lambda: template.render(HOLD_PATCHES, timestamp()), args.seconds)
+    measure("building template", lambda: ConfigTemplate(configRoot, SERIAL_NUMBER), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#
+# How long a status upload takes to reach Home Assistant's event loop.
+#
+# A MyTCPServer on a loopback port is sent status uploads one at a time, and
+# the time from sending each request to the client's _update_zones() running
+# on the event loop is measured.  The event loop is in its own thread and
+# only wakes for its own timer every --tick seconds, like an otherwise idle
+# Home Assistant, so a hand-over that doesn't wake the loop shows up as up to
+# a tick of latency.
+#
+#   python benchmarks/bench_notify_latency.py [--uploads N] [--tick SECONDS]
+#
+
+import argparse
+import asyncio
+import os
+import re
+import socket
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity.httpserver import MyTCPHandler, MyTCPServer
+
+
+# Just what the server uses of Home Assistant and c_HTTPClient, with the
+# repository as the configuration directory
+class LoopHass:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.async_create_task = loop.create_task
+        self.config = self
+
+    def path(self, path):
+        return os.path.join(ROOT, path)
+
+
+class LoopClient:
+
+    def __init__(self, loop):
+        self.hass = LoopHass(loop)
+        self.arrived = []
+        self.event = threading.Event()
+
+    async def _update_zones(self, method, path, serialNumber, document):
+        self.arrived.append(time.perf_counter())
+        self.event.set()
+
+
+def statusUpload():
+    with open(os.path.join(ROOT, "tests", "fixtures", "status.xml")) as fixture:
+        body = ("data=" + quote(fixture.read())).encode("utf-8")
+    return (b"POST /systems/123/status HTTP/1.1\r\nHost: localhost\r\n"
+            b"Content-Type: application/x-www-form-urlencoded\r\n"
+            b"Content-Length: %d\r\n\r\n" % len(body)) + body
+
+
+def readResponse(connection):
+    connection.settimeout(5)
+    response = b""
+    while b"\r\n\r\n" not in response:
+        response += connection.recv(65536)
+    (head, body) = response.split(b"\r\n\r\n", 1)
+    length = int(re.search(rb"Content-Length: (\d+)", head).group(1))
+    while len(body) < length:
+        body += connection.recv(65536)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--tick", type=float, default=1.0)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+
+    def tick():
+        loop.call_later(args.tick, tick)
+    loop.call_soon_threadsafe(tick)
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    client = LoopClient(loop)
+    server = MyTCPServer(("127.0.0.1", 0), MyTCPHandler, client)
+    serverThread = threading.Thread(target=server.serve_forever)
+    serverThread.start()
+
+    request = statusUpload()
+    latencies = []
+    try:
+        for _ in range(args.uploads):
+            client.event.clear()
+            with socket.create_connection(server.server_address) as connection:
+                start = time.perf_counter()
+                connection.sendall(request)
+                if client.event.wait(args.tick + 5):
+                    latencies.append((client.arrived[-1] - start) * 1000)
+                # Let the server finish the response before the next upload
+                readResponse(connection)
+    finally:
+        server.shutdown()
+        serverThread.join()
+        server.server_close()
+
+    latencies.sort()
+    print("uploads {}  arrived {}".format(args.uploads, len(latencies)))
+    if latencies:
+        print("median {:.2f} ms  p95 {:.2f} ms  max {:.2f} ms".format(
+            statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], latencies[-1]))
+
+
+if __name__ == "__main__":
+    main()
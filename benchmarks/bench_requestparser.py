@@ -0,0 +1,88 @@
+#
+# How fast HttpRequestParser parses requests.
+#
+# A small GET like Home Assistant's /api calls, and a status upload made from
+# the fixture, are parsed over and over.  The upload is fed in one piece, in
+# pieces of a TCP segment like the servers read them off of loopback or the
+# network, and with its body read into bodyBuffer() as MyTCPHandler does.
+#
+#   python benchmarks/bench_requestparser.py [--seconds N]
+#
+
+import argparse
+import os
+import sys
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity.requestparser import HttpRequestParser
+
+# Payload of a full-size TCP segment on Ethernet
+SEGMENT_SIZE = 1448
+
+API_REQUEST = b"GET /api/status/1 HTTP/1.1\r\nHost: localhost\r\nAccept: */*\r\n\r\n"
+
+
+def statusUpload():
+    with open(os.path.join(ROOT, "tests", "fixtures", "status.xml")) as fixture:
+        body = ("data=" + quote(fixture.read())).encode("utf-8")
+    return (b"POST /systems/123/status HTTP/1.1\r\nHost: localhost\r\n"
+            b"Content-Type: application/x-www-form-urlencoded\r\n"
+            b"Content-Length: %d\r\n\r\n" % len(body)) + body
+
+
+def feedWhole(request):
+    parser = HttpRequestParser()
+    parser.feed(request)
+
+
+def feedSegments(pieces):
+    parser = HttpRequestParser()
+    for piece in pieces:
+        parser.feed(piece)
+
+
+def readIntoBody(pieces):
+    parser = HttpRequestParser()
+    for piece in pieces:
+        if parser.state == HttpRequestParser.STATE_BODY:
+            buffer = parser.bodyBuffer()
+            buffer[:len(piece)] = piece
+            parser.bodyReceived(len(piece))
+        else:
+            parser.feed(piece)
+
+
+def measure(name, func, arg, size, seconds):
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(100):
+            func(arg)
+        count += 100
+    elapsed = time.perf_counter() - start
+    print("{:<24}  {:8.0f} req/s  {:7.2f} us/req  {:7.1f} MB/s".format(
+        name, count / elapsed, elapsed / count * 1000000, count * size / elapsed / 1000000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    upload = statusUpload()
+    segments = [upload[i:i + SEGMENT_SIZE] for i in range(0, len(upload), SEGMENT_SIZE)]
+
+    print("status upload {} bytes, {} segments".format(len(upload), len(segments)))
+    measure("api GET", feedWhole, API_REQUEST, len(API_REQUEST), args.seconds)
+    measure("upload, one read", feedWhole, upload, len(upload), args.seconds)
+    measure("upload, segments", feedSegments, segments, len(upload), args.seconds)
+    measure("upload, body buffer", readIntoBody, segments, len(upload), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
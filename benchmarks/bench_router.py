@@ -0,0 +1,77 @@
+#
+# How long it takes to find the URL handler for a request path.
+#
+# The paths the thermostat and Home Assistant request are matched against
+# every registered URL, as the router does it and the way they were matched
+# before it: each regular expression with re.match() in the order they were
+# added.  The router is measured with its cache of recent paths and without
+# it, calling findMatch() directly.
+#
+#   python benchmarks/bench_router.py [--seconds N]
+#
+
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Registers every URL handler
+from custom_components.carrier_infinity import httpserver
+from custom_components.carrier_infinity.httpobj import urlRouter
+
+PATHS = [
+    "/systems/2118W123456/status",
+    "/systems/2118W123456/config",
+    "/systems/2118W123456/notifications",
+    "/systems/2118W123456",
+    "/weather/10001/forecast",
+    "/time/",
+    "/Alive",
+    "/api/status/1",
+    "/api/status/1/rt",
+    "/nothing",
+]
+
+
+# How paths were matched before the router
+def scanMatch(regexes, path):
+    for (regex, func) in regexes:
+        m = regex.match(path)
+        if m:
+            return (func, m.groups(), m.groupdict())
+    return None
+
+
+def measure(name, func, seconds):
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(100):
+            func()
+        count += 100
+    elapsed = time.perf_counter() - start
+    print("{:<38}  {:9.0f} match/s  {:6.2f} us/match".format(name, count / elapsed, elapsed / count * 1000000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    regexes = [(re.compile(route.reStr), route.func) for route in urlRouter.routes]
+    print("{} routes, {} in the trie".format(len(urlRouter.routes), len(urlRouter.routes) - len(urlRouter.fallbackRoutes)))
+
+    for path in PATHS:
+        print(path)
+        measure("  re.match() scan", lambda: scanMatch(regexes, path), args.seconds)
+        measure("  router", lambda: urlRouter.match(path), args.seconds)
+        measure("  router, uncached", lambda: urlRouter.findMatch(path), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#
+# Requests per second and latency of each server mode with concurrent clients.
+#
+# The same load is run against a MyTCPServer, a MyThreadPoolTCPServer and a
+# MyAsyncServer on a loopback port, after the fixture configuration and
+# status have been uploaded.  Each client sends its requests one after the
+# other on a new connection each, like Home Assistant and the thermostat do.
+# --clients clients GET /api/status/1 --requests times each, and alongside
+# them --uploaders clients keep sending status uploads, which wait the
+# simulated Internet delay before their response, until they are done.  The
+# rate and latency percentiles are of the /api requests.
+#
+#   python benchmarks/bench_servers.py [--clients N] [--requests N] [--uploaders N]
+#
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+from urllib.parse import quote
+
+from bench_notify_latency import ROOT, LoopClient, readResponse, statusUpload
+
+from custom_components.carrier_infinity.asyncserver import MyAsyncServer
+from custom_components.carrier_infinity.httpserver import MyTCPHandler, MyTCPServer, MyThreadPoolTCPServer
+
+API_REQUEST = b"GET /api/status/1 HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def configUpload():
+    with open(os.path.join(ROOT, "tests", "fixtures", "config.xml")) as fixture:
+        body = ("data=" + quote(fixture.read())).encode("utf-8")
+    return (b"POST /systems/123 HTTP/1.1\r\nHost: localhost\r\n"
+            b"Content-Type: application/x-www-form-urlencoded\r\n"
+            b"Content-Length: %d\r\n\r\n" % len(body)) + body
+
+
+def exchange(address, request):
+    with socket.create_connection(address) as connection:
+        connection.sendall(request)
+        readResponse(connection)
+
+
+def makeServer(mode, client, args):
+    address = ("127.0.0.1", 0)
+    # Enough for every client to have a connection waiting to be closed
+    maxOpen = args.clients + args.uploaders
+    if mode == "asyncio":
+        return MyAsyncServer(address, client, maxOpen)
+    if mode == "threadpool":
+        return MyThreadPoolTCPServer(address, MyTCPHandler, client, maxOpen, args.pool_size, maxOpen)
+    return MyTCPServer(address, MyTCPHandler, client, maxOpen)
+
+
+# The asyncio server only has its port once it is serving
+def serverAddress(server):
+    if not isinstance(server, MyAsyncServer):
+        return server.server_address
+    while server.server is None:
+        time.sleep(0.01)
+    return server.server.sockets[0].getsockname()[:2]
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(mode, client, args):
+    server = makeServer(mode, client, args)
+    serverThread = threading.Thread(target=server.serve_forever)
+    serverThread.start()
+
+    latencies = []
+    failures = []
+    uploads = []
+    lock = threading.Lock()
+    apiDone = threading.Event()
+
+    def apiLoop():
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            try:
+                exchange(address, API_REQUEST)
+            except OSError as exception:
+                with lock:
+                    failures.append(exception)
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    def uploadLoop():
+        request = statusUpload()
+        while not apiDone.is_set():
+            try:
+                exchange(address, request)
+            except OSError as exception:
+                with lock:
+                    failures.append(exception)
+                continue
+            with lock:
+                uploads.append(1)
+
+    try:
+        address = serverAddress(server)
+        exchange(address, configUpload())
+        exchange(address, statusUpload())
+
+        apiClients = [threading.Thread(target=apiLoop) for _ in range(args.clients)]
+        uploaders = [threading.Thread(target=uploadLoop) for _ in range(args.uploaders)]
+
+        start = time.perf_counter()
+        for thread in uploaders + apiClients:
+            thread.start()
+        for thread in apiClients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        apiDone.set()
+        for thread in uploaders:
+            thread.join()
+    finally:
+        server.shutdown()
+        serverThread.join()
+        server.server_close()
+
+    latencies.sort()
+    print("{:<10}  {:7.0f} req/s  p50 {:7.2f} ms  p99 {:7.2f} ms  uploads {:4}  failed {}".format(
+        mode, len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99),
+        len(uploads), len(failures)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--uploaders", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--modes", default="tcp,threadpool,asyncio")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = LoopClient(loop)
+
+    print("{} clients, {} requests each, {} uploading status".format(args.clients, args.requests, args.uploaders))
+    for mode in args.modes.split(","):
+        run(mode, client, args)
+
+
+if __name__ == "__main__":
+    main()
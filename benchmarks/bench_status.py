@@ -0,0 +1,113 @@
+#
+# What answering each of the thermostat's status polls costs.
+#
+# The thermostat POSTs its status every poll and gets back a short document
+# telling it whether there are changes for it to fetch.  The response is made
+# the way makeSystemsStatusResponse() does it, from a template of the
+# document with the timestamp and change flags filled in, and the way it was
+# made before, building it with ElementTree (renderSystemsStatusXml()) and
+# serializing it each time.  The whole poll, parsing the fixture upload and
+# handling it, is timed too for comparison.
+#
+#   python benchmarks/bench_status.py [--seconds N]
+#
+
+import argparse
+from datetime import datetime
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity import urlsystems
+from custom_components.carrier_infinity.httpobj import HttpRequest, HttpResponse
+from custom_components.carrier_infinity.httpserver import dispatchRequest
+
+SERIAL_NUMBER = "2118W123456"
+
+
+def statusRequest():
+    request = HttpRequest(HttpRequest.VERSION_1_1, HttpRequest.METHOD_GET, "/systems/{}/status".format(SERIAL_NUMBER), None)
+    request.pathDict = {"serialNumber": SERIAL_NUMBER}
+    return request
+
+
+def fixtureUpload(path, name):
+    with open(os.path.join(ROOT, "tests", "fixtures", name)) as fixture:
+        request = HttpRequest(HttpRequest.VERSION_1_1, HttpRequest.METHOD_POST, path, None)
+        request.body = "data=" + quote(fixture.read())
+    request.contentType = "application/x-www-form-urlencoded"
+    request.parseBody()
+    return request
+
+
+# The response as it was made before the template
+def elementTreeResponse(request):
+    serialNumber = request.pathDict["serialNumber"]
+    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    xmlBody = urlsystems.renderSystemsStatusXml(serialNumber, timestamp, "false", "false")
+
+    response = HttpResponse.okResponse()
+
+    response.headers.append(("Cache-Control", "private"))
+    response.addContentLengthHeader(len(xmlBody))
+    response.addContentTypeHeader("application/xml; charset=utf-8")
+    response.addServerHeader()
+    response.addRequestContextHeader()
+    response.addAccessControlHeader()
+    response.addDateHeader()
+
+    response.body = xmlBody
+
+    return response
+
+
+def templateResponse(request):
+    return urlsystems.makeSystemsStatusResponse(request, False, False)
+
+
+def wholePoll(request):
+    return dispatchRequest(request)
+
+
+def allocated(func, arg):
+    tracemalloc.start()
+    func(arg)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure(name, func, arg, seconds):
+    func(arg)
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(100):
+            func(arg)
+        count += 100
+    elapsed = time.perf_counter() - start
+    print("{:<16}  {:8.0f} polls/s  {:8.2f} us/poll  {:7} bytes peak".format(
+        name, count / elapsed, elapsed / count * 1000000, allocated(func, arg)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    dispatchRequest(fixtureUpload("/systems/{}".format(SERIAL_NUMBER), "config.xml"))
+    upload = fixtureUpload("/systems/{}/status".format(SERIAL_NUMBER), "status.xml")
+
+    measure("element tree", elementTreeResponse, statusRequest(), args.seconds)
+    measure("template", templateResponse, statusRequest(), args.seconds)
+    measure("whole poll", wholePoll, upload, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#
+# How long the thermostat waits for a weather forecast.
+#
+# /weather/<postal code>/forecast requests are handed to urlWeather() with a
+# stand-in for Carrier's server on a loopback port, which answers after
+# --delay seconds, or after --hang seconds to stand for a server that has
+# stopped answering.  Each case shows the latency of the thermostat's
+# requests and what they got back:
+#
+#  - a miss, fetched from a working server
+#  - a hit on a fresh forecast
+#  - a stale forecast while the server times out, served from the cache as a
+#    background refresh fails
+#  - a miss while the server times out, until the circuit breaker opens and
+#    requests fail straight away
+#
+#   python benchmarks/bench_weathercache.py [--delay S] [--timeout S] [--requests N]
+#
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity import urlweather
+from custom_components.carrier_infinity.httpobj import HttpRequest
+from custom_components.carrier_infinity.httpserver import dispatchRequest
+from custom_components.carrier_infinity.upstream import UpstreamClient
+
+FORECAST = b"<weather_forecast>" + b"<day/>" * 200 + b"</weather_forecast>"
+
+
+class StandInServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.delay = 0
+
+    # A client that timed out has gone by the time a slow answer is written
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(FORECAST)))
+        self.end_headers()
+        self.wfile.write(FORECAST)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def forecastRequest(host):
+    request = HttpRequest(HttpRequest.VERSION_1_1, HttpRequest.METHOD_GET, "/weather/10001/forecast", None)
+    request.host = host
+    return request
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(name, host, count, before=None):
+    latencies = []
+    codes = {}
+    for _ in range(count):
+        if before:
+            before()
+        start = time.perf_counter()
+        response = dispatchRequest(forecastRequest(host))[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        codes[response.code] = codes.get(response.code, 0) + 1
+    latencies.sort()
+    print("{:<28}  p50 {:9.3f} ms  max {:9.3f} ms  responses {}".format(
+        name, percentile(latencies, 0.5), latencies[-1], codes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--hang", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    server = StandInServer()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    host = "127.0.0.1:{}".format(server.server_address[1])
+
+    # Short timeouts, and no waiting between retries, so the run doesn't
+    # take long.  Failing requests take the timeout each, retries included.
+    urlweather.weatherClient = UpstreamClient(connectTimeout=args.timeout, readTimeout=args.timeout,
+                                              maxRetries=0, deadline=args.timeout)
+    cache = urlweather.weatherCache
+
+    server.delay = args.delay
+    urlweather.configureWeatherCache(900, 6 * 60 * 60)
+    measure("miss", host, args.requests, cache.clear)
+    measure("hit", host, args.requests * 100)
+
+    # Every request finds the forecast stale and starts a refresh unless one
+    # is already running
+    server.delay = args.hang
+    urlweather.configureWeatherCache(0, 6 * 60 * 60)
+    measure("stale, server timing out", host, args.requests * 100)
+    time.sleep(args.timeout * 1.5)
+
+    urlweather.configureWeatherCache(900, 6 * 60 * 60)
+    measure("miss, server timing out", host, args.requests, cache.clear)
+
+    stats = urlweather.weatherClient.stats()
+    print("upstream: {} requests, {} failed, {} rejected with the circuit {}".format(
+        stats["requests"], stats["failures"], stats["rejected"], stats["state"]))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
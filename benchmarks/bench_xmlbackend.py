@@ -0,0 +1,86 @@
+#
+# ElementTree against lxml for each kind of upload.
+#
+# The status, config, energy and history uploads in tests/fixtures are read
+# with each XML backend: parsed into a tree, read the way the component does
+# with XmlDocument (the tree and the dict for Home Assistant), and the tree
+# serialized again as responses are.  The peak memory of reading each one is
+# shown too, though only Python's allocations are traced, not those libxml2
+# makes for lxml's tree.  The default backend in xmlbackend.py comes from
+# these figures.
+#
+#   python benchmarks/bench_xmlbackend.py [--seconds N]
+#
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity import xmlbackend
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+FIXTURES = ["status.xml", "config.xml", "energy.xml", "history.xml"]
+
+
+def readDocument(xmlString):
+    document = XmlDocument(xmlString)
+    document.root
+    document.asDict()
+
+
+def allocated(func, arg):
+    tracemalloc.start()
+    func(arg)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def timed(func, arg, seconds):
+    func(arg)
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(10):
+            func(arg)
+        count += 10
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    backends = [xmlbackend.BACKEND_ETREE]
+    if xmlbackend.lxmlEtree is not None:
+        backends.append(xmlbackend.BACKEND_LXML)
+    else:
+        print("lxml is not installed, only ElementTree is measured")
+
+    print("{:<12} {:<6} {:>7}  {:>9}  {:>9}  {:>9}  {:>9}".format(
+        "upload", "parser", "bytes", "parse ms", "read ms", "write ms", "peak KB"))
+
+    for name in FIXTURES:
+        with open(os.path.join(ROOT, "tests", "fixtures", name)) as fixture:
+            xmlString = fixture.read()
+
+        for backend in backends:
+            xmlbackend.useBackend(backend)
+            root = xmlbackend.fromstring(xmlString)
+            print("{:<12} {:<6} {:>7}  {:9.3f}  {:9.3f}  {:9.3f}  {:9.0f}".format(
+                name, backend, len(xmlString),
+                timed(xmlbackend.fromstring, xmlString, args.seconds),
+                timed(readDocument, xmlString, args.seconds),
+                timed(xmlbackend.serialize, root, args.seconds),
+                allocated(readDocument, xmlString) / 1024))
+
+
+if __name__ == "__main__":
+    main()
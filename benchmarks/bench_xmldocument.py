@@ -0,0 +1,90 @@
+#
+# How long it takes to read the thermostat's uploads.
+#
+# Each recorded upload in tests/fixtures is read the way a /systems POST
+# handler and Home Assistant both need it: as an element tree for the
+# handler and as nested dicts for Home Assistant.  This was done by parsing
+# it twice, with ElementTree and xmltodict.  XmlDocument parses it once and
+# builds the dicts from the tree, or for uploads that no handler reads, in
+# one streaming pass.
+#
+#   python benchmarks/bench_xmldocument.py [--seconds N]
+#
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+try:
+    import xmltodict
+except ImportError:
+    xmltodict = None
+
+FIXTURES = ["config.xml", "status.xml"]
+
+
+def parseTwice(xmlString):
+    ET.fromstring(xmlString)
+    xmltodict.parse(xmlString, dict_constructor=dict)
+
+
+def treeAndDict(xmlString):
+    document = XmlDocument(xmlString)
+    document.root
+    document.asDict()
+
+
+def streamedDict(xmlString):
+    XmlDocument(xmlString).asDict()
+
+
+def allocated(func, arg):
+    tracemalloc.start()
+    func(arg)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure(name, func, arg, seconds):
+    func(arg)
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for _ in range(10):
+            func(arg)
+        count += 10
+    elapsed = time.perf_counter() - start
+    print("  {:<28}  {:8.3f} ms/upload  {:8.0f} KB peak".format(
+        name, elapsed / count * 1000, allocated(func, arg) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    for name in FIXTURES:
+        with open(os.path.join(ROOT, "tests", "fixtures", name)) as fixture:
+            xmlString = fixture.read()
+
+        print("{}, {} bytes".format(name, len(xmlString)))
+        if xmltodict:
+            measure("ElementTree and xmltodict", parseTwice, xmlString, args.seconds)
+        else:
+            print("  xmltodict is not installed, skipping the double parse")
+        measure("XmlDocument tree and dict", treeAndDict, xmlString, args.seconds)
+        measure("XmlDocument streamed dict", streamedDict, xmlString, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,3 @@
 """Custom component for controlling Carrier Infinity Touch thermostats through an Crrier Infinity proxy server"""
 VERSION = "12.21.21"
+DOMAIN = "carrier_infinity"
@@ -0,0 +1,180 @@
+#
+# An asyncio version of the HTTP server that the thermostat will interact
+# with.  It speaks the same wire protocol as MyTCPHandler and calls the same
+# URL handlers, but each connection is a coroutine so a slow thermostat, the
+# header pacing delays or a stalled body read do not hold up other clients
+# (such as the /api calls made by Home Assistant).
+#
+# The public methods mirror socketserver.TCPServer so that c_HTTPClient can
+# run either server the same way from its server thread.
+#
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from .httpobj import HttpResponse, bodyBuffers
+from .httpserver import dispatchRequest, isSystemsPath, loadStaticFiles, logAccess, notifyHTTPClient
+from .responsewriter import enableNoDelay, getHeaderPacing, responseHeadLines
+from .deferredclose import DEFAULT_MAX_OPEN, DeferredCloseManager
+from .requestparser import RECV_SIZE, HttpParseError, HttpRequestParser
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Simulated delay from the Internet for /systems responses
+SYSTEMS_DELAY_SECONDS = 0.1
+
+
+class MyAsyncServer:
+
+    def __init__(self, host_port_tuple, _HTTPClient, maxDeferredClose=DEFAULT_MAX_OPEN):
+        self.server_address = host_port_tuple
+        self._HTTPClient = _HTTPClient
+        loadStaticFiles(_HTTPClient)
+        self.loop = None
+        self.server = None
+        self.stopEvent = None
+        self.isShutDown = threading.Event()
+        # URL handlers are synchronous and share module state, so they are run
+        # one at a time off of the event loop.
+        self.handlerExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carrier_infinity_handler")
+        self.deferredCloseSockets = DeferredCloseManager(maxOpen=maxDeferredClose)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        self.isShutDown.clear()
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.isShutDown.set()
+
+    # Called from another thread to stop serve_forever() and wait for it.
+    def shutdown(self):
+        if self.loop and self.stopEvent:
+            self.loop.call_soon_threadsafe(self.stopEvent.set)
+            self.isShutDown.wait()
+
+    # Same as MyTCPServer.server_close, serve() has normally stopped the
+    # deferred closes already
+    def server_close(self):
+        self.deferredCloseSockets.stop()
+        self.handlerExecutor.shutdown(wait=False)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopEvent = asyncio.Event()
+
+        (host, port) = self.server_address
+        self.server = await asyncio.start_server(self.handleConnection, host, port, reuse_address=True)
+
+        self.deferredCloseSockets.start()
+
+        async with self.server:
+            await self.stopEvent.wait()
+            self.deferredCloseSockets.stop()
+
+    # Each header is written on its own so that it goes out as its own TCP
+    # packet.  Any pacing between headers is awaited rather than slept.
+    async def writeHead(self, writer, httpResponseObj):
+        headerPacing = getHeaderPacing(httpResponseObj)
+        for line in responseHeadLines(httpResponseObj):
+            writer.write(line)
+            await writer.drain()
+            if headerPacing:
+                await asyncio.sleep(headerPacing)
+
+    # Same as MyTCPHandler.parseHttpRequest
+    async def parseHttpRequest(self, reader, writer, clientAddress):
+
+        parser = HttpRequestParser()
+
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(RECV_SIZE), max(parser.timeLeft(), 0))
+                if not data:
+                    if parser.request:
+                        _LOGGER.warning("  Connection closed before request was complete")
+                    return None
+
+                if parser.feed(data):
+                    break
+
+        except asyncio.TimeoutError:
+            if parser.state == HttpRequestParser.STATE_HEADERS:
+                _LOGGER.warning("  Timeout waiting for request headers from {}".format(clientAddress[0]))
+                return None
+            _LOGGER.warning("  Timeout witing for body, need {} more bytes".format(parser.bodyRemaining()))
+            await self.sendResponse(writer, clientAddress, parser.request, HttpResponse.errorResponse(400, "Bad Request"))
+            return None
+
+        except HttpParseError as exception:
+            _LOGGER.warning("  Bad request from {} - {}".format(clientAddress[0], exception))
+            if not exception.request:
+                return None
+            await self.sendResponse(writer, clientAddress, exception.request, HttpResponse.errorResponse(exception.code, exception.message))
+            return None
+
+        return parser.request
+
+    # Returns True if the connection should be kept open for a while, which
+    # is what MyTCPHandler does after it has sent a response body.
+    async def sendResponse(self, writer, clientAddress, httpRequestObj, httpResponseObj):
+
+        logAccess(clientAddress, httpRequestObj, httpResponseObj)
+
+        await self.writeHead(writer, httpResponseObj)
+
+        if not httpResponseObj.body:
+            return False
+
+        writer.writelines(bodyBuffers(httpResponseObj.body))
+        await writer.drain()
+
+        return True
+
+    # The deferred close manager reaps from its own thread, so the close is
+    # handed back to the event loop.
+    def deferClose(self, clientAddress, writer):
+        self.deferredCloseSockets.add(clientAddress, lambda: self.loop.call_soon_threadsafe(writer.close))
+
+    async def handleConnection(self, reader, writer):
+        clientAddress = writer.get_extra_info("peername")
+        enableNoDelay(writer.get_extra_info("socket"))
+        keepOpen = False
+
+        try:
+            httpRequestObj = await self.parseHttpRequest(reader, writer, clientAddress)
+
+            if not httpRequestObj:
+                return
+
+            (httpResponseObj, handled) = await self.loop.run_in_executor(self.handlerExecutor, dispatchRequest, httpRequestObj)
+
+            if not handled:
+                keepOpen = await self.sendResponse(writer, clientAddress, httpRequestObj, httpResponseObj)
+                return
+
+            # Simulate delay from Internet 100ms, seems to help the theromostat
+            # accept the response.  Home Assistant doesn't have to wait for it.
+            if isSystemsPath(httpRequestObj.path):
+                notifyHTTPClient(self._HTTPClient, httpRequestObj)
+                await asyncio.sleep(SYSTEMS_DELAY_SECONDS)
+                keepOpen = await self.sendResponse(writer, clientAddress, httpRequestObj, httpResponseObj)
+            else:
+                keepOpen = await self.sendResponse(writer, clientAddress, httpRequestObj, httpResponseObj)
+
+        except Exception as exception:
+            _LOGGER.warning("Connection from {} failed - {}".format(clientAddress, exception))
+
+        finally:
+            if keepOpen:
+                _LOGGER.debug("  Deferring close of {}".format(clientAddress))
+                self.deferClose(clientAddress, writer)
+            else:
+                writer.close()
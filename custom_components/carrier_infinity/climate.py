@@ -2,7 +2,7 @@
 Platform for exposing a Carrier Infinity Touch climate device through the
 HTTPClient proxy application
 """
-from homeassistant.core import Event
+from homeassistant.core import Event, callback
 from homeassistant.components.climate import (
     ClimateEntity,
     ClimateEntityFeature,
@@ -11,6 +11,7 @@ from homeassistant.components.climate import (
     PLATFORM_SCHEMA
 )
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers import discovery
 from homeassistant.components.climate.const import (
     FAN_AUTO,
     FAN_LOW,
@@ -45,16 +46,29 @@ import asyncio
 import socket
 import aiohttp
 import async_timeout
-from urllib.error import URLError
 import threading
 import json
-import datetime
 import re
 import logging
 import time
 import yaml
 
-from .httpserver import MyTCPHandler, MyTCPServer
+from . import DOMAIN
+from .httpserver import (
+    DEFAULT_POOL_QUEUE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    MyTCPHandler,
+    MyTCPServer,
+    MyThreadPoolTCPServer,
+)
+from .asyncserver import MyAsyncServer
+from .commands import FanCommand, HoldCommand, SetpointCommand
+from .urlsystems import submitCommand
+from .deferredclose import DEFAULT_MAX_OPEN
+from .zonechanges import ZoneChangeTracker, ZoneSnapshot, ZoneUpdate
+from .schedule import WeeklySchedule
+from .xmlbackend import BACKEND_ETREE, BACKENDS, useBackend
+from .urlweather import DEFAULT_WEATHER_MAX_STALE, DEFAULT_WEATHER_TTL, configureWeatherCache, weatherClient
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -93,6 +107,11 @@ PRESET_MANUAL_TEMP = (
 )
 PRESET_MANUAL_PERM = "Hold"  # Override the schedule indefinitely
 
+# HTTP server implementations the thermostat can be served by
+SERVER_MODE_TCP = "tcp"
+SERVER_MODE_THREADPOOL = "threadpool"
+SERVER_MODE_ASYNCIO = "asyncio"
+
 PRESET_MODES = [
     PRESET_SCHEDULE,
     PRESET_HOME,
@@ -128,6 +147,13 @@ Notify_SCHEMA = vol.Schema(
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Optional(CONF_PORT, default=5000): cv.port,
+        vol.Optional("server_mode", default=SERVER_MODE_TCP): vol.In([SERVER_MODE_TCP, SERVER_MODE_THREADPOOL, SERVER_MODE_ASYNCIO]),
+        vol.Optional("max_deferred_sockets", default=DEFAULT_MAX_OPEN): cv.positive_int,
+        vol.Optional("pool_size", default=DEFAULT_POOL_SIZE): cv.positive_int,
+        vol.Optional("pool_queue_depth", default=DEFAULT_POOL_QUEUE_DEPTH): cv.positive_int,
+        vol.Optional("xml_backend", default=BACKEND_ETREE): vol.In(BACKENDS),
+        vol.Optional("weather_cache_ttl", default=DEFAULT_WEATHER_TTL): cv.positive_int,
+        vol.Optional("weather_max_stale", default=DEFAULT_WEATHER_MAX_STALE): cv.positive_int,
         vol.Optional("zone_names", default=[]): list,
         vol.Optional("notify", default=dict): {
             str: vol.Any(
@@ -143,6 +169,12 @@ jsonHEADERS = {"Content-type": "application/json"}
 def setup_platform(hass, config, add_devices, discovery_info=None):
     """Set up the connection"""
     port = config.get(CONF_PORT)
+    server_mode = config.get("server_mode")
+    max_deferred_sockets = config.get("max_deferred_sockets")
+    pool_size = config.get("pool_size")
+    pool_queue_depth = config.get("pool_queue_depth")
+    useBackend(config.get("xml_backend"))
+    configureWeatherCache(config.get("weather_cache_ttl"), config.get("weather_max_stale"))
     notify = {}
     notifyjson = {}
     if "notify" in config:
@@ -153,7 +185,7 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
         notifyjson = None
     _LOGGER.debug(f"NotifyJ: {notifyjson}")
 
-    _HTTPClient = c_HTTPClient(hass, port, notifyjson)
+    _HTTPClient = c_HTTPClient(hass, port, notifyjson, server_mode, max_deferred_sockets, pool_size, pool_queue_depth)
 
     status = _HTTPClient.HTTPServer()
     failcnt = 0
@@ -176,7 +208,7 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
             return False
 
     devices = []
-    _zones = []
+    _zones = {}
     _LOGGER.debug(f"Setup Status: {status}")
     # Create devices
     zones = status["zones"]["zone"]
@@ -192,11 +224,15 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
         if zones[i]["enabled"] == "on":
             zid = zones[i]["@id"]
             _LOGGER.info(f"Zone ID {zid} called {zone_name} found")
-            _zones.append(zone_name)
+            _zones[zid] = zone_name
             devices.append(_HTTPClientZone(_HTTPClient, zid, zone_name))
     _HTTPClient.set_zones(_zones)
     add_devices(devices)
 
+    # The server's stats are on a sensor of their own
+    hass.data[DOMAIN] = _HTTPClient
+    discovery.load_platform(hass, "sensor", DOMAIN, {}, config)
+
     def service_set_hold_mode(service):
         """Set the Hold Mode on the target thermostats."""
         # TODO: Add constants and a service schema?
@@ -226,12 +262,20 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
 
 
 class c_HTTPClient:
-    def __init__(self, hass, port, notify: dict = {}):
+    def __init__(self, hass, port, notify: dict = {}, server_mode=SERVER_MODE_TCP, max_deferred_sockets=DEFAULT_MAX_OPEN,
+                 pool_size=DEFAULT_POOL_SIZE, pool_queue_depth=DEFAULT_POOL_QUEUE_DEPTH):
         self.hass = hass
         self.host = "0.0.0.0"
         self.local_host = "127.0.0.1"
         self.port = port
-        self._zones = []
+        self.server_mode = server_mode
+        self.max_deferred_sockets = max_deferred_sockets
+        self.pool_size = pool_size
+        self.pool_queue_depth = pool_queue_depth
+        self._zones = {}
+        self.zone_entities = {}
+        self.zone_changes = ZoneChangeTracker()
+        self.snapshot = ZoneSnapshot(None, None)
         self.notify = notify
         self.thread = None
         self.threadrunning = None
@@ -256,8 +300,16 @@ class c_HTTPClient:
             pass
         return None
 
+    def makeHTTPServer(self):
+        if self.server_mode == SERVER_MODE_ASYNCIO:
+            return MyAsyncServer((self.host, self.port), self, self.max_deferred_sockets)
+        if self.server_mode == SERVER_MODE_THREADPOOL:
+            return MyThreadPoolTCPServer((self.host, self.port), MyTCPHandler, self, self.max_deferred_sockets,
+                                         self.pool_size, self.pool_queue_depth)
+        return MyTCPServer((self.host, self.port), MyTCPHandler, self, self.max_deferred_sockets)
+
     def HTTPServerThread(self):
-        with MyTCPServer((self.host, self.port), MyTCPHandler, self) as self.httpserver:
+        with self.makeHTTPServer() as self.httpserver:
             try:
                 _LOGGER.info("Infinity component listening on ip:port {}:{}".format(self.host, self.port))
                 self.httpserver.serve_forever()
@@ -271,10 +323,23 @@ class c_HTTPClient:
         self.setRecord()
         self.threadrunning = False
 
-    async def _update_zones(self, method, path, serialNumber, data: dict = {}):
+    # document is the XmlDocument uploaded by the thermostat, shared with the
+    # URL handlers.  Its dict view is only built when it is stored.
+    #
+    # Status and config uploads are compared with the previous ones and only
+    # the zones that changed (or haven't been refreshed for a while) are
+    # refreshed, all together by refresh_zones().  zone_diff() gives what
+    # changed.
+    async def _update_zones(self, method, path, serialNumber, document):
         sys_type = path.rsplit('/', 1)[1]
+        if sys_type == serialNumber:
+            record_key = "config"
+        else:
+            record_key = sys_type
         if self.httpserver_running:
+            changes = {}
             if method == "POST":
+                data = document.asDict()
                 if sys_type == serialNumber:
                     self.my_record["config"] = data["system"]["config"]
                 else:
@@ -282,23 +347,63 @@ class c_HTTPClient:
                         self.my_record[sys_type] = data[sys_type]
                     else:
                         self.my_record[sys_type] = data
-            if sys_type == "config" or sys_type == "status":
-                for zone in self._zones:
-                    _LOGGER.debug(f"Zone Update: {zone} Path: {path}")
-                    eid = re.sub("[^0-9a-zA-Z]+", "_", zone.lower())
-                    await self.hass.services.async_call("homeassistant", "update_entity", {
-                        "entity_id": f"climate.carrier_infinity_{eid}"
-                        }, False)
+                if record_key == "config" or record_key == "status":
+                    changes = self.zone_changes.update(record_key, self.my_record[record_key])
+                    self.snapshot = self.snapshot.replace(record_key, self.my_record[record_key])
+            if record_key == "config" or record_key == "status":
+                self.refresh_zones([
+                    ZoneUpdate(zone_id, record_key, changes.get(zone_id, {}), self.zone_changes.generation(zone_id, record_key))
+                    for zone_id in self.zone_changes.zonesToRefresh(self._zones, changes, self.snapshot.localTime)
+                ])
             elif sys_type in self.notify:
                 await self.async_notify(sys_type, self.notify[sys_type])
         else:
             _LOGGER.debug(f"sys_type: {sys_type} serialNumber: {serialNumber}")
             if sys_type == serialNumber:
-                self.my_record["config"] = data["system"]["config"]
+                self.my_record["config"] = document.asDict()["system"]["config"]
+                self.zone_changes.update("config", self.my_record["config"])
+                self.snapshot = self.snapshot.replace("config", self.my_record["config"])
                 self.httpserver_running = True
 
+    def deferred_close_stats(self):
+        if self.httpserver:
+            return self.httpserver.deferredCloseSockets.stats()
+        return None
+
+    def pool_stats(self):
+        if isinstance(self.httpserver, MyThreadPoolTCPServer):
+            return self.httpserver.poolStats()
+        return None
+
+    def upstream_stats(self):
+        return weatherClient.stats()
+
     def set_zones(self, zones):
         self._zones = zones
+
+    @callback
+    def add_zone_entity(self, entity):
+        """Refresh an entity with its zone's updates until the returned
+        function is called"""
+        self.zone_entities[entity.zone_id] = entity
+
+        @callback
+        def remove_zone_entity():
+            if self.zone_entities.get(entity.zone_id) is entity:
+                del self.zone_entities[entity.zone_id]
+        return remove_zone_entity
+
+    @callback
+    def refresh_zones(self, zone_updates):
+        """Refresh the entities of the zones in zone_updates, a list of
+        ZoneUpdate, one after the other in this pass of the event loop"""
+        if not zone_updates:
+            return
+        _LOGGER.debug("Zone Update: %s", zone_updates)
+        for zone_update in zone_updates:
+            entity = self.zone_entities.get(zone_update.zoneId)
+            if entity is not None:
+                entity._handle_zone_update(zone_update)
 #===============================================================================
 #               Memory
 #===============================================================================
@@ -307,6 +412,7 @@ class c_HTTPClient:
         if os.path.exists(self.hass.config.path("custom_components/carrier_infinity/z_record.json")):
             with open("/config/custom_components/carrier_infinity/z_record.json", "r") as json_file:
                 self.my_record = json.load(json_file)
+            self.snapshot = ZoneSnapshot(self.status(), self.config())
 
     def setRecord(self):
         with open(self.hass.config.path("custom_components/carrier_infinity/z_record.json"), 'w') as outfile:
@@ -372,6 +478,18 @@ class c_HTTPClient:
         else:
             return None
 
+    def zone_diff(self, zone_id, kind):
+        """What changed in a zone with the last "status" or "config" upload
+        that changed it, as a dict of path to (old, new) values"""
+        return self.zone_changes.lastDiff(zone_id, kind)
+
+    def zone_generation(self, zone_id, kind):
+        return self.zone_changes.generation(zone_id, kind)
+
+    def zone_snapshot(self):
+        """The latest status and config, indexed by zone, as a read-only ZoneSnapshot"""
+        return self.snapshot
+
     def _pushovernotimute(self, mutecmd):
         _LOGGER.debug(f"PusherOver Mute Cmd: {mutecmd}")
         self.pushovernotimute = mutecmd
@@ -381,6 +499,12 @@ class c_HTTPClient:
 #               API Wrappers
 #===============================================================================
 
+    def send_command(self, command):
+        """Queue a HoldCommand, FanCommand or SetpointCommand for the
+        thermostat, False if its zone is not enabled"""
+        _LOGGER.debug(f"Command: {command}")
+        return submitCommand(command)
+
     def api(self, path, req_data=None):
         url = "http://{}:{}{}".format(self.local_host, self.port, path)
 
@@ -416,7 +540,9 @@ class _HTTPClientZone(ClimateEntity):
         eid = re.sub("[^0-9a-zA-Z]+", "_", zone_name.lower())
         self.entity_id = f"climate.carrier_infinity_{eid}"
 
-        self.configupdateinter = 0
+        # The zone's WeeklySchedule, and the zone config it was compiled from
+        self.schedule = None
+        self.schedule_source = None
 
         self.system_status = {}
         self.system_config = {}
@@ -446,12 +572,11 @@ class _HTTPClientZone(ClimateEntity):
         self.activity_scheduled_start = None
         self.activity_next = None
         self.activity_next_start = None
-        self.occupancy = None  # occupied, unoccupied, motion
+        self._occupancy = None  # occupied, unoccupied, motion
         self.airflow_cfm = None
         self.outdoor_temperature = None
 
         self._preset_mode = None
-        self.last_run = 0
 
         self.zone_index = int(self.zone_id) - 0
 
@@ -465,17 +590,51 @@ class _HTTPClientZone(ClimateEntity):
 
     @property
     def should_poll(self):
-        """Return the polling state."""
-        return True
-
-    def _last_run(self):
-        return time.time() - self.last_run
-
-    def update(self):
-        if self._last_run() < 30:
+        """Updates are pushed by the HTTP server when the thermostat uploads."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Subscribe to the ZoneUpdates for this zone."""
+        self.async_on_remove(self._HTTPClient.add_zone_entity(self))
+        # Catch up on anything uploaded since the entity was created
+        self._handle_zone_update(None)
+
+    @callback
+    def _handle_zone_update(self, zone_update):
+        """Re-read the zone, writing the state only if something shown changed."""
+        snapshot = self._HTTPClient.zone_snapshot()
+        if snapshot.zoneStatus(self.zone_id) is None or snapshot.zoneConfig(self.zone_id) is None:
+            # Left out of the last upload, keep the last state shown until it's back
+            _LOGGER.debug("No status or config for zone %s", self.zone_id)
+            return
+        before = self._state_snapshot()
+        try:
+            self.update()
+        except (AttributeError, TypeError, ValueError) as exception:
+            # Keep the last state shown rather than raising into the event loop
+            _LOGGER.error("Unable to update zone %s - %s", self.zone_id, exception)
             return
+        # The scheduled activity changes when the next period starts
+        self._HTTPClient.zone_changes.refreshAt(self.zone_id, self.activity_next_start)
+        if self._state_snapshot() != before:
+            self.async_write_ha_state()
+
+    def _state_snapshot(self):
+        """The values the state is built from, apart from the local time
+        which changes with every upload.  The energy and notification records
+        are compared by identity since a new one is stored for each upload."""
+        return (
+            self.zone_name, self._temperature_unit, self._current_temperature, self._current_humidity,
+            self._hvac_mode, self._hvac_action, self._fan_mode, self._preset_mode,
+            self._filtrlvl, self._humlvl, self._uvlvl,
+            self.hold_state, self.hold_activity, self.hold_until, self.hold_mode,
+            self.setpoint_heat, self.setpoint_cool, self.activity_current,
+            self.activity_scheduled, self.activity_scheduled_start, self.activity_next, self.activity_next_start,
+            self._occupancy, self.airflow_cfm, self.outdoor_temperature,
+            id(self._HTTPClient.rtn_record("energy")), id(self._HTTPClient.rtn_record("notifications")),
+        )
 
-        self.last_run = time.time()
+    def update(self):
         def get_safe(source, key, index=0, empty_dict_as_none=True):
             """Helper function to safely parse JSON coming from HTTPServer,
             where single values can be returned as lists"""
@@ -493,38 +652,13 @@ class _HTTPClientZone(ClimateEntity):
                 result = None
             return result
 
-        # Retrieve full system status and config
-        try:
-            self.system_status = self._HTTPClient.status()
-            if self.configupdateinter <= 0:
-                self.system_config = self._HTTPClient.config()
-                self.configupdateinter = 10
-            else:
-                self.configupdateinter = self.configupdateinter - 1
-        except URLError as e:
-            _LOGGER.error(
-                "Unable to retrieve data from HTTPServer: {}".format(e.reason)
-            )
-            return
-
-
-        # Parse system data for zone-specific information
-        self.zone_status = next(
-            (
-                z
-                for z in get_safe(self.system_status, "zones")["zone"]
-                if z["@id"] == self.zone_id
-            ),
-            None,
-        )
-        self.zone_config = next(
-            (
-                z
-                for z in get_safe(self.system_config, "zones")["zone"]
-                if z["@id"] == self.zone_id
-            ),
-            None,
-        )
+        # Full system status and config, and this zone's part of them, all
+        # from the same snapshot
+        snapshot = self._HTTPClient.zone_snapshot()
+        self.system_status = snapshot.status
+        self.system_config = snapshot.config
+        self.zone_status = snapshot.zoneStatus(self.zone_id)
+        self.zone_config = snapshot.zoneConfig(self.zone_id)
 
         # These status values are always reliable
         self.zone_name = get_safe(self.zone_status, "name")
@@ -577,71 +711,24 @@ class _HTTPClientZone(ClimateEntity):
         # even if the thermostat status does not yet reflect the change submitted via the API.
         # We can override with the correct values from the zone config.
         if get_safe(self.zone_config, "holdActivity") == "manual":
-            activity_manual = next(
-                (
-                    a
-                    for a in get_safe(self.zone_config, "activities")["activity"]
-                    if "@id" in a and a["@id"] == "manual"
-                ),
-                None,
-            )
+            activity_manual = snapshot.activity(self.zone_id, "manual")
             if activity_manual is not None:
                 self.activity_current = "manual"
                 self.setpoint_heat = float(get_safe(activity_manual, "htsp"))
                 self.setpoint_cool = float(get_safe(activity_manual, "clsp"))
                 self._fan_mode = get_safe(activity_manual, "fan")
 
-        # Iterate through the system config to calculate the current and next schedule details
-        # Looks for the next 'enabled' period in the zone program
-        self.activity_scheduled = None
-        self.activity_scheduled_start = None
-        self.activity_next = None
-        self.activity_next_start = None
-
-        # Current timestamp can include a TZ offset in some systems.  It should be stripped off
-        # since the timestamp is already in the local time.
-        local_time = get_safe(self.system_status, "localTime")
-        matches = re.match(
-            r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})([+-]\d{2}:\d{2})?$", local_time
-        )
-        local_time = matches.group(1)
-        dt = datetime.datetime.strptime(local_time, "%Y-%m-%dT%H:%M:%S")
-
-        while (self.activity_next is None) or (self.activity_scheduled) is None:
-            day_name = dt.strftime("%A")
-            program = next(
-                (
-                    day
-                    for day in get_safe(self.zone_config, "program")["day"]
-                    if day["@id"] == day_name
-                )
-            )
-            for period in program["period"]:
-                if get_safe(period, "enabled") == "off":
-                    continue
-                period_hh, period_mm = get_safe(period, "time").split(":")
-                period_datetime = datetime.datetime(
-                    dt.year, dt.month, dt.day, int(period_hh), int(period_mm)
-                )
-                #_LOGGER.debug(f"DT={dt.year}-{dt.month}-{dt.day}={int(period_hh)}:{int(period_mm)}")
-                if period_datetime < dt:
-                    self.activity_scheduled = get_safe(period, "activity")
-                    self.activity_scheduled_start = period_datetime
-                if period_datetime >= dt:
-                    self.activity_next = get_safe(period, "activity")
-                    self.activity_next_start = period_datetime
-                    break
-                #_LOGGER.debug(f"ACT={period}")
-            if self.activity_next is None:
-                dt = datetime.datetime(
-                    year=dt.year, month=dt.month, day=dt.day
-                ) + datetime.timedelta(days=1)
-            #elif self.activity_scheduled is None:  #Got an issue with activity schdule from midnight to first setpoint
-            #    dt = datetime.datetime(
-            #        year=dt.year, month=dt.month, day=dt.day
-            #    ) + datetime.timedelta(days=-1)
-            else:
-                break
+        # Find the current and next schedule details from the zone program,
+        # compiled again only when a new config has been read.  The local
+        # time is the thermostat's, parsed once per status upload.
+        if self.zone_config is not self.schedule_source:
+            self.schedule = WeeklySchedule.fromProgram(get_safe(self.zone_config, "program"))
+            self.schedule_source = self.zone_config
+        dt = snapshot.localTime
+        if dt is None:
+            raise ValueError("Bad local time {}".format(get_safe(self.system_status, "localTime")))
+        (self.activity_scheduled, self.activity_scheduled_start) = self.schedule.scheduled(dt)
+        (self.activity_next, self.activity_next_start) = self.schedule.next(dt)
 
 
         # Compute a custom 'hold_mode' based on the combination of hold values
@@ -708,7 +795,7 @@ class _HTTPClientZone(ClimateEntity):
             "hold_until": self.hold_until,
             "outdoor_temperature": self.outdoor_temperature,
             "airflow_cfm": self.airflow_cfm,
-            "occupancy": self.occupancy,
+            "occupancy": self._occupancy,
             "filter_level": self._filtrlvl,
             "humid_filter_level": self._humlvl,
             "uv_filter_level": self._uvlvl,
@@ -903,7 +990,16 @@ class _HTTPClientZone(ClimateEntity):
             self.setpoint_heat = kwargs[ATTR_TARGET_TEMP_LOW]
             data["htsp"] = kwargs[ATTR_TARGET_TEMP_LOW]
 
-        self.set_hold_mode(activity=ACTIVITY_MANUAL,temp=kwargs["temperature"])
+        # A single temperature only sets a point in heat or cool mode, in
+        # heat_cool mode it sets neither and the zone is left as it is
+        if not data:
+            _LOGGER.debug("No set point to change for zone %s in %s mode", self.zone_id, self.hvac_mode)
+            return
+
+        # Hold the manual activity with the new set points.  Both commands
+        # go to the thermostat together with its next config fetch.
+        self._HTTPClient.send_command(SetpointCommand(self.zone_id, ACTIVITY_MANUAL, data.get("htsp"), data.get("clsp")))
+        self.set_hold_mode(activity=ACTIVITY_MANUAL)
 
 
     def set_humidity(self, humidity):
@@ -927,9 +1023,14 @@ class _HTTPClientZone(ClimateEntity):
             _LOGGER.error("Invalid fan mode: {}".format(fan_mode))
             return
 
-        data = {"fan": self._fan_mode}
-
-        self._HTTPClient.api("/api/config/zones/zone/{}/fan/".format(self.zone_index), data)
+        # The fan setting is that of the manual activity, so it only takes
+        # effect while manual is held.  Unless it already is, manual is held
+        # with the set points of the current activity so just the fan changes.
+        self._HTTPClient.send_command(FanCommand(self.zone_id, self._fan_mode))
+        if self.hold_activity != ACTIVITY_MANUAL:
+            self._HTTPClient.send_command(SetpointCommand(self.zone_id, ACTIVITY_MANUAL, self.setpoint_heat, self.setpoint_cool))
+            self.set_hold_mode(activity=ACTIVITY_MANUAL)
+        self.schedule_update_ha_state()
 
     def set_hvac_mode(self, hvac_mode):
         """Set new target hvac mode."""
@@ -1029,7 +1130,10 @@ class _HTTPClientZone(ClimateEntity):
 
         until = kwargs.get("until")
         # Default: Next activity time
-        if until is None:
+        if until is None and mode == HOLD_MODE_UNTIL:
+            if self.activity_next_start is None:
+                _LOGGER.error("No until time given and no next activity in the schedule of zone {}".format(self.zone_id))
+                return
             until = self.activity_next_start.strftime("%H:%M")
 
         activity = kwargs.get("activity")
@@ -1050,13 +1154,14 @@ class _HTTPClientZone(ClimateEntity):
             self._HTTPClient._pushovernotimute(notimute)
 
         if mode == HOLD_MODE_OFF:
-            data = {"hold": HOLD_OFF, "holdActivity": "", "otmr": ""}
+            command = HoldCommand(self.zone_id, False)
         elif mode == HOLD_MODE_INDEFINITE:
-            data = {"hold": HOLD_ON, "holdActivity": activity, "otmr": "", "temp": temp}
+            command = HoldCommand(self.zone_id, True, activity, "", temp)
         elif mode == HOLD_MODE_UNTIL:
-            data = {"hold": HOLD_ON, "holdActivity": activity, "otmr": until, "temp": temp}
+            command = HoldCommand(self.zone_id, True, activity, until, temp)
         else:
             _LOGGER.error("Invalid hold mode: {}".format(mode))
             return
 
-        self._HTTPClient.api("/api/config/zones/zone/{}/".format(self.zone_index), data)
+        self._HTTPClient.send_command(command)
+        self.schedule_update_ha_state()
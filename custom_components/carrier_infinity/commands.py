@@ -0,0 +1,54 @@
+#
+# Commands that change the thermostat's configuration.
+#
+# Home Assistant creates these and passes them to urlsystems.submitCommand(),
+# which merges them into the pending changes of their zone (see
+# pendingchanges.py) to send the next time the thermostat fetches its
+# configuration.  The /api URL handlers build the same commands
+# from their POST data.
+#
+
+# Hold an activity until a time, indefinitely, or go back to the schedule.
+class HoldCommand:
+
+    def __init__(self, zoneId, hold, activity=None, until=None, temp=None):
+        # Zone id as a string, such as "1"
+        self.zoneId = zoneId
+        # True to hold activity, False to return to the schedule
+        self.hold = hold
+        # Activity name (home, away, sleep, wake, manual) when holding
+        self.activity = activity
+        # When the hold ends as "HH:MM", or None/"" to hold indefinitely
+        self.until = until
+        # The heat set point for the manual activity, or None to leave as is
+        self.temp = temp
+
+    def __repr__(self):
+        return "HoldCommand(zone={}, hold={}, activity={}, until={}, temp={})".format(self.zoneId, self.hold, self.activity, self.until, self.temp)
+
+
+# Change the heat and cool set points of an activity.
+class SetpointCommand:
+
+    def __init__(self, zoneId, activity, heatTo=None, coolTo=None):
+        self.zoneId = zoneId
+        # Activity name (home, away, sleep, wake, manual)
+        self.activity = activity
+        # The new set points, or None to leave as is
+        self.heatTo = heatTo
+        self.coolTo = coolTo
+
+    def __repr__(self):
+        return "SetpointCommand(zone={}, activity={}, heatTo={}, coolTo={})".format(self.zoneId, self.activity, self.heatTo, self.coolTo)
+
+
+# Change the fan setting of the manual activity.
+class FanCommand:
+
+    def __init__(self, zoneId, fan):
+        self.zoneId = zoneId
+        # One of off (auto), low, med, high
+        self.fan = fan
+
+    def __repr__(self):
+        return "FanCommand(zone={}, fan={})".format(self.zoneId, self.fan)
@@ -0,0 +1,150 @@
+#
+# Builds the .../config response from the configuration the device uploaded
+# without copying it for every request.
+#
+# The response is the device's <config> with a few elements added at the
+# start and changes to some zone settings.  ConfigTemplate serializes it once,
+# with each element that can change (the timestamp and the patchable zone
+# settings) cut out into a slot.  A response is then the saved bytes with
+# each slot's element in between, either as the device sent it or with the
+# text from a patch.
+#
+# The configuration may have been parsed by lxml (see xmlbackend.py) but the
+# template is an ElementTree copy so the response is always serialized the
+# same way.
+#
+# Patches are a map of (zone id, path) to the new text, where path is one of
+# PATCHABLE_ZONE_PATHS relative to the <zone> element.  None as the text gives
+# an empty element.
+#
+
+import copy
+import uuid
+import xml.etree.ElementTree as ET
+
+from . import xmlbackend
+
+# A zone's activities, and the settings of each that patches can change
+ACTIVITY_IDS = ["home", "away", "sleep", "wake", "manual"]
+ACTIVITY_FIELDS = ["htsp", "clsp", "fan"]
+
+
+def activityPath(activityId, field):
+    return "activities/activity[@id='{}']/{}".format(activityId, field)
+
+
+# Zone settings that patches can change
+PATCHABLE_ZONE_PATHS = [
+    "hold",
+    "holdActivity",
+    "otmr"
+] + [activityPath(activityId, field) for activityId in ACTIVITY_IDS for field in ACTIVITY_FIELDS]
+
+TIMESTAMP_SLOT = "timestamp"
+
+
+# Serialize an element, without its tail, with different text
+def renderElement(element, text):
+    patched = copy.copy(element)
+    patched.text = text
+    patched.tail = None
+    return ET.tostring(patched, "utf-8")
+
+
+class ConfigTemplate:
+
+    def __init__(self, configRoot, serialNumber):
+
+        newConfigRoot = xmlbackend.copyTree(configRoot)
+
+        newConfigRoot.set("version", "1.42")
+        newConfigRoot.set("xmlns:atom", "http://www.w3.org/2005/Atom")
+
+        # Text marking where each slot is in the serialized XML, made unique
+        # so that it can't be in the configuration.
+        self.marker = "@@{}@@".format(uuid.uuid4().hex)
+
+        # List of (slot key, element, serialized element as the device sent
+        # it), indexed by slot number.  The element is cut out of its parent.
+        self.slots = []
+
+        newConfigRoot.insert(0, ET.Element("timestamp"))
+        self.cutSlot(newConfigRoot, 0, TIMESTAMP_SLOT)
+
+        atomLink = ET.Element("atom:link")
+        atomLink.set("rel", "http://www.api.ing.carrier.com/rels/system")
+        atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + serialNumber)
+        newConfigRoot.insert(0, atomLink)
+
+        atomLink = ET.Element("atom:link")
+        atomLink.set("rel", "self")
+        atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + serialNumber + "/config")
+        newConfigRoot.insert(0, atomLink)
+
+        # Only enabled zones are changed
+        for zone in newConfigRoot.findall("./zones/zone"):
+            if zone.findtext("./enabled") != "on":
+                continue
+
+            zoneId = zone.attrib.get('id')
+
+            for path in PATCHABLE_ZONE_PATHS:
+                if "/" in path:
+                    (parentPath, tag) = path.rsplit("/", 1)
+                    parents = zone.findall("./" + parentPath)
+                else:
+                    (parents, tag) = ([zone], path)
+
+                for parent in parents:
+                    for (index, child) in enumerate(parent):
+                        if child.tag == tag:
+                            self.cutSlot(parent, index, (zoneId, path))
+
+        parts = ET.tostring(newConfigRoot, "utf-8").split(self.marker.encode("utf-8"))
+
+        if len(parts) != 2 * len(self.slots) + 1:
+            raise ValueError("Configuration could not be split into slots")
+
+        # The bytes before, between and after the slots, and which slot goes
+        # after each of them.
+        self.chunks = parts[0::2]
+        self.slotOrder = [int(n) for n in parts[1::2]]
+
+    # Replace the element at parent[index] with a placeholder that
+    # serializes to just the slot number between markers.
+    def cutSlot(self, parent, index, key):
+
+        element = parent[index]
+
+        placeholder = ET.Element(None)
+        placeholder.text = "{}{}{}".format(self.marker, len(self.slots), self.marker)
+        placeholder.tail = element.tail
+        parent[index] = placeholder
+
+        element.tail = None
+        self.slots.append((key, element, ET.tostring(element, "utf-8")))
+
+    # Returns (parts, zone ids): the serialized configuration with the
+    # patches applied, as a list of bytes to send one after another, and the
+    # set of ids of the zones a patch was applied to.  Patches for zones
+    # without slots (disabled or unknown zones) are left out.
+    def render(self, patches, timestamp):
+
+        parts = []
+        patchedZoneIds = set()
+
+        for (chunk, slotNumber) in zip(self.chunks, self.slotOrder):
+            parts.append(chunk)
+
+            (key, element, original) = self.slots[slotNumber]
+            if key == TIMESTAMP_SLOT:
+                parts.append(renderElement(element, timestamp))
+            elif key in patches:
+                parts.append(renderElement(element, patches[key]))
+                patchedZoneIds.add(key[0])
+            else:
+                parts.append(original)
+
+        parts.append(self.chunks[-1])
+
+        return (parts, patchedZoneIds)
@@ -0,0 +1,130 @@
+#
+# Deferred closing of client connections.
+#
+# After a response body has been sent the thermostat expects the connection
+# to stay open for a while, so the servers hand the socket over to this
+# manager instead of closing it.  Sockets are kept in a min-heap ordered by
+# when they are due to be closed and a background thread reaps them.  There is
+# also a limit on how many can be open at once, after which the oldest is
+# closed early, and everything still open is closed on shutdown.
+#
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# How long to keep a connection open after sending a response body
+DEFAULT_CLOSE_DELAY = 60
+# Maximum number of deferred connections to keep open at once
+DEFAULT_MAX_OPEN = 32
+# How often the background thread looks for connections to close
+DEFAULT_REAP_INTERVAL = 5
+
+
+class DeferredCloseManager:
+
+    def __init__(self, closeDelay=DEFAULT_CLOSE_DELAY, maxOpen=DEFAULT_MAX_OPEN, reapInterval=DEFAULT_REAP_INTERVAL):
+        self.closeDelay = closeDelay
+        self.maxOpen = maxOpen
+        self.reapInterval = reapInterval
+
+        # Heap of (close time, sequence, name, close function).  The sequence
+        # number keeps entries with the same close time in insertion order.
+        self.heap = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+        self.closedCount = 0
+        self.evictedCount = 0
+
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def start(self):
+        if self.thread:
+            return
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.reapLoop, name="carrier_infinity_reaper", daemon=True)
+        self.thread.start()
+
+    # Stop the background thread and close every connection still open.
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.closeAll()
+        _LOGGER.info("Deferred close stats: {}".format(self.stats()))
+
+    def reapLoop(self):
+        while not self.stopEvent.wait(self.reapInterval):
+            self.reap()
+
+    # Add a socket file number, which will be closed with os.close().
+    def addFileno(self, fileno):
+        self.add(fileno, lambda: os.close(fileno))
+
+    # Add a connection to close later.  name is used for logging and closeFunc
+    # is called with no arguments to close it.
+    def add(self, name, closeFunc):
+        evicted = []
+
+        with self.lock:
+            heapq.heappush(self.heap, (time.monotonic() + self.closeDelay, next(self.sequence), name, closeFunc))
+
+            while len(self.heap) > self.maxOpen:
+                evicted.append(heapq.heappop(self.heap))
+
+            self.evictedCount += len(evicted)
+
+        for entry in evicted:
+            _LOGGER.debug("  Too many deferred connections, closing {} early".format(entry[2]))
+            self.closeEntry(entry)
+
+    # Close connections that are due.
+    def reap(self):
+        now = time.monotonic()
+        due = []
+
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap))
+
+        for entry in due:
+            _LOGGER.debug("  Closing deferred {}".format(entry[2]))
+            self.closeEntry(entry)
+
+        return len(due)
+
+    def closeAll(self):
+        with self.lock:
+            entries = self.heap
+            self.heap = []
+
+        for entry in entries:
+            self.closeEntry(entry)
+
+    # RuntimeError is from an asyncio connection whose event loop has closed
+    def closeEntry(self, entry):
+        try:
+            entry[3]()
+        except (OSError, RuntimeError) as exception:
+            _LOGGER.debug("  Close of {} failed - {}".format(entry[2], exception))
+        with self.lock:
+            self.closedCount += 1
+
+    # Counts to help spot file descriptor leaks
+    def stats(self):
+        return {
+            "open": len(self.heap),
+            "closed": self.closedCount,
+            "evicted": self.evictedCount
+        }
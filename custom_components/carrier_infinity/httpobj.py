@@ -4,27 +4,50 @@
 #
 
 from datetime import datetime
-import re
 from urllib.parse import parse_qs
 import logging
 
+from .router import Router
+from .xmldocument import XmlDocument
+
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 # This is populated by the URL handlers to define the mapping between a path
-# and the function that should be called.  This is an ordered list because
-# we may have more specific regular expressions that match before more generic
-# ones (like in /systems paths).
-configuredURLs = []
+# and the function that should be called.  Routes are matched in the order
+# they are added because we may have more specific regular expressions that
+# match before more generic ones (like in /systems paths).  See router.py.
+urlRouter = Router()
+
+# Based on experimentation it appears that if a response header crosses a TCP
+# packet boundary the thermostat isn't able to parse the response and gives up.
+# Response headers are therefore sent one per TCP packet (see ResponseWriter),
+# optionally waiting this many seconds between them.  With TCP_NODELAY set no
+# wait is required for the OS to send each header in its own packet.
+DEFAULT_HEADER_PACING = 0
+
+# A response body as a list of the bytes to send one after another, see
+# HttpResponse.body.
+def bodyBuffers(body):
+    if isinstance(body, list):
+        return body
+    return [body]
+
+# The length in bytes of a response body, for its Content-Length header.
+def bodyLength(body):
+    if isinstance(body, list):
+        return sum(map(len, body))
+    return len(body)
 
 # Called by URL handler modules to add URL handlers.
 # Arguments:
 #  reStr: A regular expression to match URLs
 #  func:  A function that accepts an HttpRequest object as input
 #         and returns an HttpReponse object.
+#  headerPacing: Seconds to wait between response headers for this URL,
+#         or None for DEFAULT_HEADER_PACING.
 #
-def addUrl(reStr, func):
-    global configuredURLs
-    configuredURLs.append((re.compile(reStr), func))
+def addUrl(reStr, func, headerPacing=None):
+    urlRouter.addRoute(reStr, func, headerPacing)
 
 #
 # Filled in by the HTTP server and provided to URL handlers to contain the
@@ -70,6 +93,8 @@ class HttpRequest:
         # If the Content-Type is "application/x-www-form-urlencoded", this
         # will contain a parsed map of data.  See: urllib.parse.parse_qs
         self.bodyDict = None
+        # The XmlDocument from xmlDocument()
+        self.document = None
 
 
     def parseHeaders(self):
@@ -89,6 +114,14 @@ class HttpRequest:
                     raise Exception("Duplicate Host header")
                 self.host = v
 
+    # The XML in the "data" field of a /systems POST, parsed the first time
+    # it is asked for so that URL handlers and Home Assistant share one parse.
+    # Returns None if the request doesn't have any.
+    def xmlDocument(self):
+        if self.document is None and self.bodyDict and "data" in self.bodyDict:
+            self.document = XmlDocument(self.bodyDict["data"][0])
+        return self.document
+
     def parseBody(self):
 
         contentType = self.contentType.lower()
@@ -112,9 +145,16 @@ class HttpResponse:
         self.message = message
         # An ordered list of (name, value) for each response header
         self.headers = []
-        # If the response should contain a body then this should be a string
-        # with the body content.
+        # If the response should contain a body then this should be the
+        # encoded body as bytes, or a list of bytes that are sent one after
+        # another (in one writev() call) so they don't need to be joined.
         self.body = None
+        # Seconds to wait between sending each header, filled in from the
+        # URL handler's configuration if left as None.
+        self.headerPacing = None
+        # The status line and headers already encoded, one per line, which
+        # are sent instead of headers if set.  See responsecache.py.
+        self.headLines = None
 
     # These are some common headers added by the real HTTP server.  In some cases
     # there is hard-coded data determined by trial and error.
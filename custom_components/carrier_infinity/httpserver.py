@@ -3,24 +3,30 @@
 # is callable as a main module.
 #
 
+import asyncio
 import datetime
 import logging
-import os
 from pathlib import Path
+import queue
+import selectors
+import socket
 import socketserver
 import sys
+import threading
 import time
 import traceback
 import re
 import json
-import xmltodict
 
 if __name__ == '__main__' and __package__ is None:
     DIR = Path(__file__).resolve().parent
     sys.path.insert(0, str(DIR.parent))
     __package__ = DIR.name
 
-from .httpobj import HttpRequest, HttpResponse, configuredURLs
+from .httpobj import HttpRequest, HttpResponse, bodyBuffers, bodyLength, urlRouter
+from .responsewriter import ResponseWriter, writeBody
+from .deferredclose import DEFAULT_MAX_OPEN, DeferredCloseManager
+from .requestparser import RECV_SIZE, HttpParseError, HttpRequestParser
 from .urlalive import *
 from .urlsystems import *
 from .urlweather import *
@@ -33,6 +39,85 @@ _LOGGER: logging.Logger = logging.getLogger(__package__)
 XMLFile = None
 res = {}
 httpserver_running = False
+
+# Prefix of the paths the thermostat uses to upload its state.  Responses to
+# these get an extra delay and their bodies are forwarded to Home Assistant.
+SYSTEMS_PATH_PREFIX = "/systems/"
+
+def isSystemsPath(path):
+    return path[:len(SYSTEMS_PATH_PREFIX)] == SYSTEMS_PATH_PREFIX
+
+# Shared by the servers to find the URL handler for a parsed request and call
+# it.  Returns a tuple of (HttpResponse, handled) where handled is False if
+# nothing matched (404) or the handler threw an exception (503).  Those error
+# responses are sent immediately without any of the /systems special handling.
+def dispatchRequest(httpRequestObj):
+
+    routeMatch = urlRouter.match(httpRequestObj.path)
+
+    if routeMatch:
+        httpRequestObj.pathGroup = routeMatch.pathGroup
+        httpRequestObj.pathDict = routeMatch.pathDict
+        try:
+            httpResponseObj = routeMatch.route.func(httpRequestObj)
+        except Exception as exception:
+            #traceback.print_exc()
+            _LOGGER.error("Something really wrong happend! - %s", exception)
+            return (HttpResponse.errorResponse(503, "Exception thrown"), False)
+        if httpResponseObj:
+            if httpResponseObj.headerPacing is None:
+                httpResponseObj.headerPacing = routeMatch.route.headerPacing
+            return (httpResponseObj, True)
+
+    return (HttpResponse.errorResponse(404, "Not Found"), False)
+
+# Hand the XML uploaded with a /systems POST over to Home Assistant.  This is
+# called from the server's thread, so the update is scheduled on Home
+# Assistant's event loop in a thread-safe way that wakes the loop straight
+# away.
+def notifyHTTPClient(_HTTPClient, httpRequestObj):
+
+    if not _HTTPClient or httpRequestObj.method != "POST":
+        return
+
+    # Usually already parsed by the URL handler
+    document = httpRequestObj.xmlDocument()
+    if document:
+        serialNumber = httpRequestObj.pathDict["serialNumber"]
+        asyncio.run_coroutine_threadsafe(
+            _HTTPClient._update_zones(httpRequestObj.method, httpRequestObj.path, serialNumber, document),
+            _HTTPClient.hass.loop)
+
+# Read the files served as-is, such as the manifest, when a server starts.
+# If that fails they are tried again when requested.
+def loadStaticFiles(_HTTPClient):
+    try:
+        if _HTTPClient:
+            loadXMLFiles(_HTTPClient.hass)
+        else:
+            loadXMLFiles(None)
+    except OSError as exception:
+        _LOGGER.error("Unable to load manifest - {}".format(exception))
+
+# A basic access log
+def logAccess(clientAddress, httpRequestObj, httpResponseObj):
+
+    logBodyStr = "None"
+
+    if httpResponseObj.body:
+        length = bodyLength(httpResponseObj.body)
+        if length < 50:
+            logBodyStr = b"".join(bodyBuffers(httpResponseObj.body)).decode("utf-8", "replace")
+        else:
+            logBodyStr = str(length) + " bytes"
+
+    if httpResponseObj.code == 404:
+        _LOGGER.info("Request from {}:{} {} {} {} {}".format(clientAddress[0], clientAddress[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
+    elif httpResponseObj.code == 503:
+        _LOGGER.info("Request from {}:{} {} {} {} {}".format(clientAddress[0], clientAddress[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
+    else:
+        _LOGGER.debug("Request from {}:{} {} {} {} {}".format(clientAddress[0], clientAddress[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
+
 class MyTCPHandler(socketserver.StreamRequestHandler):
 
         #def setup(self):
@@ -42,214 +127,227 @@ class MyTCPHandler(socketserver.StreamRequestHandler):
         #def __init__(self, hass):
         #    self.hass = hass
 
-        # Based on experimentation it appears that if a response header crosses
-        # a TCP packet boundary the thermostat isn't able to parse the response
-        # and gives up.  This method allows us to get around that limitation
-        # by trying to send response headers at a slow enough rate that our
-        # OS will PUSH each header as its own TCP packet.
-        def writeLine(self, line):
-            line = line + "\r\n"
-            self.wfile.write(line.encode("utf-8"))
-            self.wfile.flush()
-            time.sleep(0.01)
+        def setup(self):
+            super().setup()
+            self.responseWriter = ResponseWriter(self.connection)
 
         # Convenience method to send error responses.
         def errorResponse(self, errCode, errMessage):
             _LOGGER.warning("  Respond {}".format(errCode))
-            self.writeLine("{} {} {}".format(HttpRequest.VERSION_1_1, errCode, errMessage))
-            self.writeLine("Content-Length: 0")
-            self.writeLine("Connection: close")
-            self.writeLine("")
-
+            httpResponseObj = HttpResponse.errorResponse(errCode, errMessage)
+            httpResponseObj.addContentLengthHeader(0)
+            httpResponseObj.headers.append(("Connection", "close"))
+            self.responseWriter.writeHead(httpResponseObj)
+
+        # Read and parse a request from the connection.  Returns None if there
+        # is no request to respond to, such as when the client closed the
+        # connection, took too long or sent a bad request (in which case an
+        # error response has already been sent).
         def parseHttpRequest(self):
 
-            first_line = self.rfile.readline().decode("utf-8")
-            (http_method, http_path, http_version) = first_line.strip().split(" ")
-
-            if not http_version == HttpRequest.VERSION_1_1:
-                self.sendResponse(HttpRequest(http_version, http_method, http_path, ""), HttpResponse.errorResponse(400, "Bad Request"))
-                return None
-
-            http_query_string = None
-            if '?' in http_path:
-                (http_path, http_query_string) = http_path.split("?", 1)
+            parser = HttpRequestParser()
 
-            httpRequestObj = HttpRequest(http_version, http_method, http_path, http_query_string)
-
-            next_line = self.rfile.readline().decode("utf-8")
-            while not next_line == "\r\n":
-
-                (k, v) = next_line.split(":", 1)
-
-                # Remove space after : and \r\n at the end
-                v = v[1:]
-                v = v[:-2]
-
-                httpRequestObj.headers.append((k, v))
-
-                next_line = self.rfile.readline().decode("utf-8")
-
-            # Saw \r\n line, read body
+            # Wait for the socket to be readable rather than blocking in recv()
+            # so that the deadlines can be enforced.  Once the headers are in,
+            # the body is read straight into the parser's body buffer.
+            self.connection.setblocking(False)
 
             try:
-                httpRequestObj.parseHeaders()
-            except:
-                traceback.print_exc()
-                self.sendResponse(httpRequestObj, HttpResponse.errorResponse(400, "Bad Request"))
-                return None
-
-            if http_method == HttpRequest.METHOD_POST:
-
-                if not httpRequestObj.contentLength or not httpRequestObj.contentType:
-                    _LOGGER.warning("Request missing content length or type")
-                    return httpRequestObj
-
-                # We use a non-blocking socket and set a timeout to try and limit
-                # the chance of thermostat from locking up our server.  Ideally
-                # we should have done the same when reading the headers.
-                self.connection.setblocking(0)
-                numLeft = httpRequestObj.contentLength
-                timeLeft = 15 * 10
-
-                httpRequestObj.body = ""
-
-                while numLeft > 0:
-                    bytesRead = self.rfile.read1(numLeft)
-
-                    if not bytesRead:
-                        if timeLeft == 0:
-                            _LOGGER.warning("  Timeout witing for body, need {} more bytes".format(numLeft))
-                            self.sendResponse(httpRequestObj, HttpResponse.errorResponse(400, "Bad Request"))
+                with selectors.DefaultSelector() as selector:
+                    selector.register(self.connection, selectors.EVENT_READ)
+
+                    while True:
+                        timeLeft = parser.timeLeft()
+                        if timeLeft <= 0 or not selector.select(timeLeft):
+                            raise socket.timeout()
+
+                        try:
+                            if parser.state == HttpRequestParser.STATE_BODY:
+                                n = self.connection.recv_into(parser.bodyBuffer())
+                                done = n and parser.bodyReceived(n)
+                            else:
+                                data = self.connection.recv(RECV_SIZE)
+                                n = len(data)
+                                done = n and parser.feed(data)
+                        except BlockingIOError:
+                            continue
+
+                        if not n:
+                            if parser.request:
+                                _LOGGER.warning("  Connection closed before request was complete")
                             return None
 
-                        time.sleep(0.1)
-                        timeLeft = timeLeft - 1
-                        continue
+                        if done:
+                            break
 
-                    httpRequestObj.body = httpRequestObj.body + bytesRead.decode("utf-8")
-                    numLeft = numLeft - len(bytesRead)
+            except socket.timeout:
+                if parser.state == HttpRequestParser.STATE_HEADERS:
+                    _LOGGER.warning("  Timeout waiting for request headers from {}".format(self.client_address[0]))
+                    return None
+                _LOGGER.warning("  Timeout witing for body, need {} more bytes".format(parser.bodyRemaining()))
+                self.connection.setblocking(True)
+                self.sendResponse(parser.request, HttpResponse.errorResponse(400, "Bad Request"))
+                return None
 
-                if not bytesRead and numLeft > 0:
-                    _LOGGER.warning("  Need {} more bytes from body".format(numLeft))
-                    self.sendResponse(httpRequestObj, HttpResponse.errorResponse(400, "Bad Request"))
+            except HttpParseError as exception:
+                _LOGGER.warning("  Bad request from {} - {}".format(self.client_address[0], exception))
+                if not exception.request:
                     return None
+                self.connection.setblocking(True)
+                self.sendResponse(exception.request, HttpResponse.errorResponse(exception.code, exception.message))
+                return None
 
-                httpRequestObj.parseBody()
+            self.connection.setblocking(True)
 
-            return httpRequestObj
+            return parser.request
 
 
         def sendResponse(self, httpRequestObj, httpResponseObj):
 
-            logBodyStr = "None"
-
-            if httpResponseObj.body:
-                if len(httpResponseObj.body) < 50:
-                    logBodyStr = httpResponseObj.body
-                else:
-                    logBodyStr = str(len(httpResponseObj.body)) + " bytes"
-
-            # A basic access log
-            if httpResponseObj.code == 404:
-                _LOGGER.info("Request from {}:{} {} {} {} {}".format(self.client_address[0], self.client_address[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
-            elif httpResponseObj.code == 503:
-                _LOGGER.info("Request from {}:{} {} {} {} {}".format(self.client_address[0], self.client_address[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
-            else:
-                _LOGGER.debug("Request from {}:{} {} {} {} {}".format(self.client_address[0], self.client_address[1], httpRequestObj.method, httpRequestObj.path, httpResponseObj.code, logBodyStr))
-
-            self.writeLine("{} {} {}".format(HttpRequest.VERSION_1_1, httpResponseObj.code, httpResponseObj.message))
+            logAccess(self.client_address, httpRequestObj, httpResponseObj)
 
-            connectionClose = False
-            for (name, value) in httpResponseObj.headers:
-                self.writeLine("{}: {}".format(name, value))
-                if name == "Connection":
-                    connectionClose = True
-            self.writeLine("")
+            self.responseWriter.writeHead(httpResponseObj)
 
             if httpResponseObj.body:
                 # The thermostat can also reject a response if the body crosses
                 # a TCP packet in certain places.  Using the built-in self.wfile
                 # object seems to be problematic.  So here we use the underlying
                 # socket and try to blast the body out using the low-level
-                # os.write() call.
+                # os.writev() call.
                 self.connection.setblocking(1)
                 fileno = self.connection.detach()
-                try:
-                    dataToSend = httpResponseObj.body.encode("utf-8")
-                except:
-                    dataToSend = httpResponseObj.body
-                os.write(fileno, dataToSend)
+                writeBody(fileno, httpResponseObj.body)
 
                 _LOGGER.debug("  Deferring close of {}".format(fileno))
 
-                self.server.deferredCloseSockets.append({
-                    "fileno": fileno,
-                    "time": datetime.now()
-                })
+                self.server.deferredCloseSockets.addFileno(fileno)
 
 
         def handle(self):
             httpRequestObj = self.parseHttpRequest()
 
-            if not responseManifest:
-                if self.server._HTTPClient:
-                    loadXMLFiles(self.server._HTTPClient.hass)
-                else:
-                    loadXMLFiles(None)
-
             if not httpRequestObj:
                 return
 
-            httpResponseObj = None
-
-            for (pathRe, actionFunc) in configuredURLs:
-                m = pathRe.match(httpRequestObj.path)
-                if m:
-                    httpRequestObj.pathGroup = m.groups()
-                    httpRequestObj.pathDict = m.groupdict()
-                    try:
-                        path = httpRequestObj.path
-                        httpResponseObj = actionFunc(httpRequestObj)
-                    except Exception as exception:
-                        #traceback.print_exc()
-                        _LOGGER.error("Something really wrong happend! - %s", exception)
-                        self.sendResponse(httpRequestObj, HttpResponse.errorResponse(503, "Exception thrown"))
-                        return
-                    break
-
-            if not httpResponseObj:
-                self.sendResponse(httpRequestObj, HttpResponse.errorResponse(404, "Not Found"))
+            (httpResponseObj, handled) = dispatchRequest(httpRequestObj)
+
+            if not handled:
+                self.sendResponse(httpRequestObj, httpResponseObj)
                 return
 
             # Simulate delay from Internet 100ms, seems to help the theromostat
-            # accept the response.
-            string = "/systems/"
-            if path[:len(string)] == string:
+            # accept the response.  Home Assistant doesn't have to wait for it.
+            if isSystemsPath(httpRequestObj.path):
+                notifyHTTPClient(self.server._HTTPClient, httpRequestObj)
                 time.sleep(0.1)
                 self.sendResponse(httpRequestObj, httpResponseObj)
-                if httpRequestObj.method == "POST" and "data" in httpRequestObj.bodyDict:
-                    serialNumber = httpRequestObj.pathDict["serialNumber"]
-                    xmlStringData = httpRequestObj.bodyDict["data"][0]
-                    DICT = xmltodict.parse(xmlStringData, dict_constructor=dict)
-                    if self.server._HTTPClient:
-                        self.server._HTTPClient.hass.async_create_task(self.server._HTTPClient._update_zones(httpRequestObj.method, httpRequestObj.path, serialNumber, DICT))
             else:
                 self.sendResponse(httpRequestObj, httpResponseObj)
 
-            for obj in self.server.deferredCloseSockets:
-                elapsed = datetime.now() - obj["time"]
-                if elapsed.total_seconds() > 60:
-                    _LOGGER.debug("  Closing deferred file number {}".format(obj["fileno"]))
-                    os.close(obj["fileno"])
-                    self.server.deferredCloseSockets.remove(obj)
-
 
 class MyTCPServer(socketserver.TCPServer):
 
-    def __init__(self, host_port_tuple, streamhandler, _HTTPClient):
+    def __init__(self, host_port_tuple, streamhandler, _HTTPClient, maxDeferredClose=DEFAULT_MAX_OPEN):
         super().__init__(host_port_tuple, streamhandler)
         self._HTTPClient = _HTTPClient
-        self.deferredCloseSockets = []
+        loadStaticFiles(_HTTPClient)
+        self.deferredCloseSockets = DeferredCloseManager(maxOpen=maxDeferredClose)
+        self.deferredCloseSockets.start()
+
+    def server_close(self):
+        super().server_close()
+        self.deferredCloseSockets.stop()
+
+
+# Default size of the worker pool and how many accepted connections can wait
+# for a worker in MyThreadPoolTCPServer.
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POOL_QUEUE_DEPTH = 16
+
+# A version of MyTCPServer that handles connections concurrently on a fixed
+# number of worker threads, so that a slow thermostat request does not hold
+# up others such as the /api calls from Home Assistant.  Accepted connections
+# wait in a bounded queue for a free worker and are dropped if it is full.
+class MyThreadPoolTCPServer(MyTCPServer):
+
+    def __init__(self, host_port_tuple, streamhandler, _HTTPClient, maxDeferredClose=DEFAULT_MAX_OPEN, poolSize=DEFAULT_POOL_SIZE, queueDepth=DEFAULT_POOL_QUEUE_DEPTH):
+        # Also used as the listen() backlog
+        self.request_queue_size = queueDepth
+        super().__init__(host_port_tuple, streamhandler, _HTTPClient, maxDeferredClose)
+
+        self.poolSize = poolSize
+        self.requestQueue = queue.Queue(maxsize=queueDepth)
+        self.statsLock = threading.Lock()
+        self.busyWorkers = 0
+        self.rejectedCount = 0
+
+        self.workers = []
+        for i in range(poolSize):
+            worker = threading.Thread(target=self.workerLoop, name="carrier_infinity_worker_{}".format(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def process_request(self, request, client_address):
+        try:
+            self.requestQueue.put_nowait((request, client_address))
+        except queue.Full:
+            _LOGGER.warning("All workers busy, dropping connection from {}".format(client_address[0]))
+            with self.statsLock:
+                self.rejectedCount += 1
+            self.shutdown_request(request)
+
+    def workerLoop(self):
+        while True:
+            item = self.requestQueue.get()
+            if item is None:
+                return
+
+            (request, client_address) = item
+
+            with self.statsLock:
+                self.busyWorkers += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self.statsLock:
+                    self.busyWorkers -= 1
+
+    # Connections still waiting for a worker are closed, then each worker is
+    # told to stop once it has finished its current connection.
+    def server_close(self):
+        while True:
+            try:
+                item = self.requestQueue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+
+        # Nothing is accepted any more, so the queue no longer needs a limit
+        # and there is room for every worker's None
+        with self.requestQueue.mutex:
+            self.requestQueue.maxsize = 0
+        for worker in self.workers:
+            self.requestQueue.put_nowait(None)
+        for worker in self.workers:
+            worker.join()
+        super().server_close()
+
+    # Queue depth and how busy the workers are
+    def poolStats(self):
+        with self.statsLock:
+            busy = self.busyWorkers
+            rejected = self.rejectedCount
+        return {
+            "workers": self.poolSize,
+            "busy": busy,
+            "saturation": busy / self.poolSize,
+            "queued": self.requestQueue.qsize(),
+            "rejected": rejected
+        }
 
 
 if __name__ == '__main__':
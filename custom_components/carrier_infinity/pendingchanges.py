@@ -0,0 +1,115 @@
+#
+# Changes waiting to be sent to the thermostat, kept per zone.
+#
+# Each command from commands.py is merged into its zone's change set, a map of
+# zone setting (one of configoverlay.PATCHABLE_ZONE_PATHS) to its new text, so
+# a later edit only replaces the settings it changes.  Holding an activity and
+# then changing the fan sends both, and a second hold replaces the first.  The
+# change sets of every zone go out together the next time the thermostat
+# fetches its configuration, as the patches for ConfigTemplate.render().
+#
+# Each zone's set has a version that goes up with every edit.  patches() gives
+# the versions it sent, and acknowledge() clears only the zones that were sent
+# and haven't been edited since, so nothing submitted in between is lost.
+# The response is built without the lock, so edits can come in meanwhile.
+#
+# Only enabled zones can be changed by the response.  Changes for any other
+# zone, or that the configuration has nothing to patch for, are dropped with
+# discard() rather than kept pending for ever.  Like acknowledge(), it takes
+# the versions and keeps zones edited since.
+#
+# Callers hold urlsystems.stateLock.
+#
+
+import logging
+
+from .commands import FanCommand, HoldCommand, SetpointCommand
+from .configoverlay import ACTIVITY_IDS, activityPath
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class ZoneChangeSet:
+
+    __slots__ = ("settings", "version")
+
+    def __init__(self):
+        # Map of zone setting path to its new text, None for empty
+        self.settings = {}
+        self.version = 0
+
+
+class PendingChanges:
+
+    def __init__(self):
+        # Map of zone id to ZoneChangeSet, for zones with changes
+        self.zones = {}
+
+    def hasChanges(self):
+        return bool(self.zones)
+
+    # Merge a command into its zone's changes
+    def submit(self, command):
+
+        if isinstance(command, HoldCommand):
+            # A hold without an activity goes back to the schedule
+            if command.hold and command.activity:
+                settings = {"hold": "on", "holdActivity": command.activity, "otmr": command.until}
+                if command.activity == "manual" and command.temp is not None:
+                    settings[activityPath("manual", "htsp")] = str(command.temp)
+            else:
+                settings = {"hold": "off", "holdActivity": "", "otmr": ""}
+        elif isinstance(command, SetpointCommand):
+            if command.activity not in ACTIVITY_IDS:
+                raise ValueError("Unknown activity: {}".format(command.activity))
+            settings = {}
+            if command.heatTo is not None:
+                settings[activityPath(command.activity, "htsp")] = str(command.heatTo)
+            if command.coolTo is not None:
+                settings[activityPath(command.activity, "clsp")] = str(command.coolTo)
+        elif isinstance(command, FanCommand):
+            settings = {activityPath("manual", "fan"): command.fan}
+        else:
+            raise TypeError("Unknown command: {}".format(command))
+
+        zone = self.zones.get(command.zoneId)
+        if zone is None:
+            zone = self.zones[command.zoneId] = ZoneChangeSet()
+        zone.settings.update(settings)
+        zone.version += 1
+
+    # Returns (patches, versions): the changes of every zone as patches for
+    # ConfigTemplate.render(), and a map of zone id to the version sent to
+    # pass to acknowledge() once they have been sent.
+    def patches(self):
+
+        patches = {}
+        versions = {}
+
+        for (zoneId, zone) in self.zones.items():
+            for (path, text) in zone.settings.items():
+                patches[(zoneId, path)] = text
+            versions[zoneId] = zone.version
+
+        return (patches, versions)
+
+    # Clear the zones sent by patches() that haven't changed since
+    def acknowledge(self, versions):
+        for (zoneId, version) in versions.items():
+            zone = self.zones.get(zoneId)
+            if zone is not None and zone.version == version:
+                _LOGGER.debug("  Sent zone {} changes {}".format(zoneId, zone.settings))
+                del self.zones[zoneId]
+
+    # The version of each zone's changes, for discard()
+    def versions(self):
+        return {zoneId: zone.version for (zoneId, zone) in self.zones.items()}
+
+    # Drop the changes of zones that can't be sent and haven't changed since
+    # versions were taken, reason saying why
+    def discard(self, versions, reason):
+        for (zoneId, version) in versions.items():
+            zone = self.zones.get(zoneId)
+            if zone is not None and zone.version == version:
+                _LOGGER.warning("Dropped changes {} for zone {}, {}".format(zone.settings, zoneId, reason))
+                del self.zones[zoneId]
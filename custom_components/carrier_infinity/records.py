@@ -0,0 +1,162 @@
+#
+# Records of zone status and configuration read from the thermostat's XML.
+#
+# Each record type lists its fields as a schema of the child element each
+# comes from.  The schema is compiled once, when the class is defined, into a
+# map of tag to field so fromElement() reads a zone (or activity or period)
+# in a single pass over its children.  Records use __slots__ since a new set
+# is made for every status poll and configuration upload.
+#
+# An element that is missing gives the field's default instead of failing the
+# whole request, and is logged.
+#
+
+import json
+import logging
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Marks a field whose element hasn't been found
+MISSING = object()
+
+
+def isOn(text):
+    return text == "on"
+
+
+class Field:
+
+    def __init__(self, name, tag, convert=None, default=None, inJson=True):
+        # Attribute name, also used as the key in toDict()
+        self.name = name
+        # Tag of the child element the value comes from
+        self.tag = tag
+        # Called with the element's text, if the element is present
+        self.convert = convert
+        # Value when the element is missing
+        self.default = default
+        # Whether the field is part of toDict() and toJson()
+        self.inJson = inJson
+
+
+def fieldNames(fields):
+    return tuple(field.name for field in fields)
+
+
+class Record:
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.tagIndex = {field.tag: i for (i, field) in enumerate(cls.FIELDS)}
+        cls.jsonNames = tuple(field.name for field in cls.FIELDS if field.inJson)
+
+    @classmethod
+    def fromElement(cls, element):
+
+        fields = cls.FIELDS
+        tagIndex = cls.tagIndex
+        values = [MISSING] * len(fields)
+
+        # In reverse so the first of a repeated tag wins, as with find()
+        for child in reversed(element):
+            i = tagIndex.get(child.tag)
+            if i is not None:
+                values[i] = child.text
+
+        record = cls.__new__(cls)
+        missing = None
+
+        for (field, value) in zip(fields, values):
+            if value is MISSING:
+                value = field.default
+                if missing is None:
+                    missing = []
+                missing.append(field.tag)
+            elif field.convert:
+                value = field.convert(value)
+            setattr(record, field.name, value)
+
+        if missing:
+            _LOGGER.debug("  {} {} is missing {}".format(element.tag, element.attrib.get("id"), ", ".join(missing)))
+
+        return record
+
+    def toDict(self):
+        return {name: getattr(self, name) for name in self.jsonNames}
+
+    def toJson(self):
+        return json.dumps(self.toDict())
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(name, getattr(self, name)) for name in fieldNames(self.FIELDS)))
+
+
+# A zone from the .../status upload
+class ZoneStatus(Record):
+
+    FIELDS = (
+        Field("name", "name"),
+        Field("activity", "currentActivity"),
+        Field("temperature", "rt"),
+        Field("humidity", "rh"),
+        Field("heatTo", "htsp"),
+        Field("coolTo", "clsp"),
+        Field("fan", "fan"),
+        Field("hold", "hold"),
+        Field("until", "otmr"),
+        Field("zoneConditioning", "zoneconditioning"),
+        Field("enabled", "enabled", convert=isOn, default=False, inJson=False)
+    )
+    __slots__ = fieldNames(FIELDS)
+
+
+# An activity (home, away, sleep, wake, manual) of a zone's configuration
+class Activity(Record):
+
+    FIELDS = (
+        Field("heatTo", "htsp"),
+        Field("coolTo", "clsp"),
+        Field("fan", "fan")
+    )
+    __slots__ = fieldNames(FIELDS)
+
+
+# A period of a zone's schedule for one day
+class Period(Record):
+
+    FIELDS = (
+        Field("activity", "activity"),
+        Field("time", "time"),
+        Field("enabled", "enabled", convert=isOn, default=False)
+    )
+    __slots__ = fieldNames(FIELDS)
+
+
+# A zone from the /systems/<sn> configuration upload
+class ZoneConfig:
+
+    __slots__ = ("activities", "schedule", "weeklySchedule")
+
+    def __init__(self):
+        # Map of activity id to Activity
+        self.activities = {}
+        # Map of day id (see INFINITY_WEEKDAY_IDS) to a map of period id
+        # (int) to Period
+        self.schedule = {}
+        # schedule.WeeklySchedule compiled from schedule once it is read
+        self.weeklySchedule = None
+
+    def toDict(self):
+        return {
+            "activities": {activityId: activity.toDict() for (activityId, activity) in self.activities.items()},
+            "schedule": {dayId: {periodId: period.toDict() for (periodId, period) in periods.items()} for (dayId, periods) in self.schedule.items()}
+        }
+
+    # extra is added to the top level, such as the mode and units
+    def toJson(self, **extra):
+        obj = self.toDict()
+        obj.update(extra)
+        return json.dumps(obj)
@@ -0,0 +1,212 @@
+#
+# Incremental parser for HTTP requests.
+#
+# The servers read whatever bytes are available from the connection and feed
+# them to HttpRequestParser until it has a complete request.  The parser works
+# on the raw bytes, only decoding the request line and headers once the blank
+# line ending them has arrived, and the body once all of it has arrived.  It
+# fills in the same HttpRequest object that the URL handlers use.
+#
+# The body is read into a buffer allocated up front from the Content-Length.
+# Servers can read from the socket straight into it using bodyBuffer() and
+# bodyReceived(), or pass the bytes they read to feed().
+#
+# The number and size of headers and the size of the body are bounded, and
+# each request has deadlines for its headers and for the request as a whole,
+# so a half-open or very slow connection gets dropped instead of tying up the
+# server.
+#
+
+import logging
+import time
+
+from .httpobj import HttpRequest
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# How much to read from the connection at a time
+RECV_SIZE = 65536
+# Seconds the client has to send the request line and all headers
+HEADER_TIMEOUT = 5
+# Seconds the client has to send the whole request, including the body
+REQUEST_TIMEOUT = 15
+# Limits on the request line and headers
+MAX_HEADER_COUNT = 64
+MAX_HEADER_BYTES = 16384
+# Limit on the size of a POST body
+MAX_BODY_BYTES = 1048576
+
+HEADER_END = b"\r\n\r\n"
+
+
+class HttpParseError(Exception):
+
+    def __init__(self, code, message, request=None):
+        super().__init__("{} {}".format(code, message))
+        # The HTTP error to respond with
+        self.code = code
+        self.message = message
+        # The HttpRequest if the request line could be parsed, otherwise None
+        # in which case there is nothing sensible to respond to.
+        self.request = request
+
+
+class HttpRequestParser:
+
+    STATE_HEADERS = 0
+    STATE_BODY = 1
+    STATE_DONE = 2
+
+    def __init__(self, startTime=None):
+        if startTime is None:
+            startTime = time.monotonic()
+
+        self.headerDeadline = startTime + HEADER_TIMEOUT
+        self.requestDeadline = startTime + REQUEST_TIMEOUT
+
+        self.state = HttpRequestParser.STATE_HEADERS
+        # The request line and headers received so far
+        self.buffer = bytearray()
+        # Where to continue looking for the end of the headers
+        self.scanPos = 0
+        # The body, and how much of it has been received
+        self.body = None
+        self.bodyView = None
+        self.bodyLength = 0
+        # The HttpRequest being filled in
+        self.request = None
+
+    # The time.monotonic() value by which the next part of the request must
+    # have arrived.
+    def deadline(self):
+        if self.state == HttpRequestParser.STATE_HEADERS:
+            return min(self.headerDeadline, self.requestDeadline)
+        return self.requestDeadline
+
+    # Seconds left until deadline(), may be negative.
+    def timeLeft(self):
+        return self.deadline() - time.monotonic()
+
+    # Add bytes read from the connection.  Returns True once the request is
+    # complete, after which self.request is filled in.  Raises HttpParseError
+    # if the request is bad.
+    def feed(self, data):
+
+        if self.state == HttpRequestParser.STATE_DONE:
+            return True
+
+        if self.state == HttpRequestParser.STATE_BODY:
+            return self.feedBody(data)
+
+        self.buffer += data
+
+        end = self.buffer.find(HEADER_END, self.scanPos)
+
+        if end < 0:
+            if len(self.buffer) > MAX_HEADER_BYTES:
+                raise HttpParseError(431, "Request Header Fields Too Large", self.request)
+            # The end marker could be split across reads
+            self.scanPos = max(0, len(self.buffer) - len(HEADER_END) + 1)
+            return False
+
+        if end > MAX_HEADER_BYTES:
+            raise HttpParseError(431, "Request Header Fields Too Large", self.request)
+
+        self.parseHead(bytes(self.buffer[:end]))
+
+        if not self.expectBody():
+            if self.request.method == HttpRequest.METHOD_POST:
+                _LOGGER.warning("Request missing content length or type")
+            self.state = HttpRequestParser.STATE_DONE
+            return True
+
+        self.state = HttpRequestParser.STATE_BODY
+        self.body = bytearray(self.request.contentLength)
+        self.bodyView = memoryview(self.body)
+
+        # Anything after the headers is the start of the body
+        leftover = memoryview(self.buffer)[end + len(HEADER_END):]
+        self.buffer = None
+
+        return self.feedBody(leftover)
+
+    # Copy bytes that were read into the body
+    def feedBody(self, data):
+        n = min(len(data), self.request.contentLength - self.bodyLength)
+        self.bodyView[self.bodyLength:self.bodyLength + n] = data[:n]
+        return self.bodyReceived(n)
+
+    # Free space in the body for a socket's recv_into() to read into.
+    def bodyBuffer(self):
+        return self.bodyView[self.bodyLength:]
+
+    # Number of body bytes still to come
+    def bodyRemaining(self):
+        return self.request.contentLength - self.bodyLength
+
+    # Call after reading n bytes into bodyBuffer().  Returns True once the
+    # request is complete.
+    def bodyReceived(self, n):
+        self.bodyLength += n
+
+        if self.bodyLength < self.request.contentLength:
+            return False
+
+        self.bodyView = None
+        self.finishBody(self.body)
+        self.state = HttpRequestParser.STATE_DONE
+
+        return True
+
+    def parseHead(self, head):
+
+        lines = head.split(b"\r\n")
+
+        if len(lines) - 1 > MAX_HEADER_COUNT:
+            raise HttpParseError(431, "Request Header Fields Too Large")
+
+        try:
+            (http_method, http_path, http_version) = lines[0].decode("utf-8").split(" ")
+        except ValueError:
+            raise HttpParseError(400, "Bad Request")
+
+        if not http_version == HttpRequest.VERSION_1_1:
+            raise HttpParseError(400, "Bad Request", HttpRequest(http_version, http_method, http_path, ""))
+
+        http_query_string = None
+        if '?' in http_path:
+            (http_path, http_query_string) = http_path.split("?", 1)
+
+        self.request = HttpRequest(http_version, http_method, http_path, http_query_string)
+
+        for line in lines[1:]:
+            (k, sep, v) = line.partition(b":")
+            if not sep:
+                raise HttpParseError(400, "Bad Request", self.request)
+            try:
+                self.request.headers.append((k.decode("utf-8"), v.strip(b" \t").decode("utf-8")))
+            except UnicodeDecodeError:
+                raise HttpParseError(400, "Bad Request", self.request)
+
+        try:
+            self.request.parseHeaders()
+        except Exception:
+            raise HttpParseError(400, "Bad Request", self.request)
+
+        if self.request.contentLength is not None:
+            if self.request.contentLength < 0:
+                raise HttpParseError(400, "Bad Request", self.request)
+            if self.request.contentLength > MAX_BODY_BYTES:
+                raise HttpParseError(413, "Payload Too Large", self.request)
+
+    # Only POSTs with both a length and type have a body that we read.  The
+    # URL handlers deal with POSTs that are missing them.
+    def expectBody(self):
+        return self.request.method == HttpRequest.METHOD_POST and self.request.contentLength and self.request.contentType
+
+    def finishBody(self, bodyBytes):
+        try:
+            self.request.body = bodyBytes.decode("utf-8")
+            self.request.parseBody()
+        except Exception:
+            raise HttpParseError(400, "Bad Request", self.request)
@@ -0,0 +1,119 @@
+#
+# Cache of responses that are the same every time.
+#
+# /Alive, /time, /manifest and release notes replies only differ by their
+# Date header (and for /time the time in the body), so the first time one is
+# needed the URL handler builds it as normal and it is kept here with the
+# status line and headers already encoded.  Later requests get a copy with
+# just the Date header line, and if needed the body, replaced.
+#
+# clear() drops everything, such as when the manifest file is reloaded.
+#
+
+import threading
+import time
+
+from .httpobj import HttpResponse
+from .responsewriter import responseHeadLines
+
+# Most responses that are kept, the release notes are cached per URL
+MAX_CACHED_RESPONSES = 32
+
+# The encoded Date header only changes once a second, so the last one is
+# reused until then.  Holds (time in seconds, encoded header line).
+lastDateLine = (None, None)
+
+
+def dateHeaderLine():
+    global lastDateLine
+
+    now = int(time.time())
+
+    (lastTime, line) = lastDateLine
+    if lastTime != now:
+        # Same format as HttpResponse.addDateHeader()
+        line = "Date: {}\r\n".format(time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(now))).encode("utf-8")
+        lastDateLine = (now, line)
+
+    return line
+
+
+class CachedResponse:
+
+    def __init__(self, httpResponseObj):
+        self.code = httpResponseObj.code
+        self.message = httpResponseObj.message
+        self.headers = httpResponseObj.headers
+        self.headerPacing = httpResponseObj.headerPacing
+        self.headLines = responseHeadLines(httpResponseObj)
+
+        self.body = httpResponseObj.body
+
+        # Index of the Date header in headLines, after the status line
+        self.dateIndex = None
+        for (i, (name, value)) in enumerate(self.headers):
+            if name == "Date":
+                self.dateIndex = i + 1
+
+    # A new HttpResponse ready to send.  body replaces the cached body and
+    # must be the same length since Content-Length is not changed.
+    def makeResponse(self, body=None):
+
+        response = HttpResponse(self.code, self.message)
+        response.headers = self.headers
+        response.headerPacing = self.headerPacing
+        response.headLines = self.headLines
+
+        if self.dateIndex is not None:
+            response.headLines = list(self.headLines)
+            response.headLines[self.dateIndex] = dateHeaderLine()
+
+        if body is None:
+            response.body = self.body
+        else:
+            response.body = body
+
+        return response
+
+
+class ResponseCache:
+
+    def __init__(self, maxEntries=MAX_CACHED_RESPONSES):
+        self.maxEntries = maxEntries
+        self.entries = {}
+        self.lock = threading.Lock()
+        # Changed by clear() so that a response built from old data while
+        # clearing is not stored.
+        self.generation = 0
+
+    # Returns the CachedResponse for key, calling buildFunc() to get an
+    # HttpResponse to cache if there isn't one.
+    def get(self, key, buildFunc):
+
+        entry = self.entries.get(key)
+        if entry:
+            return entry
+
+        generation = self.generation
+        entry = CachedResponse(buildFunc())
+
+        with self.lock:
+            if generation != self.generation:
+                return entry
+            # Drop the oldest entry
+            if key not in self.entries and len(self.entries) >= self.maxEntries:
+                del self.entries[next(iter(self.entries))]
+            self.entries[key] = entry
+
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+responseCache = ResponseCache()
@@ -0,0 +1,91 @@
+#
+# Writes the status line and headers of an HttpResponse so that each line
+# goes out in its own TCP packet, which the thermostat requires.
+#
+# Rather than flushing and sleeping after every header, TCP_NODELAY is turned
+# on for the connection so that each send() is pushed by the OS immediately
+# as its own packet.  URL handlers that still need a gap between headers can
+# configure one with the headerPacing argument of addUrl().
+#
+# The body is written after the head in as few system calls as possible, with
+# a list body (see HttpResponse.body) gathered by writev() rather than joined.
+#
+
+import os
+import socket
+import time
+
+from .httpobj import DEFAULT_HEADER_PACING, HttpRequest, bodyBuffers
+
+# Most buffers that can be given to one writev() call on Linux
+IOV_MAX = 1024
+
+
+# Turn off Nagle's algorithm so small writes are sent right away instead of
+# being merged into one packet.
+def enableNoDelay(sock):
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError):
+        pass
+
+
+# The header pacing to use for a response, in seconds.
+def getHeaderPacing(httpResponseObj):
+    if httpResponseObj.headerPacing is None:
+        return DEFAULT_HEADER_PACING
+    return httpResponseObj.headerPacing
+
+
+# Each line of the response head, encoded and ready to be sent in its own
+# packet.  The last entry is the blank line ending the headers.
+def responseHeadLines(httpResponseObj):
+
+    if httpResponseObj.headLines is not None:
+        return httpResponseObj.headLines
+
+    lines = ["{} {} {}\r\n".format(HttpRequest.VERSION_1_1, httpResponseObj.code, httpResponseObj.message).encode("utf-8")]
+
+    for (name, value) in httpResponseObj.headers:
+        lines.append("{}: {}\r\n".format(name, value).encode("utf-8"))
+
+    lines.append(b"\r\n")
+
+    return lines
+
+
+# Write all of a response body to a blocking file descriptor.  This is one
+# writev() call unless the OS only takes part of it.
+def writeBody(fileno, body):
+
+    buffers = bodyBuffers(body)
+
+    while buffers:
+        written = os.writev(fileno, buffers[:IOV_MAX])
+
+        # Drop the buffers that were written, and the start of one that was
+        # only partly written
+        i = 0
+        while i < len(buffers) and written >= len(buffers[i]):
+            written -= len(buffers[i])
+            i += 1
+        buffers = buffers[i:]
+        if written:
+            buffers[0] = memoryview(buffers[0])[written:]
+
+
+class ResponseWriter:
+
+    def __init__(self, sock):
+        self.sock = sock
+        enableNoDelay(sock)
+
+    def writeLine(self, line, headerPacing=DEFAULT_HEADER_PACING):
+        self.sock.sendall(line)
+        if headerPacing:
+            time.sleep(headerPacing)
+
+    def writeHead(self, httpResponseObj):
+        headerPacing = getHeaderPacing(httpResponseObj)
+        for line in responseHeadLines(httpResponseObj):
+            self.writeLine(line, headerPacing)
@@ -0,0 +1,249 @@
+#
+# Maps request paths to URL handlers.
+#
+# URL handlers are registered with regular expressions, but nearly all of
+# them are of the form "/systems/(?P<serialNumber>.+)/status$": literal path
+# segments and named groups that cover whole segments.  Those are compiled
+# into a trie keyed on path segments so a request only looks at the routes
+# that share its leading segments.  Anything else (patterns without a
+# trailing $, which match as a prefix, or the absolute URL used for release
+# notes) falls back to being matched in order.
+#
+# A path with a newline in it is matched with the regular expressions of every
+# route in order, since "$" also matches before a newline at the end and "."
+# doesn't match a newline, which the trie doesn't follow.
+#
+# Matching gives the same result as trying each regular expression with
+# re.match() in registration order: the earliest registered route that
+# matches wins, and groups get the same values as the regular expression
+# would give them.
+#
+
+from functools import lru_cache
+import logging
+import re
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+LITERAL_SEGMENT_RE = re.compile(r"[A-Za-z0-9_\-]*")
+LITERAL_PREFIX_RE = re.compile(r"[A-Za-z0-9_\-/]+")
+GROUP_SEGMENT_RE = re.compile(r"\(\?P<(\w+)>(\.\+|\[\^/\]\+)\)")
+
+# A named group of ".+" can span several path segments, "[^/]+" just one.
+GROUP_ANY = ".+"
+GROUP_SEGMENT = "[^/]+"
+
+# The thermostat polls the same handful of paths over and over, so the results
+# for recently seen paths are cached.
+MATCH_CACHE_SIZE = 256
+
+
+class Route:
+
+    def __init__(self, index, reStr, func, headerPacing):
+        # Registration order, lower indexes take precedence
+        self.index = index
+        self.reStr = reStr
+        self.func = func
+        self.headerPacing = headerPacing
+        # Named groups in the order they appear in the pattern, for routes in
+        # the trie.
+        self.groupNames = []
+        # Used for routes that are not in the trie.  A pattern that is just a
+        # literal path is matched as a string prefix, like re.match() would.
+        self.literalPrefix = None
+        # Used for routes that are not in the trie, and for paths with a
+        # newline
+        self.regex = re.compile(reStr)
+
+
+class RouteMatch:
+
+    def __init__(self, route, pathGroup, pathDict):
+        self.route = route
+        # Same as the .groups() and .groupdict() of a regular expression match
+        self.pathGroup = pathGroup
+        self.pathDict = pathDict
+
+
+class TrieNode:
+
+    def __init__(self):
+        self.literals = {}
+        # Map of (group kind, group name) to child node
+        self.groups = {}
+        # Route whose pattern ends at this node
+        self.route = None
+        # Lowest route index anywhere under this node, used to stop searching
+        # once a better match has been found.
+        self.minIndex = None
+
+    def updateMinIndex(self, index):
+        if self.minIndex is None or index < self.minIndex:
+            self.minIndex = index
+
+    # Quick check of whether matching can continue at this node with the
+    # given segment next, or at the end of the path if segment is None.
+    def canContinue(self, segment):
+        if segment is None:
+            return self.route is not None
+        return bool(self.groups) or segment in self.literals
+
+
+# Split a regular expression into trie segments.  Returns None if the pattern
+# can't be represented in the trie.
+def compileSegments(reStr):
+
+    if not reStr.startswith("/") or not reStr.endswith("$"):
+        return None
+
+    segments = []
+
+    for part in reStr[1:-1].split("/"):
+        if LITERAL_SEGMENT_RE.fullmatch(part):
+            segments.append((None, part))
+            continue
+
+        m = GROUP_SEGMENT_RE.fullmatch(part)
+        if not m:
+            return None
+        segments.append((m.group(2), m.group(1)))
+
+    return segments
+
+
+class Router:
+
+    def __init__(self):
+        self.routes = []
+        self.root = TrieNode()
+        self.fallbackRoutes = []
+        self.patterns = {}
+        self.cachedMatch = lru_cache(maxsize=MATCH_CACHE_SIZE)(self.findMatch)
+
+    def addRoute(self, reStr, func, headerPacing=None):
+
+        route = Route(len(self.routes), reStr, func, headerPacing)
+
+        self.warnIfShadowed(route)
+        self.routes.append(route)
+        self.patterns.setdefault(reStr, route)
+
+        segments = compileSegments(reStr)
+
+        if segments is None:
+            if LITERAL_PREFIX_RE.fullmatch(reStr):
+                route.literalPrefix = reStr
+            self.fallbackRoutes.append(route)
+            self.cachedMatch.cache_clear()
+            return route
+
+        node = self.root
+        node.updateMinIndex(route.index)
+
+        for (kind, value) in segments:
+            if kind is None:
+                node = node.literals.setdefault(value, TrieNode())
+            else:
+                route.groupNames.append(value)
+                node = node.groups.setdefault((kind, value), TrieNode())
+            node.updateMinIndex(route.index)
+
+        if node.route is None:
+            node.route = route
+
+        self.cachedMatch.cache_clear()
+
+        return route
+
+    # Registering a route that an earlier one always matches first means the
+    # later handler can never be called.
+    def warnIfShadowed(self, route):
+
+        if route.reStr in self.patterns:
+            _LOGGER.warning("URL {} is already registered, {} will never be called".format(route.reStr, route.func.__name__))
+            return
+
+        for earlier in self.fallbackRoutes:
+            if not earlier.literalPrefix or not route.reStr.startswith(earlier.literalPrefix):
+                continue
+            # A quantifier could make the last character of the prefix optional
+            if route.reStr[len(earlier.literalPrefix):][:1] in ("?", "*", "{"):
+                continue
+            _LOGGER.warning("URL {} is shadowed by {}, {} will never be called".format(route.reStr, earlier.reStr, route.func.__name__))
+            return
+
+    # Returns a RouteMatch for the path, or None if no route matches.
+    def match(self, path):
+
+        found = self.cachedMatch(path)
+        if not found:
+            return None
+
+        (route, values, namedValues) = found
+        return RouteMatch(route, values, dict(namedValues))
+
+    # Returns (Route, group values, (name, value) pairs) for the path, or None.
+    def findMatch(self, path):
+
+        if "\n" in path:
+            return self.matchRegexes(path)
+
+        best = None
+
+        if path.startswith("/"):
+            best = self.matchNode(self.root, path[1:].split("/"), 0, (), None)
+
+        for route in self.fallbackRoutes:
+            if best and best[0].index < route.index:
+                break
+
+            if route.literalPrefix:
+                if path.startswith(route.literalPrefix):
+                    return (route, (), ())
+            else:
+                m = route.regex.match(path)
+                if m:
+                    return (route, m.groups(), tuple(m.groupdict().items()))
+
+        return best
+
+    # The same as findMatch(), trying each route's regular expression in turn
+    def matchRegexes(self, path):
+        for route in self.routes:
+            m = route.regex.match(path)
+            if m:
+                return (route, m.groups(), tuple(m.groupdict().items()))
+        return None
+
+    def matchNode(self, node, segments, pos, values, best):
+
+        if best and node.minIndex >= best[0].index:
+            return best
+
+        numSegments = len(segments)
+
+        if pos == numSegments:
+            if node.route and (not best or node.route.index < best[0].index):
+                best = (node.route, values, tuple(zip(node.route.groupNames, values)))
+            return best
+
+        child = node.literals.get(segments[pos])
+        if child:
+            best = self.matchNode(child, segments, pos + 1, values, best)
+
+        for ((kind, name), child) in node.groups.items():
+            if kind == GROUP_SEGMENT:
+                if segments[pos]:
+                    best = self.matchNode(child, segments, pos + 1, values + (segments[pos], ), best)
+                continue
+
+            # Like the regular expression, try the longest match first
+            for end in range(numSegments, pos, -1):
+                if not child.canContinue(segments[end] if end < numSegments else None):
+                    continue
+                value = "/".join(segments[pos:end])
+                if value:
+                    best = self.matchNode(child, segments, end, values + (value, ), best)
+
+        return best
@@ -0,0 +1,152 @@
+#
+# A zone's weekly schedule, compiled for finding the scheduled and next
+# activity at a given time.
+#
+# A zone's program has a few periods a day, each starting an activity at a
+# time of day.  The enabled periods of the whole week are compiled into one
+# sorted list of when they start, in minutes from the start of the week
+# (Sunday 00:00), so looking up a time is a bisect.  The schedule wraps
+# around at the end of the week, and before the first period of a day the
+# scheduled activity is the one from the last period before it, however many
+# days back that is.
+#
+# A schedule is compiled once per configuration upload, either from the
+# records of urlsystems.configZones or from the config dict kept by Home
+# Assistant.
+#
+
+import bisect
+from datetime import datetime, timedelta
+import logging
+import re
+
+from .records import isOn
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# This is probably not localized and therefore is a static list
+INFINITY_WEEKDAY_IDS = [
+    "Sunday",
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday"
+]
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# The thermostat's localTime, which can have a TZ offset that is ignored since
+# the time is already local
+LOCAL_TIME_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})([+-]\d{2}:\d{2})?$")
+
+
+def parseLocalTime(text):
+    match = LOCAL_TIME_RE.match(text)
+    if match is None:
+        raise ValueError("Bad local time {}".format(text))
+    return datetime.fromisoformat(match.group(1))
+
+
+# Index of a date's day in INFINITY_WEEKDAY_IDS
+def weekdayIndex(when):
+    return (when.weekday() + 1) % 7
+
+
+# Minutes since the start of the week, with seconds as a fraction
+def minuteOfWeek(when):
+    return (weekdayIndex(when) * MINUTES_PER_DAY + when.hour * 60 + when.minute
+            + (when.second + when.microsecond / 1000000) / 60)
+
+
+# Minutes since midnight of an "HH:MM" period time
+def parsePeriodTime(text):
+    (hour, minute) = text.split(":", 1)
+    (hour, minute) = (int(hour), int(minute))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError("Bad period time {}".format(text))
+    return hour * 60 + minute
+
+
+class WeeklySchedule:
+
+    # periods is a list of (day id, activity, "HH:MM") of the enabled periods,
+    # in the order they are in the program
+    def __init__(self, periods):
+
+        compiled = []
+        for (dayId, activity, time) in periods:
+            try:
+                offset = INFINITY_WEEKDAY_IDS.index(dayId) * MINUTES_PER_DAY + parsePeriodTime(time)
+            except (AttributeError, ValueError):
+                _LOGGER.warning("Ignoring schedule period on {} at {}".format(dayId, time))
+                continue
+            compiled.append((offset, len(compiled), activity))
+
+        # Periods starting at the same time stay in program order
+        compiled.sort()
+
+        self.offsets = [offset for (offset, order, activity) in compiled]
+        self.activities = [activity for (offset, order, activity) in compiled]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # From ZoneConfig.schedule, a map of day id to a map of period id to
+    # Period.  Period.enabled is read with isOn() as in fromProgram().
+    @classmethod
+    def fromRecords(cls, schedule):
+        periods = []
+        for (dayId, dayPeriods) in schedule.items():
+            for periodId in sorted(dayPeriods):
+                period = dayPeriods[periodId]
+                if period.enabled:
+                    periods.append((dayId, period.activity, period.time))
+        return cls(periods)
+
+    # From a zone's "program" in the config dict from XmlDocument.asDict()
+    @classmethod
+    def fromProgram(cls, program):
+        periods = []
+        for day in asList(program.get("day") if isinstance(program, dict) else None):
+            for period in asList(day.get("period")):
+                if isOn(period.get("enabled")):
+                    periods.append((day.get("@id"), period.get("activity"), period.get("time")))
+        return cls(periods)
+
+    # The activity scheduled at a time and when it started, the last period
+    # starting before then.  (None, None) if nothing is scheduled.
+    def scheduled(self, when):
+        if not self.offsets:
+            return (None, None)
+        i = bisect.bisect_left(self.offsets, minuteOfWeek(when)) - 1
+        # Before the first period of the week is the last one of last week
+        weeks = -1 if i < 0 else 0
+        return (self.activities[i], self.startOf(when, i, weeks))
+
+    # The next activity after a time and when it starts, the first period
+    # starting at or after then.  (None, None) if nothing is scheduled.
+    def next(self, when):
+        if not self.offsets:
+            return (None, None)
+        i = bisect.bisect_left(self.offsets, minuteOfWeek(when))
+        # After the last period of the week is the first one of next week
+        weeks = 0
+        if i == len(self.offsets):
+            (i, weeks) = (0, 1)
+        return (self.activities[i], self.startOf(when, i, weeks))
+
+    def startOf(self, when, i, weeks):
+        weekStart = datetime(when.year, when.month, when.day) - timedelta(days=weekdayIndex(when))
+        return weekStart + timedelta(minutes=self.offsets[i] + weeks * MINUTES_PER_WEEK)
+
+
+# A single element is a dict in the config dict, rather than a list of one
+def asList(value):
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, dict)]
+    return []
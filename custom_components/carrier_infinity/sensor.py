@@ -0,0 +1,52 @@
+"""
+Diagnostic sensor for the HTTP server the thermostat talks to, loaded by the
+climate platform
+"""
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorEntity
+from homeassistant.helpers.entity import EntityCategory
+
+from . import DOMAIN
+
+# The server's stats change with every connection, so they are read once a
+# minute here rather than written with the state of every zone
+SCAN_INTERVAL = timedelta(seconds=60)
+
+
+def setup_platform(hass, config, add_devices, discovery_info=None):
+    """Set up the server sensor for the c_HTTPClient in hass.data"""
+    if discovery_info is None:
+        return
+    add_devices([InfinityServerSensor(hass.data[DOMAIN])], True)
+
+
+class InfinityServerSensor(SensorEntity):
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = True
+    # Only of use as they are now, so kept out of the recorder's history
+    _unrecorded_attributes = frozenset({"deferred_close", "thread_pool", "upstream"})
+
+    def __init__(self, _HTTPClient):
+        self._HTTPClient = _HTTPClient
+        self.entity_id = "sensor.carrier_infinity_server"
+        self._attr_extra_state_attributes = {}
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "Carrier Infinity Server"
+
+    @property
+    def native_value(self):
+        """The mode the server runs in, see climate.SERVER_MODE_*"""
+        return self._HTTPClient.server_mode
+
+    def update(self):
+        """Read the server's stats."""
+        self._attr_extra_state_attributes = {
+            "deferred_close": self._HTTPClient.deferred_close_stats(),
+            "thread_pool": self._HTTPClient.pool_stats(),
+            "upstream": self._HTTPClient.upstream_stats(),
+        }
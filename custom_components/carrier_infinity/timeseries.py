@@ -0,0 +1,293 @@
+#
+# Time series of the thermostat's energy and history uploads.
+#
+# Each upload is decoded into one row of numbers, one column per numeric
+# element, named by its path below the root with the id of repeated elements,
+# such as "usage/period[day1]/cooling".  Rows are kept in a RingStore: a
+# fixed number of rows in preallocated array('d') columns, so once it is full
+# the oldest rows are overwritten and memory stays the same however long the
+# component runs.  The number of rows comes from a memory budget.
+#
+# Rows are in the order they arrived, which is also the order of their
+# timestamps since a row from before the last one is dropped, so a time range
+# is found by bisecting the timestamps and read as slices of the columns.
+#
+# EnergyStore adds the energy report's aggregates: the usage and cost of each
+# category (cooling, fan, gas, ...) per day and in total.
+#
+
+from array import array
+import bisect
+from datetime import datetime, time, timedelta
+import logging
+import math
+import re
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Default memory budget of a store, in bytes, and most columns it will keep.
+# The energy report has 2 sections of 6 periods of 8 categories.
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_MAX_COLUMNS = 128
+
+# Value of a column in a row whose upload didn't have it
+MISSING_VALUE = math.nan
+
+# Energy report column names, such as "cost/period[month1]/gas"
+ENERGY_COLUMN_RE = re.compile(r"^(usage|cost)/period\[([^\]]+)\]/([^/]+)$")
+ENERGY_SECTIONS = ("usage", "cost")
+# Totals for the day so far and the day before
+ENERGY_PERIOD_TODAY = "day1"
+ENERGY_PERIOD_YESTERDAY = "day2"
+
+
+# Add each element below element whose text is a number to values, keyed by
+# its path.
+def numericLeaves(element, prefix, values):
+
+    for child in element:
+        name = child.tag
+        childId = child.get("id")
+        if childId is not None:
+            name = "{}[{}]".format(name, childId)
+
+        if len(child):
+            numericLeaves(child, prefix + name + "/", values)
+            continue
+
+        try:
+            values[prefix + name] = float(child.text)
+        except (TypeError, ValueError):
+            pass
+
+
+def isPresent(value):
+    return not math.isnan(value)
+
+
+# The values of a column slice that are present.  The slice is returned as it
+# is unless some rows are missing the column.
+def presentValues(values):
+    total = math.fsum(values)
+    if math.isnan(total):
+        values = array('d', [value for value in values if value == value])
+        total = math.fsum(values)
+    return (values, total)
+
+
+class RingStore:
+
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES, maxColumns=DEFAULT_MAX_COLUMNS):
+        self.maxColumns = maxColumns
+        # Rows that fit in the budget with every column, plus the timestamp
+        self.capacity = max(1, maxBytes // (array('d').itemsize * (maxColumns + 1)))
+        self.timestamps = array('d', [0.0]) * self.capacity
+        # Map of column name to its array, added as they are first seen
+        self.columns = {}
+        # Where the next row goes, and how many rows there are
+        self.next = 0
+        self.count = 0
+        self.droppedColumns = set()
+
+    def __len__(self):
+        return self.count
+
+    # Add a row at timestamp (seconds since the epoch) from a map of column
+    # name to value.  The rows are searched by bisecting their timestamps, so
+    # a row from before the last one, such as after the clock has been set
+    # back, is dropped.  Returns whether the row was added.
+    def append(self, timestamp, values):
+
+        if self.count and timestamp < self.timestamps[self.next - 1]:
+            _LOGGER.warning("Time series row at {} is before the last one at {}, dropping it".format(
+                isoTime(timestamp), isoTime(self.timestamps[self.next - 1])))
+            return False
+
+        i = self.next
+
+        for (name, column) in self.columns.items():
+            column[i] = values.get(name, MISSING_VALUE)
+
+        for name in values:
+            if name in self.columns:
+                continue
+            if len(self.columns) >= self.maxColumns:
+                if name not in self.droppedColumns:
+                    _LOGGER.warning("Too many columns in time series, dropping {}".format(name))
+                    self.droppedColumns.add(name)
+                continue
+            column = array('d', [MISSING_VALUE]) * self.capacity
+            column[i] = values[name]
+            self.columns[name] = column
+
+        self.timestamps[i] = timestamp
+        self.next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+        return True
+
+    # An array's rows oldest first
+    def ordered(self, column):
+        if self.count < self.capacity:
+            return column[:self.count]
+        return column[self.next:] + column[:self.next]
+
+    def orderedTimestamps(self):
+        return self.ordered(self.timestamps)
+
+    # The rows from start up to end of a column, where indexes count from
+    # the oldest row as in orderedTimestamps()
+    def columnSlice(self, name, start, end):
+
+        column = self.columns.get(name)
+        if column is None:
+            return array('d')
+
+        if self.count < self.capacity:
+            return column[start:end]
+
+        # Once full the oldest row is at self.next
+        start += self.next
+        end += self.next
+        if end <= self.capacity:
+            return column[start:end]
+        if start >= self.capacity:
+            return column[start - self.capacity:end - self.capacity]
+        return column[start:] + column[:end - self.capacity]
+
+    # The value of a column in one row, indexed as in columnSlice()
+    def value(self, name, row):
+
+        column = self.columns.get(name)
+        if column is None:
+            return MISSING_VALUE
+
+        if self.count < self.capacity:
+            return column[row]
+        return column[(row + self.next) % self.capacity]
+
+
+class HistoryStore(RingStore):
+
+    # Record an upload's document root
+    def addUpload(self, timestamp, root):
+        values = {}
+        numericLeaves(root, "", values)
+        self.append(timestamp, values)
+
+    # For each column, the number of rows that have it, their sum, min, max
+    # and latest value, over rows from start up to but not including end
+    # (seconds since the epoch, either may be None).
+    def aggregate(self, start=None, end=None):
+
+        timestamps = self.orderedTimestamps()
+        (i, j) = rowRange(timestamps, start, end)
+
+        columns = {}
+        for name in sorted(self.columns):
+            (values, total) = presentValues(self.columnSlice(name, i, j))
+            if not values:
+                continue
+            columns[name] = {
+                "count": len(values),
+                "sum": total,
+                "min": min(values),
+                "max": max(values),
+                "last": values[-1]
+            }
+
+        return {
+            "samples": j - i,
+            "start": isoTime(timestamps[i]) if j > i else None,
+            "end": isoTime(timestamps[j - 1]) if j > i else None,
+            "columns": columns
+        }
+
+
+class EnergyStore(HistoryStore):
+
+    # Map of section to a map of category to column name, for a period
+    def periodColumns(self, period):
+
+        periodColumns = {section: {} for section in ENERGY_SECTIONS}
+
+        for name in self.columns:
+            match = ENERGY_COLUMN_RE.match(name)
+            if match and match.group(2) == period:
+                periodColumns[match.group(1)][match.group(3)] = name
+
+        return periodColumns
+
+    # The usage and cost of each category for each day from startDay to
+    # endDay (dates, inclusive) and their totals.
+    #
+    # A day's figures come from the day2 (yesterday) period of the first
+    # upload of the next day, since that is the whole day.  If there isn't
+    # one then the day1 (today) period of the last upload of the day is used,
+    # which covers the day up to then.
+    def aggregateDays(self, startDay=None, endDay=None):
+
+        timestamps = self.orderedTimestamps()
+
+        if not len(timestamps):
+            return {"days": {}, "total": {section: {} for section in ENERGY_SECTIONS}}
+
+        # Only days that can have figures
+        firstDay = datetime.fromtimestamp(timestamps[0]).date()
+        lastDay = datetime.fromtimestamp(timestamps[-1]).date()
+        if startDay is None or startDay < firstDay:
+            startDay = firstDay
+        if endDay is None or endDay > lastDay:
+            endDay = lastDay
+
+        todayColumns = self.periodColumns(ENERGY_PERIOD_TODAY)
+        yesterdayColumns = self.periodColumns(ENERGY_PERIOD_YESTERDAY)
+
+        days = {}
+        total = {section: {} for section in ENERGY_SECTIONS}
+
+        day = startDay
+        dayStart = bisect.bisect_left(timestamps, startOfDay(day))
+        while day <= endDay:
+            nextDay = day + timedelta(days=1)
+            nextDayStart = bisect.bisect_left(timestamps, startOfDay(nextDay))
+
+            if nextDayStart < len(timestamps) and timestamps[nextDayStart] < startOfDay(nextDay + timedelta(days=1)):
+                (row, periodColumns) = (nextDayStart, yesterdayColumns)
+            elif nextDayStart > dayStart:
+                (row, periodColumns) = (nextDayStart - 1, todayColumns)
+            else:
+                row = None
+
+            if row is not None:
+                dayFigures = {}
+                for section in ENERGY_SECTIONS:
+                    figures = {}
+                    for (category, name) in periodColumns[section].items():
+                        value = self.value(name, row)
+                        if isPresent(value):
+                            figures[category] = value
+                            total[section][category] = total[section].get(category, 0.0) + value
+                    dayFigures[section] = figures
+                days[day.isoformat()] = dayFigures
+
+            day = nextDay
+            dayStart = nextDayStart
+
+        return {"days": days, "total": total}
+
+
+# The first and one past the last index of timestamps from start up to but not
+# including end
+def rowRange(timestamps, start, end):
+    i = 0 if start is None else bisect.bisect_left(timestamps, start)
+    j = len(timestamps) if end is None else bisect.bisect_left(timestamps, end)
+    return (i, max(i, j))
+
+
+def startOfDay(day):
+    return datetime.combine(day, time()).timestamp()
+
+
+def isoTime(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
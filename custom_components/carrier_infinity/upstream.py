@@ -0,0 +1,230 @@
+#
+# HTTP client for requests this component makes to Carrier's servers, which
+# for now is just the weather forecast (see urlweather.py).
+#
+# One requests.Session is shared so that connections are kept alive and
+# reused from a pool instead of opened for each request.  Every request has a
+# connect and a read timeout.  Requests that fail with a connection error,
+# a timeout or a 502/503/504 are retried a couple of times after a short,
+# randomized wait.
+#
+# The thermostat waits for the response, so a request and its retries are
+# given REQUEST_DEADLINE seconds in all.  Each attempt's timeouts are cut to
+# the time left, and there is no retry without MIN_ATTEMPT_TIME left for it.
+# (The read timeout is for each wait for data, so a server sending a little
+# at a time can still take longer.)
+#
+# A circuit breaker stops a down server from holding up the thermostat: after
+# CIRCUIT_FAILURE_THRESHOLD requests in a row have failed (after their
+# retries) requests fail straight away with CircuitOpenError for
+# CIRCUIT_RESET_TIMEOUT seconds.  Then one request is let through to try the
+# server again, which closes the circuit if it works.
+#
+# stats() gives the pool hit rate (requests that reused a connection) and the
+# latency of recent requests.
+#
+
+from collections import deque
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Seconds to wait for a connection, and for the server to answer
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+
+# Seconds a request can take, retries included, and the least time worth
+# making another attempt in
+REQUEST_DEADLINE = 10
+MIN_ATTEMPT_TIME = 0.5
+
+# Retries after the first attempt, and the wait before the first retry which
+# doubles each time, before adding jitter
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.2
+RETRY_STATUS_CODES = (502, 503, 504)
+RETRY_METHODS = ("GET", "HEAD")
+
+# Connections kept open per host
+POOL_SIZE = 4
+
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+# How many request latencies stats() looks at
+LATENCY_SAMPLES = 100
+
+
+# The timeout for an attempt with remaining seconds left before the deadline,
+# from timeout as passed to requests
+def attemptTimeout(timeout, remaining):
+    remaining = max(remaining, 0.001)
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+
+# Seconds to wait before retrying after attempt (counting from 0), or None if
+# there are no retries left or not enough time left before deadline
+def retryWait(attempt, retries, deadline):
+    if attempt >= retries:
+        return None
+    # Full jitter, so that retries don't line up
+    wait = random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+    if time.monotonic() + wait + MIN_ATTEMPT_TIME > deadline:
+        return None
+    return wait
+
+
+# Raised instead of making a request while the circuit is open.  A
+# RequestException so that callers handle it like any other failure.
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class UpstreamClient:
+
+    def __init__(self, connectTimeout=CONNECT_TIMEOUT, readTimeout=READ_TIMEOUT, maxRetries=MAX_RETRIES,
+                 failureThreshold=CIRCUIT_FAILURE_THRESHOLD, resetTimeout=CIRCUIT_RESET_TIMEOUT,
+                 deadline=REQUEST_DEADLINE):
+        self.timeout = (connectTimeout, readTimeout)
+        self.maxRetries = maxRetries
+        self.deadline = deadline
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+
+        self.adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.lock = threading.Lock()
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.openedAt = None
+
+        # Counters for stats()
+        self.requestCount = 0
+        self.failureCount = 0
+        self.retryCount = 0
+        self.rejectedCount = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    # Make a request like requests.request(), returning the Response.  Raises
+    # a RequestException if it failed after any retries, or CircuitOpenError
+    # if the circuit is open.
+    def request(self, method, url, **kwargs):
+
+        self.checkCircuit()
+
+        timeout = kwargs.pop("timeout", self.timeout)
+        retries = self.maxRetries if method.upper() in RETRY_METHODS else 0
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=attemptTimeout(timeout, deadline - start), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                self.recordLatency(start)
+                wait = retryWait(attempt, retries, deadline)
+                if wait is None:
+                    self.recordResult(False)
+                    raise
+                _LOGGER.debug("Retrying {} after {}".format(url, exception))
+            else:
+                self.recordLatency(start)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.recordResult(True)
+                    return response
+                wait = retryWait(attempt, retries, deadline)
+                if wait is None:
+                    # The server answered, but it is having trouble
+                    self.recordResult(False)
+                    return response
+                _LOGGER.debug("Retrying {} after status {}".format(url, response.status_code))
+                response.close()
+
+            time.sleep(wait)
+            attempt += 1
+            with self.lock:
+                self.retryCount += 1
+
+    # Raise CircuitOpenError unless a request may be made now
+    def checkCircuit(self):
+        with self.lock:
+            self.requestCount += 1
+            if self.state == CIRCUIT_CLOSED:
+                return
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self.openedAt >= self.resetTimeout:
+                # Let this request try the server
+                self.state = CIRCUIT_HALF_OPEN
+                return
+            self.rejectedCount += 1
+        raise CircuitOpenError("Circuit open after {} failures".format(self.failures))
+
+    def recordResult(self, success):
+        with self.lock:
+            if success:
+                if self.state != CIRCUIT_CLOSED:
+                    _LOGGER.info("Upstream server is back, closing circuit")
+                self.state = CIRCUIT_CLOSED
+                self.failures = 0
+                return
+
+            self.failureCount += 1
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failureThreshold:
+                if self.state != CIRCUIT_OPEN:
+                    _LOGGER.warning("Upstream server failed {} times, opening circuit for {}s".format(self.failures, self.resetTimeout))
+                self.state = CIRCUIT_OPEN
+                self.openedAt = time.monotonic()
+
+    def recordLatency(self, start):
+        self.latencies.append(time.monotonic() - start)
+
+    # Connections opened and requests sent over all of the pool's connections
+    def poolCounts(self):
+
+        connections = 0
+        requestsSent = 0
+
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requestsSent += pool.num_requests
+
+        return (connections, requestsSent)
+
+    def stats(self):
+
+        (connections, requestsSent) = self.poolCounts()
+        latencies = sorted(self.latencies)
+
+        return {
+            "state": self.state,
+            "requests": self.requestCount,
+            "failures": self.failureCount,
+            "retries": self.retryCount,
+            "rejected": self.rejectedCount,
+            "connections": connections,
+            "pool_hit_rate": (requestsSent - connections) / requestsSent if requestsSent else None,
+            "latency_avg_ms": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+            "latency_max_ms": latencies[-1] * 1000 if latencies else None
+        }
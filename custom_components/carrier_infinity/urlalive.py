@@ -6,9 +6,10 @@
 #
 
 from .httpobj import HttpRequest, HttpResponse, addUrl
+from .responsecache import responseCache
 
 
-def urlAlive(request):
+def makeAliveResponse():
 
     response = HttpResponse.okResponse()
 
@@ -20,8 +21,13 @@ def urlAlive(request):
     response.addAccessControlHeader()
     response.addDateHeader()
 
-    response.body = "alive"
+    response.body = b"alive"
 
     return response
 
+
+def urlAlive(request):
+
+    return responseCache.get("alive", makeAliveResponse).makeResponse()
+
 addUrl("/Alive$", urlAlive)
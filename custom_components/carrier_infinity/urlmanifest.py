@@ -5,32 +5,82 @@
 # We treat the manifest as a static blob that we send back to the Thermostat
 # as-is.
 #
+# The file is read when the server starts, and read again if it has been
+# modified since, which also clears the response cache.
+#
 
+import logging
 import os
+import threading
 from datetime import datetime
 
 from .httpobj import HttpRequest, HttpResponse, addUrl
+from .responsecache import responseCache
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
 
+# The manifest file contents as bytes
 responseManifest = None
+manifestPath = None
+# st_mtime_ns of the file when it was read
+manifestMtime = None
+manifestLock = threading.Lock()
 
 def loadXMLFiles(hass):
 
-    global responseManifest
+    global manifestPath
 
     configpath = "manifest.xml"
     if hass:
         configpath = hass.config.path("custom_components/carrier_infinity/manifest.xml")
 
-    responseManifest = ""
+    with manifestLock:
+        manifestPath = configpath
+        reloadManifest()
 
-    with open(configpath, 'r') as fhan:
-        for line in fhan:
-            responseManifest = responseManifest + line
 
+# Must be called holding manifestLock
+def reloadManifest():
 
-def urlManifest(request):
+    global responseManifest, manifestMtime
+
+    with open(manifestPath, 'rb') as fhan:
+        mtime = os.fstat(fhan.fileno()).st_mtime_ns
+        responseManifest = fhan.read()
+
+    manifestMtime = mtime
+    responseCache.clear()
+
+    _LOGGER.debug("Loaded {} ({} bytes)".format(manifestPath, len(responseManifest)))
+
+
+# Read the manifest again if the file has changed, or for the first time if
+# the server didn't load it.
+def checkManifest():
+
+    if manifestPath is None:
+        loadXMLFiles(None)
+        return
 
-    global responseManifest
+    try:
+        mtime = os.stat(manifestPath).st_mtime_ns
+    except OSError as exception:
+        _LOGGER.warning("Unable to check {}, using the loaded manifest - {}".format(manifestPath, exception))
+        return
+
+    if mtime == manifestMtime:
+        return
+
+    with manifestLock:
+        if mtime == manifestMtime:
+            return
+        try:
+            reloadManifest()
+        except OSError as exception:
+            _LOGGER.warning("Unable to reload {}, using the loaded manifest - {}".format(manifestPath, exception))
+
+
+def makeManifestResponse():
 
     response = HttpResponse.okResponse()
 
@@ -47,4 +97,11 @@ def urlManifest(request):
     return response
 
 
+def urlManifest(request):
+
+    checkManifest()
+
+    return responseCache.get("manifest", makeManifestResponse).makeResponse()
+
+
 addUrl("/manifest", urlManifest)
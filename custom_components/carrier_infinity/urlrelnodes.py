@@ -9,22 +9,19 @@
 import logging
 
 from .httpobj import HttpRequest, HttpResponse, addUrl
+from .responsecache import responseCache
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
-def urlRelNodes(request):
-
-    hostAndPath = request.pathDict['hostAndPath']
+def makeRelNodesResponse(hostAndPath):
 
-    _LOGGER.info("Fetch http://{}".format(hostAndPath))
-
-    bodyStr = "Returned from python server"
+    body = b"Returned from python server"
 
     response = HttpResponse.okResponse()
 
     response.headers.append(("Cache-Control", "no-store,no-cache"))
     response.headers.append(("Pragma", "no-cache"))
-    response.addContentLengthHeader(len(bodyStr))
+    response.addContentLengthHeader(len(body))
     response.addContentTypeHeader("text/plain")
     response.addRequestContextHeader()
     response.headers.append(("X-Content-CRC", "1278"))
@@ -32,10 +29,20 @@ def urlRelNodes(request):
     # Cookie
     response.addDateHeader()
 
-    response.body = bodyStr
+    response.body = body
 
     return response
 
 
+def urlRelNodes(request):
+
+    hostAndPath = request.pathDict['hostAndPath']
+
+    _LOGGER.info("Fetch http://{}".format(hostAndPath))
+
+    # X-Current-Page differs for each URL
+    return responseCache.get(("relnotes", hostAndPath), lambda: makeRelNodesResponse(hostAndPath)).makeResponse()
+
+
 
 addUrl("http://(?P<hostAndPath>.+)$", urlRelNodes)
@@ -5,16 +5,25 @@
 # interaction with the thermostat happens.
 #
 
-import copy
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import functools
 import logging
+import threading
+import time
 import json
-import xmltodict
 import xml.etree.ElementTree as ET
 import requests
 
 
-from .httpobj import HttpRequest, HttpResponse, addUrl
+from .httpobj import HttpRequest, HttpResponse, addUrl, bodyLength
+from .commands import FanCommand, HoldCommand
+from .xmldocument import XmlExtractor
+from . import xmlbackend
+from .configoverlay import ConfigTemplate
+from .pendingchanges import PendingChanges
+from .records import Activity, Period, ZoneConfig, ZoneStatus
+from .schedule import WeeklySchedule
+from .timeseries import EnergyStore, HistoryStore, startOfDay
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
@@ -27,33 +36,57 @@ activeThermostatId = None
 # URL).  Also required to send updated configuration since we will use the
 # last known configuration and modify it as needed.
 configFromDevice = None
+# Map of serial number to the ConfigTemplate built from configFromDevice, see
+# configoverlay.py
+configTemplates = {}
+MAX_CONFIG_TEMPLATES = 4
 systemstatus = None
-# Parsed status of zones
+# Parsed status of zones, map of zone id to records.ZoneStatus
 statusZones = {}
-# Parsed configuration of zones
+# Energy and history uploads over time, see timeseries.py
+energyStore = EnergyStore()
+historyStore = HistoryStore()
+# Parsed configuration of zones, map of zone id to records.ZoneConfig
 configZones = {}
+# Ids of the zones enabled in the configuration, the only ones the .../config
+# response can change.  None until the configuration has been read.
+enabledZoneIds = None
 # Some parsed status of device for API module to use
 currentMode = None
 tempUnits = None
-# The API module updates these variables for this module to use to send
-# configuration changes to the device.  Once the configuration has been
-# sent to the device (next time it polls for an update) these variables
-# are reset back to None
-pendingActionHold = None
-pendingActionActivity = None
-pendingActionTemp = None
-pendingActionUntil = None
-
-# This is probably not localized and therefore is a static list
-INFINITY_WEEKDAY_IDS = [
-    "Sunday",
-    "Monday",
-    "Tuesday",
-    "Wednesday",
-    "Thursday",
-    "Friday",
-    "Saturday"
-]
+# Changes from Home Assistant and the API module to send to the device the
+# next time it fetches its configuration, per zone
+pendingChanges = PendingChanges()
+
+# Handlers can run at the same time when the server uses a thread pool, so
+# handlers that read or change the data above hold this lock while they run.
+stateLock = threading.RLock()
+
+def withStateLock(func):
+    @functools.wraps(func)
+    def lockedFunc(request):
+        with stateLock:
+            return func(request)
+    return lockedFunc
+
+# Record a command from commands.py as a pending change to send to the
+# thermostat the next time it fetches its configuration.  Called directly by
+# Home Assistant and by the /api URL handlers.  Returns False, and the
+# command is ignored, if its zone is not enabled.
+def submitCommand(command):
+
+    with stateLock:
+        if enabledZoneIds is not None and command.zoneId not in enabledZoneIds:
+            _LOGGER.warning("Ignored {}, zone {} is not enabled".format(command, command.zoneId))
+            return False
+        pendingChanges.submit(command)
+
+    _LOGGER.info("Set pending {}".format(command))
+    return True
+
+
+def hasPendingActions():
+    return pendingChanges.hasChanges()
 
 
 def makeApiResponse(code, message, body, contentType=None):
@@ -63,6 +96,9 @@ def makeApiResponse(code, message, body, contentType=None):
     else:
         response = HttpResponse.errorResponse(code, message)
 
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
     if body:
         response.addContentLengthHeader(len(body))
         response.addContentTypeHeader(contentType)
@@ -73,33 +109,10 @@ def makeApiResponse(code, message, body, contentType=None):
     return response
 
 
-def findNextActivity(periods, now):
-
-    periodStart = datetime.now()
-
-    periodIdList = list(periods)
-    periodIdList.sort()
-
-    for periodId in periodIdList:
-        period = periods[periodId]
-
-        if not period["enabled"]:
-            continue
-
-        (hour, minute) = period["time"].split(":", 1)
-        periodStart = periodStart.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
-
-        if now < periodStart:
-            return period["time"]
-
-    return None
-
-
+@withStateLock
 def urlApiZoneSetHold(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
-    global INFINITY_WEEKDAY_IDS
 
     zoneId = request.pathDict['zoneId']
 
@@ -120,10 +133,8 @@ def urlApiZoneSetHold(request):
         tempValue = request.bodyDict['temp'][0]
 
     if not holdValue:
-        pendingActionHold = True
-        pendingActionActivity = None
-        pendingActionTemp = None
-        _LOGGER.info("Set pending hold=off")
+        if not submitCommand(HoldCommand(zoneId, False)):
+            return makeApiResponse(400, "Zone is not enabled", None)
         return makeApiResponse(200, "OK", None)
 
     if not activityValue or activityValue not in ("home", "away", "sleep", "wake", "manual"):
@@ -156,27 +167,13 @@ def urlApiZoneSetHold(request):
 
         zoneConfig = configZones[zoneId]
 
-        now = datetime.now()
-        weekdayId = INFINITY_WEEKDAY_IDS[now.weekday()]
-
-        periods = zoneConfig["schedule"][weekdayId]
+        (nextActivity, nextStart) = zoneConfig.weeklySchedule.next(datetime.now())
 
-        activityEnd = findNextActivity(periods, now)
+        if nextStart is None:
+            _LOGGER.warning("Missing until value and cannot find next activity")
+            return makeApiResponse(400, "Missing until value and cannot find next activity", None)
 
-        if not activityEnd:
-            # Next day
-
-            tomorrow = now + timedelta(days=1)
-
-            tomorrow.replace(hour=0, minute=0)
-
-            activityEnd = findNextActivity(periods, now)
-
-            if not activityEnd:
-                _LOGGER.warning("Missing until value and cannot find next activity")
-                return makeApiResponse(400, "Missing until value and cannot find next activity", None)
-
-        untilValue = activityEnd
+        untilValue = nextStart.strftime("%H:%M")
 
 
     if activityValue == "manual":
@@ -196,27 +193,24 @@ def urlApiZoneSetHold(request):
             _LOGGER.warning("temp value must be in 0.5 increments: %s", tempValue)
             return makeApiResponse(400, "temp value must be 0.5 increments", None)
 
-    pendingActionHold = True
-    pendingActionActivity = activityValue
-    pendingActionUntil = untilValue
-    pendingActionTemp = tempValue
-
-    _LOGGER.info("Set pending hold=on to {} until {} temp {}".format(pendingActionActivity, pendingActionUntil, pendingActionTemp))
+    if not submitCommand(HoldCommand(zoneId, True, activityValue, untilValue, tempValue)):
+        return makeApiResponse(400, "Zone is not enabled", None)
 
     empty = {}
     return makeApiResponse(200, "OK", json.dumps(empty, sort_keys=True), "application/json")
 addUrl("/api/hold/(?P<zoneId>.+)$", urlApiZoneSetHold)
 
 
+@withStateLock
 def urlApiHold(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     zoneId = request.pathDict['zoneId']
 
-    holdValue = False
-    if "hold" in request.bodyDict:
-        holdValue = request.bodyDict['hold'][0]
+    if "hold" not in request.bodyDict:
+        return makeApiResponse(400, "Missing hold value", None)
+
+    holdValue = (request.bodyDict['hold'][0] == "on")
 
     activityValue = None
     if "holdActivity" in request.bodyDict:
@@ -230,21 +224,32 @@ def urlApiHold(request):
     if "temp" in request.bodyDict:
         tempValue = request.bodyDict['temp'][0]
 
-    pendingActionHold = holdValue
-    pendingActionActivity = activityValue
-    pendingActionUntil = untilValue
-    pendingActionTemp = tempValue
+    if not submitCommand(HoldCommand(zoneId, holdValue, activityValue, untilValue, tempValue)):
+        return makeApiResponse(400, "Zone is not enabled", None)
 
-    _LOGGER.info("Set pending hold={} to {} until {} temp {}".format(holdValue, pendingActionActivity, pendingActionUntil, pendingActionTemp))
     empty = {}
     return makeApiResponse(200, "OK", json.dumps(empty, sort_keys=True), "application/json")
+
+
+def urlApiFan(request):
+    zoneId = request.pathDict['zoneId']
+
+    if "fan" not in request.bodyDict or request.bodyDict['fan'][0] not in ("off", "low", "med", "high"):
+        return makeApiResponse(400, "Bad fan value", None)
+
+    if not submitCommand(FanCommand(zoneId, request.bodyDict['fan'][0])):
+        return makeApiResponse(400, "Zone is not enabled", None)
+
+    empty = {}
+    return makeApiResponse(200, "OK", json.dumps(empty, sort_keys=True), "application/json")
+addUrl("/api/config/zones/zone/(?P<zoneId>[^/]+)/fan/$", urlApiFan)
 addUrl("/api/config/zones/zone/(?P<zoneId>.+)/$", urlApiHold)
 
 
+@withStateLock
 def urlApiGetZoneField(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     zoneId = request.pathDict['zoneId']
     fieldName = request.pathDict['fieldName']
 
@@ -253,72 +258,106 @@ def urlApiGetZoneField(request):
 
     zoneObj = statusZones[zoneId]
 
-    if fieldName not in zoneObj:
+    if fieldName not in zoneObj.jsonNames:
         return makeApiResponse(404, "No such field", None)
 
-    return makeApiResponse(200, "OK", zoneObj[fieldName], "text/plain")
+    return makeApiResponse(200, "OK", getattr(zoneObj, fieldName), "text/plain")
 addUrl("/api/status/(?P<zoneId>.+)/(?P<fieldName>.+)$", urlApiGetZoneField)
 
 
+@withStateLock
 def urlApiGetZoneAll(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     zoneId = request.pathDict['zoneId']
     if zoneId not in statusZones:
         return makeApiResponse(404, "No data", None)
 
     zoneObj = statusZones[zoneId]
 
-    return makeApiResponse(200, "OK", json.dumps(zoneObj), "application/json")
+    return makeApiResponse(200, "OK", zoneObj.toJson(), "application/json")
 addUrl("/api/status/(?P<zoneId>.+)$", urlApiGetZoneAll)
 
+@withStateLock
 def urlApiGetZoneConfig(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     zoneId = request.pathDict['zoneId']
     if zoneId not in configZones:
         return makeApiResponse(404, "No data", None)
 
     zoneObj = configZones[zoneId]
 
-    zoneObj["mode"] = currentMode
-    zoneObj["units"] = tempUnits
-
-    return makeApiResponse(200, "OK", json.dumps(zoneObj), "application/json")
+    return makeApiResponse(200, "OK", zoneObj.toJson(mode=currentMode, units=tempUnits), "application/json")
 addUrl("/api/config/(?P<zoneId>.+)$", urlApiGetZoneConfig)
 
+@withStateLock
 def urlApiDeviceConfig(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     if configFromDevice == None:
         return makeApiResponse(200, "OK", None)
     else:
-        return makeApiResponse(200, "OK", ET.tostring(configFromDevice, "utf-8"), "application/xml")
+        return makeApiResponse(200, "OK", xmlbackend.serialize(configFromDevice), "application/xml")
 addUrl("/api/deviceConfig$", urlApiDeviceConfig)
 
+@withStateLock
 def urlApiStatus(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
     if systemstatus == None:
         return makeApiResponse(200, "OK", None)
     else:
-        return makeApiResponse(200, "OK", ET.tostring(systemstatus, "utf-8"), "application/xml")
+        return makeApiResponse(200, "OK", xmlbackend.serialize(systemstatus), "application/xml")
 addUrl("/api/status", urlApiStatus)
 
+@withStateLock
 def urlApiPendingActions(request):
     global activeThermostatId
     global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-    global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
-    if pendingActionHold != None:
+    if hasPendingActions():
         return makeApiResponse(200, "OK", "yes", "text/plain")
     else:
         return makeApiResponse(200, "OK", "no", "text/plain")
 addUrl("/api/pendingActions", urlApiPendingActions)
 
+# A date (YYYY-MM-DD) from the query string, or None if it isn't given.
+# Raises ValueError if it isn't a date.
+def queryDate(request, name):
+    if not request.queryString or name not in request.queryString:
+        return None
+    return date.fromisoformat(request.queryString[name][0])
+
+# Usage and cost per day and per category (cooling, fan, gas, ...) from the
+# energy uploads, for the days from ?start= to ?end= (inclusive, both
+# optional).
+@withStateLock
+def urlApiEnergy(request):
+    try:
+        startDay = queryDate(request, "start")
+        endDay = queryDate(request, "end")
+    except ValueError:
+        return makeApiResponse(400, "Bad date", None)
+
+    return makeApiResponse(200, "OK", json.dumps(energyStore.aggregateDays(startDay, endDay)), "application/json")
+addUrl("/api/energy$", urlApiEnergy)
+
+# The count, sum, min, max and last value of each number in the history
+# uploads, for the days from ?start= to ?end= (inclusive, both optional).
+@withStateLock
+def urlApiHistory(request):
+    try:
+        startDay = queryDate(request, "start")
+        endDay = queryDate(request, "end")
+    except ValueError:
+        return makeApiResponse(400, "Bad date", None)
+
+    start = startOfDay(startDay) if startDay else None
+    end = startOfDay(endDay + timedelta(days=1)) if endDay else None
+
+    return makeApiResponse(200, "OK", json.dumps(historyStore.aggregate(start, end)), "application/json")
+addUrl("/api/history$", urlApiHistory)
+
 
 #========================================================================================================
 #========================================================================================================
@@ -459,9 +498,58 @@ addUrl("/systems/(?P<serialNumber>.+)/odu_status$", urlSystemsODUStatus)
 # with a list of booleans to ask the device to make another /systems call
 # soon, such as to download updated configuration.  We can also adjust the
 # rate at which it polls for the various /systems calls here.
-def makeSystemsStatusResponse(request, serverHasChanges, configHasChanges):
+#
+# The status response is the same every time apart from the timestamp and the
+# two *HasChanges flags, so it is built once per serial number as a template
+# and only those values are filled in for each poll.
+#
+
+# How often (seconds) the thermostat should make each of its calls, in the
+# order they appear in the response.
+STATUS_PING_RATES = [
+	("pingRate", "30"),
+	("iduStatusPingRate", "93600"),
+	("iduFaultsPingRate", "86400"),
+	("oduStatusPingRate", "90000"),
+	("oduFaultsPingRate", "82800"),
+	("historyPingRate", "75600"),
+	("equipEventsPingRate", "79200"),
+	("rootCausePingRate", "72000")
+]
+
+# Change flags that are always false, after serverHasChanges and
+# configHasChanges.
+STATUS_OTHER_CHANGES = [
+	"dealerHasChanges",
+	"dealerLogoHasChanges",
+	"oduConfigHasChanges",
+	"iduConfigHasChanges",
+	"utilityEventsHasChanges",
+	"sensorConfigHasChanges",
+	"sensorProfileHasChanges",
+	"sensorDiagnosticHasChanges"
+]
+
+# Placeholders for the values filled in on each poll.  These are put through
+# ElementTree when building a template, so must not need escaping.
+STATUS_TIMESTAMP_SLOT = "@@timestamp@@"
+STATUS_SERVER_CHANGES_SLOT = "@@serverHasChanges@@"
+STATUS_CONFIG_CHANGES_SLOT = "@@configHasChanges@@"
+
+# Map of serial number to a list of the byte strings between the slots
+statusTemplates = {}
+MAX_STATUS_TEMPLATES = 16
 
-	serialNumber = request.pathDict["serialNumber"]
+
+# Change the ping rates, given as name=seconds (see STATUS_PING_RATES).
+def setStatusPingRates(**rates):
+	global STATUS_PING_RATES
+
+	STATUS_PING_RATES = [(name, str(rates.get(name, value))) for (name, value) in STATUS_PING_RATES]
+	statusTemplates.clear()
+
+
+def renderSystemsStatusXml(serialNumber, timestamp, serverHasChanges, configHasChanges):
 
 	statusRoot = ET.Element("status")
 
@@ -479,112 +567,89 @@ def makeSystemsStatusResponse(request, serverHasChanges, configHasChanges):
 	statusRoot.append(atomLink)
 
 	tsEl = ET.Element("timestamp")
-	tsEl.text = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+	tsEl.text = timestamp
 	statusRoot.append(tsEl)
 
-	el = ET.Element("pingRate")
-	el.text = "30"
-	statusRoot.append(el)
-
-	el = ET.Element("iduStatusPingRate")
-	el.text = "93600"
-	statusRoot.append(el)
-
-	el = ET.Element("iduFaultsPingRate")
-	el.text = "86400"
-	statusRoot.append(el)
+	for (name, value) in STATUS_PING_RATES:
+		el = ET.Element(name)
+		el.text = value
+		statusRoot.append(el)
 
-	el = ET.Element("oduStatusPingRate")
-	el.text = "90000"
+	el = ET.Element("serverHasChanges")
+	el.text = serverHasChanges
 	statusRoot.append(el)
 
-	el = ET.Element("oduFaultsPingRate")
-	el.text = "82800"
+	el = ET.Element("configHasChanges")
+	el.text = configHasChanges
 	statusRoot.append(el)
 
-	el = ET.Element("historyPingRate")
-	el.text = "75600"
-	statusRoot.append(el)
+	for name in STATUS_OTHER_CHANGES:
+		el = ET.Element(name)
+		el.text = "false"
+		statusRoot.append(el)
 
-	el = ET.Element("equipEventsPingRate")
-	el.text = "79200"
-	statusRoot.append(el)
+	return ET.tostring(statusRoot, "utf-8")
 
-	el = ET.Element("rootCausePingRate")
-	el.text = "72000"
-	statusRoot.append(el)
 
-	el = ET.Element("serverHasChanges")
-	if serverHasChanges:
-		el.text = "true"
-	else:
-		el.text = "false"
-	statusRoot.append(el)
+def getStatusTemplate(serialNumber):
 
-	el = ET.Element("configHasChanges")
-	if configHasChanges:
-		el.text = "true"
-	else:
-		el.text = "false"
-	statusRoot.append(el)
+	template = statusTemplates.get(serialNumber)
+	if template:
+		return template
 
-	el = ET.Element("dealerHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	xmlBody = renderSystemsStatusXml(serialNumber, STATUS_TIMESTAMP_SLOT, STATUS_SERVER_CHANGES_SLOT, STATUS_CONFIG_CHANGES_SLOT)
 
-	el = ET.Element("dealerLogoHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	template = []
+	for slot in (STATUS_TIMESTAMP_SLOT, STATUS_SERVER_CHANGES_SLOT, STATUS_CONFIG_CHANGES_SLOT):
+		(before, xmlBody) = xmlBody.split(slot.encode("utf-8"), 1)
+		template.append(before)
+	template.append(xmlBody)
 
-	el = ET.Element("oduConfigHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	if len(statusTemplates) >= MAX_STATUS_TEMPLATES:
+		statusTemplates.clear()
+	statusTemplates[serialNumber] = template
 
-	el = ET.Element("iduConfigHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	return template
 
-	el = ET.Element("utilityEventsHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
 
-	el = ET.Element("sensorConfigHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+def makeSystemsStatusResponse(request, serverHasChanges, configHasChanges):
 
-	el = ET.Element("sensorProfileHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	serialNumber = request.pathDict["serialNumber"]
 
-	el = ET.Element("sensorDiagnosticHasChanges")
-	el.text = "false"
-	statusRoot.append(el)
+	template = getStatusTemplate(serialNumber)
 
-	xmlBodyStr = ET.tostring(statusRoot, "utf-8")
+	# Sent with writev() without joining
+	xmlBody = [
+		template[0],
+		datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ").encode("utf-8"),
+		template[1],
+		b"true" if serverHasChanges else b"false",
+		template[2],
+		b"true" if configHasChanges else b"false",
+		template[3]
+	]
 
 	response = HttpResponse.okResponse()
 
 	response.headers.append(("Cache-Control", "private"))
-	response.addContentLengthHeader(len(xmlBodyStr))
+	response.addContentLengthHeader(bodyLength(xmlBody))
 	response.addContentTypeHeader("application/xml; charset=utf-8")
 	response.addServerHeader()
 	response.addRequestContextHeader()
 	response.addAccessControlHeader()
 	response.addDateHeader()
 
-	response.body = xmlBodyStr
+	response.body = xmlBody
 
 	return response
 
 
+@withStateLock
 def urlSystemsStatus(request):
 	global activeThermostatId
 	global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-	global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
 
-	xmlStringData = request.bodyDict["data"][0]
-
-	xmlRoot = ET.fromstring(xmlStringData)
+	xmlRoot = request.xmlDocument().root
 
 	if xmlRoot.attrib['version'] != "1.7":
 		_LOGGER.warning("Unexpected client version: %s" % (xmlRoot.attrib['version'], ))
@@ -599,32 +664,19 @@ def urlSystemsStatus(request):
 
 	for zone in xmlRoot.findall("./zones/zone"):
 
-		if zone.find("./enabled").text != "on":
-			continue
-
-		zoneId = zone.attrib['id']
+		zoneObj = ZoneStatus.fromElement(zone)
 
-		zoneObj = {
-			"name": zone.find("./name").text,
-			"activity": zone.find("./currentActivity").text,
-			"temperature": zone.find("./rt").text,
-			"humidity": zone.find("./rh").text,
-			"heatTo": zone.find("./htsp").text,
-			"coolTo": zone.find("./clsp").text,
-			"fan": zone.find("./fan").text,
-			"hold": zone.find("./hold").text,
-			"until" : zone.find("./otmr").text,
-			"zoneConditioning" : zone.find("./zoneconditioning").text
-		}
+		if not zoneObj.enabled:
+			continue
 
-		statusZones[zoneId] = zoneObj
+		statusZones[zone.attrib['id']] = zoneObj
 
 
 
-	if pendingActionHold:
+	if hasPendingActions():
 		_LOGGER.info("Returned has status changes")
 		response = makeSystemsStatusResponse(request, True, True)
-	elif not configFromDevice:
+	elif configFromDevice is None:
 		_LOGGER.info("Returned want config")
 		response = makeSystemsStatusResponse(request, True, True)
 	else:
@@ -639,7 +691,7 @@ addUrl("/systems/(?P<serialNumber>.+)/status$", urlSystemsStatus)
 # I don't have utility events set up in the themostat to test this.
 def urlSystemsUtilityEvents(request):
 
-	utilityXMLStr = '<utility_events version="1.42" xmlns:atom="http://www.w3.org/2005/Atom"/>'
+	utilityXMLStr = b'<utility_events version="1.42" xmlns:atom="http://www.w3.org/2005/Atom"/>'
 
 	response = HttpResponse.okResponse()
 
@@ -672,29 +724,34 @@ def urlSystemsroot_cause(request):
 	return makeSimpleXMLResponse()
 addUrl("/systems/(?P<serialNumber>.+)/root_cause$", urlSystemsroot_cause)
 
-def urlSystemsequipment_events(request):
-
-	xmlStringData = request.bodyDict["data"][0]
-	_LOGGER.debug("  equipment_events={}".format(xmlStringData))
-
-	return makeSimpleXMLResponse()
-addUrl("/systems/(?P<serialNumber>.+)/equipment_events$", urlSystemsequipment_events)
-
+# Add an energy or history upload to its store.  The thermostat still gets
+# its response, and Home Assistant the upload, if it can't be read.
+def addTimeSeriesUpload(store, request):
+	try:
+		store.addUpload(time.time(), request.xmlDocument().root)
+	except SyntaxError as exception:
+		_LOGGER.warning("Unable to read {} - {}".format(request.path, exception))
 
+@withStateLock
 def urlSystemsEnergy(request):
 
 	xmlStringData = request.bodyDict["data"][0]
 	_LOGGER.debug("  Energy={}".format(xmlStringData))
 
+	addTimeSeriesUpload(energyStore, request)
+
 	return makeSimpleXMLResponse()
 addUrl("/systems/(?P<serialNumber>.+)/energy$", urlSystemsEnergy)
 
 
+@withStateLock
 def urlSystemsHistory(request):
 
 	xmlStringData = request.bodyDict["data"][0]
 	_LOGGER.debug("  History={}".format(xmlStringData))
 
+	addTimeSeriesUpload(historyStore, request)
+
 	return makeSimpleXMLResponse()
 addUrl("/systems/(?P<serialNumber>.+)/history$", urlSystemsHistory)
 
@@ -721,11 +778,9 @@ def makeSimpleXMLResponse():
 
 def urlSystemsNotifications(request):
 
-	xmlStringData = request.bodyDict["data"][0]
-
 	_LOGGER.debug("  SN={}".format(request.pathDict["serialNumber"]))
 
-	xmlRoot = ET.fromstring(xmlStringData)
+	xmlRoot = request.xmlDocument().root
 
 	if xmlRoot.attrib['version'] != "1.7":
 		_LOGGER.warning("Unexpected client version: %s" % (xmlRoot.attrib['version'], ))
@@ -748,12 +803,12 @@ addUrl("/systems/(?P<serialNumber>.+)/notifications$", urlSystemsNotifications)
 
 
 # The device is requesting an updated configuration from us.
-def makeSystemsConfigResponse(xmlBodyStr):
+def makeSystemsConfigResponse(xmlBody):
 
 	response = HttpResponse.okResponse()
 
 	response.headers.append(("Cache-Control", "private"))
-	response.addContentLengthHeader(len(xmlBodyStr))
+	response.addContentLengthHeader(bodyLength(xmlBody))
 	response.addContentTypeHeader("application/xml; charset=utf-8")
 	response.headers.append(("Etag", "\"00de388808d7b88cd8f146a1\""))
 	response.addServerHeader()
@@ -761,7 +816,7 @@ def makeSystemsConfigResponse(xmlBodyStr):
 	response.addAccessControlHeader()
 	response.addDateHeader()
 
-	response.body = xmlBodyStr
+	response.body = xmlBody
 
 	return response
 
@@ -769,98 +824,40 @@ def makeSystemsConfigResponse(xmlBodyStr):
 def urlSystemsConfig(request):
 	global activeThermostatId
 	global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-	global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
 	serialNumber = request.pathDict["serialNumber"]
 
 	_LOGGER.debug("  SN={}".format(serialNumber))
 
-	# Can't return config unless we know what the device is already using
-	if configFromDevice == None:
-		return makeSystemsConfigResponse("")
-
-	newConfigRoot = copy.deepcopy(configFromDevice)
+	with stateLock:
+		# Can't return config unless we know what the device is already using
+		if configFromDevice == None:
+			return makeSystemsConfigResponse(b"")
 
-	newConfigRoot.set("version", "1.42")
-	newConfigRoot.set("xmlns:atom", "http://www.w3.org/2005/Atom")
+		template = configTemplates.get(serialNumber)
+		if not template:
+			template = ConfigTemplate(configFromDevice, serialNumber)
+			if len(configTemplates) >= MAX_CONFIG_TEMPLATES:
+				configTemplates.clear()
+			configTemplates[serialNumber] = template
 
-	tsEl = ET.Element("timestamp")
-	tsEl.text = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-	newConfigRoot.insert(0, tsEl)
-
-	atomLink = ET.Element("atom:link")
-	atomLink.set("rel", "http://www.api.ing.carrier.com/rels/system")
-	atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + serialNumber)
-	newConfigRoot.insert(0, atomLink)
+		# The changes of every zone go out together
+		(patches, versions) = pendingChanges.patches()
 
-	atomLink = ET.Element("atom:link")
-	atomLink.set("rel", "self")
-	atomLink.set("href", "http://www.api.ing.carrier.com/systems/" + serialNumber + "/config")
-	newConfigRoot.insert(0, atomLink)
+	# The template isn't changed once built, so the response is built without
+	# the lock.  Changes submitted meanwhile have a newer version and stay
+	# pending.
+	(xmlBody, patchedZoneIds) = template.render(patches, datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
 
-	for zone in newConfigRoot.findall("./zones/zone"):
+	with stateLock:
+		pendingChanges.acknowledge({zoneId: versions[zoneId] for zoneId in patchedZoneIds})
+		pendingChanges.discard({zoneId: version for (zoneId, version) in versions.items() if zoneId not in patchedZoneIds},
+			"the configuration has nothing to patch")
 
-		if zone.find("./enabled").text != "on":
-			continue
-
-		if zone.attrib['id'] != "1":
-			continue
-
-		if pendingActionHold:
-			if pendingActionActivity:
-				zone.find("./hold").text = "on"
-				zone.find("./holdActivity").text = pendingActionActivity
-				zone.find("./otmr").text = pendingActionUntil
-			else:
-				zone.find("./hold").text = "off"
-				zone.find("./holdActivity").text = ""
-				zone.find("./otmr").text = ""
-
-			if pendingActionActivity == "manual":
-				for activity in zone.findall("./activities/activity"):
-
-					if activity.attrib['id'] != "manual":
-						continue
-
-					activity.find("./htsp").text = str(pendingActionTemp)
-
-	pendingActionHold = None
-	pendingActionActivity = None
-	pendingActionUntil = None
-	pendingActionTemp = None
-
-	xmlDataStr = ET.tostring(newConfigRoot, "utf-8")
-	return makeSystemsConfigResponse(xmlDataStr)
+	return makeSystemsConfigResponse(xmlBody)
 addUrl("/systems/(?P<serialNumber>.+)/config$", urlSystemsConfig)
 
 
 
-# The device is telling us about root causes of something?
-def makeSystemsRootCauseResponse():
-
-	response = HttpResponse.errorResponse(404, "Not found")
-	#response = HttpResponse.okResponse()
-
-	#response.headers.append(("Cache-Control", "private"))
-	#response.addContentTypeHeader("application/xml; charset=utf-8")
-	#response.addServerHeader()
-	#response.addRequestContextHeader()
-	#response.addAccessControlHeader()
-	#response.addDateHeader()
-	#response.addContentLengthHeader(0)
-
-	return response
-
-
-def urlSystemsRootCause(request):
-
-	xmlStringData = request.bodyDict["data"][0]
-
-	_LOGGER.debug("Root Cause {}".format(xmlStringData))
-
-	return makeSystemsRootCauseResponse()
-addUrl("/systems/(?P<serialNumber>.+)/root_cause$", urlSystemsRootCause)
-
-
 # The device is telling us about its configuration.  It appears that just about
 # anything that can be controlled on the touch screen will be included here,
 # including the full activity schedule, and what devices are attached (gas, A/C,
@@ -879,72 +876,76 @@ def makeSystemsResponse():
 
 	return response
 
-def urlsystems(request):
-	global activeThermostatId
-	global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
-	global pendingActionHold, pendingActionActivity, pendingActionTemp, pendingActionUntil
-	serialNumber = request.pathDict["serialNumber"]
-	xmlStringData = request.bodyDict["data"][0]
-
-	_LOGGER.debug("  SN={}".format(serialNumber))
-	_LOGGER.debug("  body={}".format(xmlStringData))
-
-	xmlRoot = ET.fromstring(xmlStringData)
-
-	if xmlRoot.attrib['version'] != "1.7":
-		_LOGGER.warning("Unexpected client version: %s" % (xmlRoot.attrib['version'], ))
-		return makeSystemsResponse()
-
-	currentMode = xmlRoot.find("./config/mode").text
-	tempUnits = xmlRoot.find("./config/cfgem").text
-
-	activeThermostatId = serialNumber
-	configFromDevice = xmlRoot.find("./config")
-	
-	configZones = {}
-
-	for zone in xmlRoot.findall("./config/zones/zone"):
+# Reads the configuration in one streaming pass.  Only <config> is kept, to
+# send back with our changes in the .../config response, and the activities
+# and schedule of each zone are copied into newConfigZones as they are read.
+def makeConfigExtractor(newConfigZones):
 
+	def zoneConfig(zone):
 		zoneId = zone.attrib['id']
+		if zoneId not in newConfigZones:
+			newConfigZones[zoneId] = ZoneConfig()
+		return newConfigZones[zoneId]
 
-		configZoneObj = {
-			"activities": {},
-			"schedule": {}
-		}
-
-		for activity in zone.findall("./activities/activity"):
+	def onZone(zone, ancestors):
+		zoneConfig(zone)
 
-			activityId = activity.attrib['id']
+	def onActivity(activity, ancestors):
+		zoneConfig(ancestors[-2]).activities[activity.attrib['id']] = Activity.fromElement(activity)
 
-			activityObj = {
-				"heatTo": activity.find("./htsp").text,
-				"coolTo": activity.find("./clsp").text,
-				"fan": activity.find("./fan").text
-			}
+	def onDay(day, ancestors):
+		zoneConfig(ancestors[-2]).schedule.setdefault(day.attrib['id'], {})
 
-			configZoneObj["activities"][activityId] = activityObj
+	def onPeriod(period, ancestors):
+		periodList = zoneConfig(ancestors[-3]).schedule.setdefault(ancestors[-1].attrib['id'], {})
+		periodList[int(period.attrib['id'])] = Period.fromElement(period)
 
-		for day in zone.findall("./program/day"):
+	extractor = XmlExtractor()
+	extractor.keep("config")
+	extractor.onElement("config/zones/zone", onZone)
+	extractor.onElement("config/zones/zone/activities/activity", onActivity)
+	extractor.onElement("config/zones/zone/program/day", onDay)
+	extractor.onElement("config/zones/zone/program/day/period", onPeriod)
 
-			dayId = day.attrib['id']
+	return extractor
 
-			periodList = {}
+@withStateLock
+def urlsystems(request):
+	global activeThermostatId
+	global configFromDevice, systemstatus, statusZones, configZones, currentMode, tempUnits
+	global enabledZoneIds
+	serialNumber = request.pathDict["serialNumber"]
+	xmlStringData = request.bodyDict["data"][0]
 
-			for period in day.findall("./period"):
+	_LOGGER.debug("  SN={}".format(serialNumber))
+	_LOGGER.debug("  body={}".format(xmlStringData))
 
-				periodId = int(period.attrib['id'])
+	document = request.xmlDocument()
+	newConfigZones = {}
+	kept = document.extract(makeConfigExtractor(newConfigZones))
 
-				periodObj = {
-					"activity": period.find("./activity").text,
-					"time": period.find("./time").text,
-					"enabled": period.find("./enabled").text == "on"
-				}
+	if document.rootAttrib['version'] != "1.7":
+		_LOGGER.warning("Unexpected client version: %s" % (document.rootAttrib['version'], ))
+		return makeSystemsResponse()
 
-				periodList[periodId] = periodObj
+	config = kept["config"][0]
 
-			configZoneObj["schedule"][dayId] = periodList
+	currentMode = config.find("./mode").text
+	tempUnits = config.find("./cfgem").text
 
-		configZones[zoneId] = configZoneObj
+	activeThermostatId = serialNumber
+	configFromDevice = config
+	configTemplates.clear()
+
+	for zoneConfig in newConfigZones.values():
+		zoneConfig.weeklySchedule = WeeklySchedule.fromRecords(zoneConfig.schedule)
+	configZones = newConfigZones
+
+	# Changes submitted before the configuration was read, or for zones that
+	# have since been disabled, can't be sent
+	enabledZoneIds = {zone.attrib.get('id') for zone in config.findall("./zones/zone") if zone.findtext("./enabled") == "on"}
+	pendingChanges.discard({zoneId: version for (zoneId, version) in pendingChanges.versions().items() if zoneId not in enabledZoneIds},
+		"it is not enabled")
 
 
 	return makeSystemsResponse()
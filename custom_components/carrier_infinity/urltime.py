@@ -7,29 +7,42 @@
 from datetime import datetime
 
 from .httpobj import HttpRequest, HttpResponse, addUrl
+from .responsecache import responseCache
 
-def urlTime(request):
+TIME_BODY_START = b'<time version="1.42" xmlns:atom="http://www.w3.org/2005/Atom"><atom:link rel="self" href="http://www.api.ing.carrier.com/time/"/><utc>'
+TIME_BODY_END = b'</utc></time>'
+
+def makeTimeBody():
 
     utc = datetime.utcnow()
     strDate = utc.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    timeXmlStr = '<time version="1.42" xmlns:atom="http://www.w3.org/2005/Atom"><atom:link rel="self" href="http://www.api.ing.carrier.com/time/"/><utc>'
-    timeXmlStr += strDate
-    timeXmlStr += '</utc></time>'
+    return TIME_BODY_START + strDate.encode("utf-8") + TIME_BODY_END
+
+
+def makeTimeResponse():
+
+    timeXmlBytes = makeTimeBody()
 
     response = HttpResponse.okResponse()
 
     response.headers.append(("Cache-Control", "private"))
-    response.addContentLengthHeader(len(timeXmlStr))
+    response.addContentLengthHeader(len(timeXmlBytes))
     response.addContentTypeHeader("application/xml; charset=utf-8")
     response.addServerHeader()
     response.addRequestContextHeader()
     response.addAccessControlHeader()
     response.addDateHeader()
 
-    response.body = timeXmlStr
+    response.body = timeXmlBytes
 
     return response
 
 
+# The body is always the same length, so only the time in it is replaced.
+def urlTime(request):
+
+    return responseCache.get("time", makeTimeResponse).makeResponse(makeTimeBody())
+
+
 addUrl("/time/", urlTime)
@@ -5,45 +5,176 @@
 # It is also logging the XML content so we can learn what the format of
 # responses is.
 #
+# Forecasts are cached per postal code so the thermostat isn't held up by
+# Carrier's server.  A forecast younger than the TTL is served as is.  An older
+# one is still served straight away while a background thread fetches a new
+# one, up until it is maxStale old, after which the thermostat waits for a
+# fetch.  So if Carrier's server is slow or down the last forecast keeps being
+# served for up to maxStale.
+#
+# Forecasts are fetched with a shared UpstreamClient, see upstream.py.
+#
 
 import logging
+import threading
+import time
 import requests
 
 from .httpobj import HttpRequest, HttpResponse, addUrl
+from .responsecache import CachedResponse
+from .upstream import UpstreamClient
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
-def urlWeather(request):
+# Seconds a forecast is fresh for, and the most it can be served stale
+DEFAULT_WEATHER_TTL = 15 * 60
+DEFAULT_WEATHER_MAX_STALE = 6 * 60 * 60
 
-    postalCode = request.pathDict['postalCode']
+# Most postal codes that are cached
+MAX_WEATHER_ENTRIES = 8
 
-    host_url = "http://{}/weather/{}/forecast".format(request.host, postalCode)
 
-    cliResp = requests.request(
-        method=request.method,
-        url=host_url,
-        headers={key: value for (key, value) in request.headers if key != 'Host'},
-        data=request.body,
-        allow_redirects=False)
+class WeatherEntry:
 
-    if cliResp.status_code != 200:
-        return HttpResponse.errorResponse(cliResp.status_code, "Message")
+    def __init__(self, fetchFunc):
+        # Called to fetch the forecast, returns an HttpResponse
+        self.fetchFunc = fetchFunc
+        # CachedResponse of the last forecast fetched, and when (monotonic)
+        self.response = None
+        self.fetchedAt = None
+        # Whether a background refresh is running
+        self.refreshing = False
+
+
+class WeatherCache:
+
+    def __init__(self, ttl=DEFAULT_WEATHER_TTL, maxStale=DEFAULT_WEATHER_MAX_STALE):
+        self.ttl = ttl
+        self.maxStale = maxStale
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    # Returns an HttpResponse with the forecast for key, using fetchFunc()
+    # to get it from Carrier's server if needed.
+    def get(self, key, fetchFunc):
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= MAX_WEATHER_ENTRIES:
+                    del self.entries[next(iter(self.entries))]
+                entry = WeatherEntry(fetchFunc)
+                self.entries[key] = entry
+            else:
+                # Refresh with the thermostat's latest request
+                entry.fetchFunc = fetchFunc
+
+            cached = entry.response
+            age = time.monotonic() - entry.fetchedAt if cached else None
+
+            startRefresh = False
+            if cached and age >= self.ttl and age < self.maxStale and not entry.refreshing:
+                entry.refreshing = True
+                startRefresh = True
+
+        if startRefresh:
+            threading.Thread(target=self.refresh, args=(key, entry), daemon=True).start()
+
+        if cached and age < self.maxStale:
+            return cached.makeResponse()
+
+        try:
+            return self.fetch(entry)
+        except requests.RequestException as exception:
+            _LOGGER.warning("Unable to fetch weather for {} - {}".format(key, exception))
+            return HttpResponse.errorResponse(503, "Weather unavailable")
+
+    # Fetch the forecast and cache it if it was fetched OK
+    def fetch(self, entry):
+
+        response = entry.fetchFunc()
+
+        if response.code == 200:
+            cached = CachedResponse(response)
+            with self.lock:
+                entry.response = cached
+                entry.fetchedAt = time.monotonic()
+
+        return response
+
+    def refresh(self, key, entry):
+        try:
+            response = self.fetch(entry)
+            if response.code != 200:
+                _LOGGER.warning("Weather refresh for {} returned {}".format(key, response.code))
+        except requests.RequestException as exception:
+            _LOGGER.warning("Unable to refresh weather for {} - {}".format(key, exception))
+        finally:
+            entry.refreshing = False
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
 
-    _LOGGER.info(cliResp.text)
+
+weatherCache = WeatherCache()
+weatherClient = UpstreamClient()
+
+
+# Called with the platform configuration
+def configureWeatherCache(ttl, maxStale):
+    weatherCache.ttl = ttl
+    weatherCache.maxStale = max(ttl, maxStale)
+
+
+def makeWeatherResponse(body):
 
     response = HttpResponse.okResponse()
 
     response.headers.append(("Cache-Control", "private"))
-    response.addContentLengthHeader(len(cliResp.text))
+    response.addContentLengthHeader(len(body))
     response.addContentTypeHeader("application/xml; charset=utf-8")
     response.addServerHeader()
     response.addRequestContextHeader()
     response.addAccessControlHeader()
     response.addDateHeader()
 
-    response.body = cliResp.text
+    response.body = body
 
     return response
 
 
+def fetchWeather(method, url, headers, data):
+
+    cliResp = weatherClient.request(
+        method,
+        url,
+        headers=headers,
+        data=data,
+        allow_redirects=False)
+
+    if cliResp.status_code != 200:
+        return HttpResponse.errorResponse(cliResp.status_code, "Message")
+
+    _LOGGER.info(cliResp.text)
+
+    return makeWeatherResponse(cliResp.content)
+
+
+def urlWeather(request):
+
+    postalCode = request.pathDict['postalCode']
+
+    host_url = "http://{}/weather/{}/forecast".format(request.host, postalCode)
+    headers = {key: value for (key, value) in request.headers if key != 'Host'}
+
+    fetchFunc = lambda: fetchWeather(request.method, host_url, headers, request.body)
+
+    # Only forecasts are cached
+    if request.method != HttpRequest.METHOD_GET:
+        return fetchFunc()
+
+    return weatherCache.get((request.host, postalCode), fetchFunc)
+
+
 addUrl("/weather/(?P<postalCode>.+)/forecast$", urlWeather)
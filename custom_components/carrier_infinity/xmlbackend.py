@@ -0,0 +1,157 @@
+#
+# The XML library used to read the thermostat's uploads.
+#
+# Uploads are parsed with ElementTree from the standard library, or with lxml
+# if that is chosen with useBackend() and installed.  Both give elements with
+# the same interface (tag, attrib, text, tail, find(), findall(), findtext()
+# and iterating over the children), so the rest of the component doesn't need
+# to know which one it has.  Comments and processing instructions are dropped
+# by lxml to match ElementTree.
+#
+# lxml doesn't resolve entities or fetch anything over the network.  The
+# thermostat has no reason to send a DTD, so a reference to an entity one
+# declares is dropped, keeping the text around it, rather than expanded as
+# ElementTree would.
+#
+# ElementTree is the default, from the figures of benchmarks/bench_xmlbackend.py
+# for each kind of upload.  lxml parses a whole document in about half the
+# time, but most of the time spent on an upload is in Python looking at each
+# element (see XmlDocument), which is no faster with lxml's elements and
+# sometimes slower, and serializing them is slower since they are copied
+# first.  Auto picks lxml when it is installed.
+#
+# Everything sent to the thermostat is serialized by ElementTree, since lxml
+# writes some things differently (such as "<a/>" rather than "<a />"), so the
+# response bytes are the same whichever parser is in use.  serialize() and
+# copyTree() turn lxml elements into ElementTree ones first.  Responses built
+# from scratch use ElementTree's Element directly.
+#
+
+import copy
+import logging
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxmlEtree
+except ImportError:
+    lxmlEtree = None
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+BACKEND_AUTO = "auto"
+BACKEND_LXML = "lxml"
+BACKEND_ETREE = "etree"
+
+BACKENDS = [BACKEND_AUTO, BACKEND_LXML, BACKEND_ETREE]
+
+# The parser in use, either BACKEND_LXML or BACKEND_ETREE
+backendName = BACKEND_ETREE
+
+
+# Choose the parser, one of BACKENDS.  Auto uses lxml if it is installed.
+def useBackend(name):
+    global backendName
+
+    if name == BACKEND_AUTO:
+        name = BACKEND_LXML if lxmlEtree is not None else BACKEND_ETREE
+    elif name == BACKEND_LXML and lxmlEtree is None:
+        _LOGGER.warning("lxml is not installed, using ElementTree to parse XML")
+        name = BACKEND_ETREE
+    elif name not in BACKENDS:
+        raise ValueError("Unknown XML backend {}".format(name))
+
+    backendName = name
+
+
+def makeLxmlParser(parserClass, **kwargs):
+    # lxml won't take a str with an encoding declaration, so it is always
+    # given UTF-8 bytes and told to ignore the declaration.  Parsers can't be
+    # shared between threads so a new one is made each time.
+    return parserClass(remove_comments=True, remove_pis=True, encoding="utf-8", resolve_entities=False, no_network=True, **kwargs)
+
+
+# An unresolved entity reference is kept by lxml as a node among the
+# elements, which only a document with a DTD can have.
+def mayHaveEntities(xmlString):
+    return "<!DOCTYPE" in xmlString
+
+
+# Drop entity references below element, keeping the text after them
+def dropEntities(element):
+    lxmlEtree.strip_elements(element, lxmlEtree.Entity, with_tail=False)
+
+
+# Parse a whole document, returning its root element
+def fromstring(xmlString):
+    if backendName == BACKEND_LXML:
+        root = lxmlEtree.fromstring(xmlString.encode("utf-8"), makeLxmlParser(lxmlEtree.XMLParser))
+        if mayHaveEntities(xmlString):
+            dropEntities(root)
+        return root
+    return ET.fromstring(xmlString)
+
+
+# Parse a document a piece at a time, generating (event, item) for the events
+# named, as with XMLPullParser.read_events().
+def parseEvents(xmlString, events, chunkSize):
+
+    if backendName == BACKEND_LXML:
+        parser = makeLxmlParser(lxmlEtree.XMLPullParser, events=events)
+        data = xmlString.encode("utf-8")
+        # An element's entity references are dropped once it has ended, and
+        # any left when the whole document has been read
+        if mayHaveEntities(xmlString):
+            yield from dropEntitiesAtEnd(parser, data, chunkSize)
+            return
+    else:
+        parser = ET.XMLPullParser(events=events)
+        data = xmlString
+
+    for start in range(0, len(data), chunkSize):
+        parser.feed(data[start:start + chunkSize])
+        yield from parser.read_events()
+
+    parser.close()
+    yield from parser.read_events()
+
+
+def dropEntitiesAtEnd(parser, data, chunkSize):
+
+    for start in range(0, len(data), chunkSize):
+        parser.feed(data[start:start + chunkSize])
+        for (event, item) in parser.read_events():
+            if event == "end":
+                dropEntities(item)
+            yield (event, item)
+
+    root = parser.close()
+    for (event, item) in parser.read_events():
+        if event == "end":
+            dropEntities(item)
+        yield (event, item)
+    dropEntities(root)
+
+
+# Whether element is an ElementTree element rather than an lxml one
+def isStdlibElement(element):
+    return isinstance(element, ET.Element)
+
+
+# A copy of element and everything below it as ElementTree elements
+def copyTree(element):
+
+    if isStdlibElement(element):
+        return copy.deepcopy(element)
+
+    newElement = ET.Element(element.tag, dict(element.attrib))
+    newElement.text = element.text
+    newElement.tail = element.tail
+    newElement.extend([copyTree(child) for child in element])
+    return newElement
+
+
+# The element as UTF-8 bytes, the same as ET.tostring(element, "utf-8")
+def serialize(element):
+    if not isStdlibElement(element):
+        element = copyTree(element)
+    return ET.tostring(element, "utf-8")
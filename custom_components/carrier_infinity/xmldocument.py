@@ -0,0 +1,241 @@
+#
+# XML uploaded by the thermostat.
+#
+# Each /systems POST carries an XML document in its "data" form field.  The
+# same XmlDocument is used by the URL handlers and passed on to Home
+# Assistant, so the XML is only read once.  Home Assistant keeps the data as
+# nested dicts in the layout xmltodict.parse() gives, which asDict() builds.
+#
+# There are two ways to read it:
+#
+#  - root, the whole document as an element tree, parsed the first time it
+#    is used.  asDict() is then built from the tree.
+#  - extract(), a single streaming pass that calls an XmlExtractor's
+#    callbacks as each element it is interested in is read, keeps only the
+#    subtrees it asks for and frees everything else as it goes.  The dict
+#    for Home Assistant is built during the same pass.  asDict() also uses
+#    this when nothing has read the document yet, so uploads that the URL
+#    handlers don't look at (such as energy and history) are never held
+#    as a whole tree.
+#
+# The parsing is done by xmlbackend, so the elements may be lxml's or
+# ElementTree's.
+#
+
+from . import xmlbackend
+
+# How much of the document to give the parser at a time when streaming
+STREAM_CHUNK_SIZE = 8192
+
+
+# Says what extract() should pull out of a document.  Paths are the tags
+# below the root element joined by "/", such as "config/zones/zone".
+class XmlExtractor:
+
+    def __init__(self):
+        self.callbacks = {}
+        self.keepPaths = set()
+
+    # Call func(element, ancestors) each time an element at path has been
+    # read, where ancestors is the list of its parent elements starting from
+    # the root.  The element's children are freed after the call unless it is
+    # kept, so anything needed from it must be copied out.
+    def onElement(self, path, func):
+        self.callbacks[tuple(path.split("/"))] = func
+
+    # Keep the elements at path, and everything below them, after reading.
+    def keep(self, path):
+        self.keepPaths.add(tuple(path.split("/")))
+
+
+class XmlDocument:
+
+    def __init__(self, xmlString):
+        self.xmlString = xmlString
+        # Map of namespace URI to the prefix used in the document
+        self.prefixes = {}
+        # Map of element to the (prefix, URI) namespaces it declared
+        self.declarations = {}
+        # The root element's tag and attributes, whichever way it was read
+        self.rootTag = None
+        self.rootAttrib = None
+        self.tree = None
+        self.dictView = None
+
+    # The whole document as an element tree
+    @property
+    def root(self):
+        if self.tree is None:
+            # The parser replaces namespace prefixes with the URI, so they
+            # need to be recorded to give the same names as xmltodict.  The
+            # thermostat doesn't normally send any, so skip that when there
+            # can't be.
+            if "xmlns" in self.xmlString:
+                self.tree = self.parseWithNamespaces(self.xmlString)
+            else:
+                self.tree = xmlbackend.fromstring(self.xmlString)
+            self.rootTag = self.tree.tag
+            self.rootAttrib = self.tree.attrib
+        return self.tree
+
+    def parseWithNamespaces(self, xmlString):
+
+        pending = []
+        root = None
+
+        for (event, item) in xmlbackend.parseEvents(xmlString, ("start-ns", "start"), STREAM_CHUNK_SIZE):
+            if event == "start-ns":
+                pending.append(item)
+                self.prefixes.setdefault(item[1], item[0])
+                continue
+            if root is None:
+                root = item
+            if pending:
+                self.declarations[item] = pending
+                pending = []
+
+        return root
+
+    # The document as nested dicts, the same as
+    # xmltodict.parse(xmlString, dict_constructor=dict).
+    def asDict(self):
+        if self.dictView is None:
+            if self.tree is not None:
+                self.dictView = {self.qualifiedName(self.tree.tag): self.elementToDict(self.tree)}
+            else:
+                self.extract(XmlExtractor())
+        return self.dictView
+
+    # Read the document in one pass using an XmlExtractor.  Returns a map of
+    # each kept path to the list of elements found there.
+    def extract(self, extractor):
+
+        buildDict = self.dictView is None
+        callbacks = extractor.callbacks
+        keepPaths = extractor.keepPaths
+
+        # Elements that have been started but not ended, and for each the
+        # tuple of tags from below the root down to it.
+        ancestors = []
+        paths = []
+        # The (name, dict value) of each finished child of the open elements
+        childItems = []
+        pendingNs = []
+        # Length of ancestors when a kept element was started
+        keepDepth = 0
+        kept = {}
+        rootValue = None
+
+        for (event, item) in self.streamEvents():
+
+            if event == "start-ns":
+                pendingNs.append(item)
+                self.prefixes.setdefault(item[1], item[0])
+                continue
+
+            if event == "start":
+                if pendingNs:
+                    self.declarations[item] = pendingNs
+                    pendingNs = []
+                if ancestors:
+                    path = paths[-1] + (item.tag, )
+                    if not keepDepth and path in keepPaths:
+                        keepDepth = len(ancestors) + 1
+                else:
+                    path = ()
+                    self.rootTag = item.tag
+                    self.rootAttrib = dict(item.attrib)
+                ancestors.append(item)
+                paths.append(path)
+                childItems.append([])
+                continue
+
+            # The end of an element
+            ancestors.pop()
+            path = paths.pop()
+            items = childItems.pop()
+
+            if path in callbacks:
+                callbacks[path](item, ancestors)
+
+            if buildDict:
+                value = self.elementValue(item, items)
+                if childItems:
+                    childItems[-1].append((self.qualifiedName(item.tag), value))
+                else:
+                    rootValue = value
+
+            if keepDepth == len(ancestors) + 1:
+                kept.setdefault("/".join(path), []).append(item)
+                keepDepth = 0
+            elif not keepDepth:
+                # The element stays in its parent, empty, since the parent
+                # needs its tail text.  The parser may already have set that
+                # as it reads ahead of the events.
+                tail = item.tail
+                item.clear()
+                item.tail = tail
+                if self.declarations:
+                    self.declarations.pop(item, None)
+
+        if buildDict:
+            self.dictView = {self.qualifiedName(self.rootTag): rootValue}
+
+        return kept
+
+    # Parser events for the document, feeding it to the parser a piece at a
+    # time so the parser never holds more than that ahead of extract().
+    def streamEvents(self):
+        return xmlbackend.parseEvents(self.xmlString, ("start-ns", "start", "end"), STREAM_CHUNK_SIZE)
+
+    # Turn "{uri}name" back into "prefix:name"
+    def qualifiedName(self, name):
+        if name[0] != "{":
+            return name
+
+        (uri, localName) = name[1:].split("}", 1)
+        prefix = self.prefixes.get(uri)
+        if prefix:
+            return prefix + ":" + localName
+        return localName
+
+    def elementToDict(self, element):
+        return self.elementValue(element, [(self.qualifiedName(child.tag), self.elementToDict(child)) for child in element])
+
+    # The dict value of an element, given the (name, value) of its children
+    def elementValue(self, element, items):
+
+        text = element.text
+        if len(element):
+            text = "".join([text or ""] + [child.tail or "" for child in element])
+        # Whitespace-only text is dropped, like xmltodict does
+        text = text.strip() or None if text else None
+
+        declarations = self.declarations.get(element)
+        if not element.attrib and not items and not declarations:
+            return text
+
+        value = {}
+
+        if declarations:
+            for (prefix, uri) in declarations:
+                if prefix:
+                    value["@xmlns:" + prefix] = uri
+                else:
+                    value["@xmlns"] = uri
+
+        for (name, attrValue) in element.attrib.items():
+            value["@" + self.qualifiedName(name)] = attrValue
+
+        for (key, childValue) in items:
+            if key not in value:
+                value[key] = childValue
+            elif isinstance(value[key], list):
+                value[key].append(childValue)
+            else:
+                value[key] = [value[key], childValue]
+
+        if text:
+            value["#text"] = text
+
+        return value
@@ -0,0 +1,255 @@
+#
+# Which zones changed between uploads from the thermostat.
+#
+# The thermostat uploads its status about every 30 seconds and its
+# configuration whenever it changes, and most status uploads are the same as
+# the one before.  ZoneChangeTracker compares each upload, zone by zone, with
+# the previous one of the same kind so that Home Assistant only refreshes the
+# zones that are different.
+#
+# A diff is a map of the path of each value that changed, as the keys (or list
+# indexes) below the zone joined by "/", to its (old, new) values.  Values
+# outside the zones, such as the filter levels or the system mode, apply to
+# every zone, so a change to one of them is in every zone's diff with a path
+# starting with "system/".
+#
+# The thermostat's local time is ignored, since it changes with every upload,
+# but the zone's scheduled activity changes with it.  Each zone's entity gives
+# the local time its next schedule period starts with refreshAt(), and the
+# zone is refreshed with the first status upload at or after then.
+#
+# Each zone to refresh is announced to Home Assistant with a ZoneUpdate.
+#
+# ZoneSnapshot indexes the latest status and config by zone id, and the config
+# activities by (zone id, activity id), so each zone's entity finds its own
+# part of an upload without scanning the others.  The status' local time is
+# parsed once for all of the zones.  A new snapshot is made for
+# each upload, re-indexing only the kind uploaded, and is never changed after
+# it is made, so a reader always sees a status and config that go together.
+#
+# The uploads are the dicts from XmlDocument.asDict().  A new dict is built for
+# every upload, so the previous one is kept as is rather than copied.
+#
+
+from types import MappingProxyType
+import time
+
+from .schedule import asList, parseLocalTime
+
+# Values outside the zones that change on every upload without changing
+# anything shown for a zone
+IGNORED_FIELDS = ("localTime", "timestamp")
+
+# Refresh a zone at least this often (in seconds) even if it hasn't changed,
+# since the entity also shows the thermostat's local time.
+MAX_REFRESH_INTERVAL = 300
+
+# Stands in for a value that wasn't in one of the uploads being compared
+ABSENT = None
+
+
+# Add the differences between old and new to diff, with paths under prefix
+def diffValues(old, new, prefix, diff):
+
+    if old is new or old == new:
+        return
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old.keys() | new.keys():
+            diffValues(old.get(key, ABSENT), new.get(key, ABSENT), prefix + key + "/", diff)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for (i, (oldItem, newItem)) in enumerate(zip(old, new)):
+            diffValues(oldItem, newItem, prefix + str(i) + "/", diff)
+    else:
+        diff[prefix[:-1]] = (old, new)
+
+
+# The zones of an upload as a map of zone id to the zone's dict
+def zonesById(data):
+
+    zones = data.get("zones") if isinstance(data, dict) else None
+    if not isinstance(zones, dict):
+        return {}
+
+    zoneList = zones.get("zone")
+    if isinstance(zoneList, dict):
+        zoneList = [zoneList]
+    elif not isinstance(zoneList, list):
+        return {}
+
+    return {zone["@id"]: zone for zone in zoneList if isinstance(zone, dict) and "@id" in zone}
+
+
+# Everything in an upload apart from its zones and the ignored fields
+def systemValues(data):
+    if not isinstance(data, dict):
+        return {}
+    return {key: value for (key, value) in data.items() if key != "zones" and key not in IGNORED_FIELDS}
+
+
+# A zone that needs refreshing after an upload of kind ("status" or "config").
+# diff is what changed, empty if the zone is only being refreshed because it
+# hasn't been for a while.
+class ZoneUpdate:
+
+    __slots__ = ("zoneId", "kind", "diff", "generation")
+
+    def __init__(self, zoneId, kind, diff, generation):
+        self.zoneId = zoneId
+        self.kind = kind
+        self.diff = diff
+        self.generation = generation
+
+    def __repr__(self):
+        return "ZoneUpdate({}, {}, {})".format(self.zoneId, self.kind, list(self.diff))
+
+
+class ZoneSnapshot:
+
+    __slots__ = ("status", "config", "statusZones", "localTime", "configZones", "activities")
+
+    # statusIndex and configIndex are those of another snapshot with the same
+    # status or config, (statusZones, localTime) and (configZones, activities)
+    def __init__(self, status, config, statusIndex=None, configIndex=None):
+
+        if statusIndex is not None:
+            (statusZones, localTime) = statusIndex
+        else:
+            statusZones = MappingProxyType(zonesById(status))
+            localTime = None
+            if isinstance(status, dict) and status.get("localTime"):
+                try:
+                    localTime = parseLocalTime(status["localTime"])
+                except ValueError:
+                    pass
+
+        if configIndex is not None:
+            (configZones, activities) = configIndex
+        else:
+            configZones = MappingProxyType(zonesById(config))
+            activities = {}
+            for (zoneId, zone) in configZones.items():
+                zoneActivities = zone.get("activities")
+                if isinstance(zoneActivities, dict):
+                    for activity in asList(zoneActivities.get("activity")):
+                        activities[(zoneId, activity.get("@id"))] = activity
+            activities = MappingProxyType(activities)
+
+        # The whole uploads, as from XmlDocument.asDict()
+        object.__setattr__(self, "status", status)
+        object.__setattr__(self, "config", config)
+        # Read-only maps of zone id to the zone's dict
+        object.__setattr__(self, "statusZones", statusZones)
+        object.__setattr__(self, "configZones", configZones)
+        # The status' localTime as a datetime, or None
+        object.__setattr__(self, "localTime", localTime)
+        # Read-only map of (zone id, activity id) to the activity's dict
+        object.__setattr__(self, "activities", activities)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ZoneSnapshot is read-only")
+
+    # A new snapshot with data, an upload of kind ("status" or "config"),
+    # sharing the index of the other kind with this one
+    def replace(self, kind, data):
+        if kind == "status":
+            return ZoneSnapshot(data, self.config, configIndex=(self.configZones, self.activities))
+        return ZoneSnapshot(self.status, data, statusIndex=(self.statusZones, self.localTime))
+
+    def zoneStatus(self, zoneId):
+        return self.statusZones.get(zoneId)
+
+    def zoneConfig(self, zoneId):
+        return self.configZones.get(zoneId)
+
+    def activity(self, zoneId, activityId):
+        return self.activities.get((zoneId, activityId))
+
+
+class ZoneChangeTracker:
+
+    def __init__(self, maxRefreshInterval=MAX_REFRESH_INTERVAL):
+        self.maxRefreshInterval = maxRefreshInterval
+        # Map of kind ("status" or "config") to the last upload of that kind
+        self.previous = {}
+        # Map of zone id to a map of kind to the diff from the last upload
+        # of that kind that changed the zone
+        self.diffs = {}
+        # Map of zone id to a map of kind to how many uploads of that kind
+        # have changed the zone, so readers can tell if it changed since
+        # they last looked
+        self.generations = {}
+        # Map of zone id to when it was last refreshed
+        self.lastRefresh = {}
+        # Map of zone id to the thermostat's local time to refresh it at,
+        # see refreshAt()
+        self.refreshDue = {}
+
+    # Compare data, an upload of kind, with the previous one.  Returns a map
+    # of the id of each zone that changed to its diff.  Every zone is in it
+    # the first time.
+    def update(self, kind, data):
+
+        previous = self.previous.get(kind)
+        self.previous[kind] = data
+
+        newZones = zonesById(data)
+
+        if previous is None:
+            changes = {zoneId: {} for zoneId in newZones}
+        else:
+            oldZones = zonesById(previous)
+
+            systemDiff = {}
+            diffValues(systemValues(previous), systemValues(data), "system/", systemDiff)
+
+            changes = {}
+            for zoneId in oldZones.keys() | newZones.keys():
+                diff = dict(systemDiff)
+                diffValues(oldZones.get(zoneId, ABSENT), newZones.get(zoneId, ABSENT), "", diff)
+                if diff:
+                    changes[zoneId] = diff
+
+        for (zoneId, diff) in changes.items():
+            self.diffs.setdefault(zoneId, {})[kind] = diff
+            generations = self.generations.setdefault(zoneId, {})
+            generations[kind] = generations.get(kind, 0) + 1
+
+        return changes
+
+    # Refresh a zone once the thermostat's local time reaches when, a
+    # datetime, such as when its next schedule period starts.  None cancels
+    # it.  It is cancelled when the zone is refreshed.
+    def refreshAt(self, zoneId, when):
+        if when is None:
+            self.refreshDue.pop(zoneId, None)
+        else:
+            self.refreshDue[zoneId] = when
+
+    # The ids out of zoneIds that need refreshing, either because they are in
+    # changes, because localTime (the thermostat's, or None) has reached the
+    # time given to refreshAt(), or because they haven't been refreshed for
+    # too long.  Those returned are taken as refreshed now.
+    def zonesToRefresh(self, zoneIds, changes, localTime=None):
+
+        now = time.monotonic()
+        refresh = []
+
+        for zoneId in zoneIds:
+            last = self.lastRefresh.get(zoneId)
+            due = self.refreshDue.get(zoneId)
+            if (zoneId in changes or last is None or now - last >= self.maxRefreshInterval
+                    or (due is not None and localTime is not None and localTime >= due)):
+                self.lastRefresh[zoneId] = now
+                self.refreshDue.pop(zoneId, None)
+                refresh.append(zoneId)
+
+        return refresh
+
+    # How many uploads of kind have changed a zone
+    def generation(self, zoneId, kind):
+        return self.generations.get(zoneId, {}).get(kind, 0)
+
+    # The last diff of kind for a zone, or None if there hasn't been one
+    def lastDiff(self, zoneId, kind):
+        return self.diffs.get(zoneId, {}).get(kind)
@@ -0,0 +1,46 @@
+#
+# The tests import the component as custom_components.carrier_infinity from
+# the root of the repository.  The tests of climate.py and sensor.py, which
+# need Home Assistant, are skipped when it isn't installed.
+#
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_components.carrier_infinity import urlsystems
+from custom_components.carrier_infinity.pendingchanges import PendingChanges
+from custom_components.carrier_infinity.timeseries import EnergyStore, HistoryStore
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import readFixture
+
+
+# The uploads and pending changes kept by urlsystems, reset for each test
+@pytest.fixture
+def systems_state(monkeypatch):
+    for (name, value) in [("activeThermostatId", None), ("configFromDevice", None), ("configTemplates", {}),
+                          ("systemstatus", None), ("statusZones", {}), ("configZones", {}),
+                          ("enabledZoneIds", None), ("currentMode", None), ("tempUnits", None),
+                          ("energyStore", EnergyStore()), ("historyStore", HistoryStore()),
+                          ("pendingChanges", PendingChanges())]:
+        monkeypatch.setattr(urlsystems, name, value)
+    return urlsystems
+
+
+# A c_HTTPClient given the fixture config and status uploads, without
+# starting its server, for zones 1 and 2
+@pytest.fixture
+def ha_client():
+    pytest.importorskip("homeassistant")
+    from custom_components.carrier_infinity.climate import c_HTTPClient
+
+    client = c_HTTPClient(None, 0)
+    for (path, fixture) in [("/systems/123", "config.xml"), ("/systems/123/status", "status.xml")]:
+        asyncio.run(client._update_zones("POST", path, "123", XmlDocument(readFixture(fixture))))
+    client.set_zones({"1": "Main Floor", "2": "Upstairs"})
+    return client
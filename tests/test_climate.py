@@ -0,0 +1,124 @@
+import asyncio
+import re
+
+import pytest
+
+from custom_components.carrier_infinity.commands import FanCommand, HoldCommand, SetpointCommand
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import readFixture
+
+pytest.importorskip("homeassistant")
+
+
+@pytest.fixture
+def commands(ha_client, monkeypatch):
+    sent = []
+    monkeypatch.setattr(ha_client, "send_command", sent.append)
+    return sent
+
+
+def zoneEntity(ha_client, zoneId):
+    from custom_components.carrier_infinity.climate import _HTTPClientZone
+
+    entity = _HTTPClientZone(ha_client, zoneId, ha_client._zones[zoneId])
+    entity.update()
+    return entity
+
+
+# Zone entities registered for their updates, each recording when its state
+# is written
+def registeredEntities(ha_client, zoneIds):
+    writes = []
+    entities = {}
+    for zoneId in zoneIds:
+        entity = zoneEntity(ha_client, zoneId)
+        entity.async_write_ha_state = lambda zoneId=zoneId: writes.append(zoneId)
+        ha_client.add_zone_entity(entity)
+        entities[zoneId] = entity
+    return (entities, writes)
+
+
+def uploadStatus(ha_client, xmlString):
+    asyncio.run(ha_client._update_zones("POST", "/systems/123/status", "123", XmlDocument(xmlString)))
+
+
+# The fan is that of the manual activity, which is held with the current
+# activity's set points
+def test_fan_mode_holds_manual(ha_client, commands):
+    from homeassistant.components.climate.const import FAN_HIGH
+
+    entity = zoneEntity(ha_client, "1")
+    entity.set_fan_mode(FAN_HIGH)
+
+    assert [type(command) for command in commands] == [FanCommand, SetpointCommand, HoldCommand]
+    (fan, setpoints, hold) = commands
+    assert (fan.zoneId, fan.fan) == ("1", "high")
+    assert (setpoints.activity, setpoints.heatTo, setpoints.coolTo) == ("manual", entity.setpoint_heat, entity.setpoint_cool)
+    assert (hold.hold, hold.activity) == (True, "manual")
+
+
+def test_fan_mode_when_manual_is_held(ha_client, commands):
+    from homeassistant.components.climate.const import FAN_LOW
+
+    entity = zoneEntity(ha_client, "1")
+    entity.hold_activity = "manual"
+    entity.set_fan_mode(FAN_LOW)
+
+    assert [type(command) for command in commands] == [FanCommand]
+
+
+# A zone left out of an upload keeps its state, and the zones after it are
+# still refreshed
+def test_upload_without_a_zone(ha_client):
+    (entities, writes) = registeredEntities(ha_client, ["1", "2"])
+    xmlString = re.sub(r'<zone id="1">.*?</zone>', "", readFixture("status.xml"), flags=re.S)
+
+    uploadStatus(ha_client, xmlString.replace("<rt>67.5</rt>", "<rt>70.5</rt>"))
+
+    assert writes == ["2"]
+    assert entities["1"]._current_temperature == 69.0
+    assert entities["2"]._current_temperature == 70.5
+
+
+# Each entity is refreshed once for an upload changing both zones
+def test_upload_changing_two_zones(ha_client, monkeypatch):
+    from custom_components.carrier_infinity.climate import _HTTPClientZone
+
+    (entities, writes) = registeredEntities(ha_client, ["1", "2"])
+    handled = []
+    handle = _HTTPClientZone._handle_zone_update
+    monkeypatch.setattr(_HTTPClientZone, "_handle_zone_update",
+                        lambda self, zone_update: handled.append(zone_update.zoneId) or handle(self, zone_update))
+    xmlString = readFixture("status.xml").replace("<rt>69.0</rt>", "<rt>69.5</rt>").replace("<rt>67.5</rt>", "<rt>70.5</rt>")
+
+    uploadStatus(ha_client, xmlString)
+
+    assert sorted(handled) == ["1", "2"]
+    assert sorted(writes) == ["1", "2"]
+    assert (entities["1"]._current_temperature, entities["2"]._current_temperature) == (69.5, 70.5)
+
+    # Nothing changed, nothing refreshed
+    uploadStatus(ha_client, xmlString)
+    assert len(handled) == 2
+
+
+def test_temperature_in_heat_cool_mode_sends_nothing(ha_client, commands):
+    from homeassistant.const import ATTR_TEMPERATURE
+
+    entity = zoneEntity(ha_client, "1")
+    entity._hvac_mode = "auto"
+    entity.set_temperature(**{ATTR_TEMPERATURE: 70})
+
+    assert commands == []
+
+
+def test_temperature_range_in_heat_cool_mode(ha_client, commands):
+    from homeassistant.components.climate.const import ATTR_TARGET_TEMP_HIGH, ATTR_TARGET_TEMP_LOW
+
+    entity = zoneEntity(ha_client, "1")
+    entity._hvac_mode = "auto"
+    entity.set_temperature(**{ATTR_TARGET_TEMP_LOW: 66, ATTR_TARGET_TEMP_HIGH: 77})
+
+    assert [type(command) for command in commands] == [SetpointCommand, HoldCommand]
+    assert (commands[0].activity, commands[0].heatTo, commands[0].coolTo) == ("manual", 66, 77)
@@ -0,0 +1,40 @@
+import pytest
+
+from custom_components.carrier_infinity.commands import HoldCommand
+
+from helpers import GoldenDatetime, bodyBytes, get, post, readFixture
+
+
+@pytest.fixture
+def systems(systems_state, monkeypatch):
+    monkeypatch.setattr(systems_state, "datetime", GoldenDatetime)
+    post("/systems/1234ABC", readFixture("config.xml"))
+    return systems_state
+
+
+def configBody():
+    response = get("/systems/1234ABC/config")
+    body = bodyBytes(response)
+    assert ("Content-Length", str(len(body))) in response.headers
+    return body
+
+
+@pytest.mark.parametrize(("command", "golden"), [
+    (None, "config_none.xml"),
+    (HoldCommand("1", True, "away", "22:00"), "config_hold_away.xml"),
+    (HoldCommand("1", True, "manual", "", 71), "config_hold_manual.xml"),
+    (HoldCommand("1", False), "config_none.xml"),
+])
+def test_same_bytes_as_deepcopy(systems, command, golden):
+    if command:
+        assert systems.submitCommand(command)
+
+    assert configBody() == readFixture("golden/" + golden, "rb")
+
+    # The change has been sent, so the next fetch is the plain config again
+    assert not systems.pendingChanges.hasChanges()
+    assert configBody() == readFixture("golden/config_none.xml", "rb")
+
+
+def test_no_config_yet(systems_state):
+    assert bodyBytes(get("/systems/1234ABC/config")) == b""
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from custom_components.carrier_infinity import deferredclose
+from custom_components.carrier_infinity.deferredclose import DeferredCloseManager
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(deferredclose, "time", clock)
+    return clock
+
+
+def test_reap_closes_due_connections(clock):
+    manager = DeferredCloseManager(closeDelay=60, maxOpen=8)
+    closed = []
+    manager.add("a", lambda: closed.append("a"))
+    clock.now += 30
+    manager.add("b", lambda: closed.append("b"))
+
+    clock.now += 29
+    assert manager.reap() == 0
+    clock.now += 1
+    assert manager.reap() == 1
+
+    assert closed == ["a"]
+    assert manager.stats() == {"open": 1, "closed": 1, "evicted": 0}
+
+
+def test_oldest_is_closed_over_limit(clock):
+    manager = DeferredCloseManager(closeDelay=60, maxOpen=2)
+    closed = []
+    for name in "abc":
+        manager.add(name, lambda name=name: closed.append(name))
+        clock.now += 1
+
+    assert closed == ["a"]
+    assert manager.stats() == {"open": 2, "closed": 1, "evicted": 1}
+
+
+def test_stop_closes_everything():
+    manager = DeferredCloseManager(closeDelay=60, reapInterval=0.01)
+    manager.start()
+    closed = []
+    for name in "ab":
+        manager.add(name, lambda name=name: closed.append(name))
+
+    manager.stop()
+
+    assert sorted(closed) == ["a", "b"]
+    assert manager.thread is None
+    assert manager.stats()["open"] == 0
+
+
+def test_close_errors_dont_stop_reaping(clock):
+    manager = DeferredCloseManager(closeDelay=0)
+    closed = []
+
+    def failClose():
+        raise OSError("Bad file descriptor")
+
+    # An asyncio connection closed after its event loop
+    loop = asyncio.new_event_loop()
+    loop.close()
+    manager.add("closed loop", lambda: loop.call_soon_threadsafe(closed.append, "closed loop"))
+    manager.add("bad fd", failClose)
+    manager.add("ok", lambda: closed.append("ok"))
+
+    assert manager.reap() == 3
+    assert closed == ["ok"]
+    assert manager.stats()["closed"] == 3
@@ -0,0 +1,192 @@
+#
+# The thermostat can't read a response whose header lines cross a TCP packet
+# boundary.  These tests capture the packets of responses sent over loopback
+# and check that each line of the head is its own packet, as it was with the
+# flush and sleep after every line that ResponseWriter replaced.  When the
+# peer delays its ACKs the sleeps didn't keep the lines apart, but
+# ResponseWriter's TCP_NODELAY does.
+#
+# Capturing needs a raw AF_PACKET socket (Linux, and root or CAP_NET_RAW);
+# the tests are skipped without one.
+#
+
+import select
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from custom_components.carrier_infinity.httpobj import HttpResponse, bodyBuffers
+from custom_components.carrier_infinity.responsewriter import ResponseWriter, responseHeadLines, writeBody
+
+ETH_P_ALL = 0x0003
+PACKET_OUTGOING = 4
+ETH_HEADER_LENGTH = 14
+WARM_UP_EXCHANGES = 3
+
+
+def openCapture():
+    try:
+        capture = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        capture.bind(("lo", 0))
+    except (AttributeError, OSError) as exception:
+        pytest.skip("Can't capture loopback packets - {}".format(exception))
+    capture.setblocking(False)
+    return capture
+
+
+# The TCP payloads sent from port, in order, out of the frames captured
+def tcpPayloads(capture, port):
+
+    payloads = []
+
+    while select.select([capture], [], [], 0.05)[0]:
+        (frame, address) = capture.recvfrom(262144)
+        # Loopback packets are seen going out and coming in
+        if address[2] != PACKET_OUTGOING:
+            continue
+        packet = frame[ETH_HEADER_LENGTH:]
+        if len(packet) < 20 or packet[0] >> 4 != 4 or packet[9] != socket.IPPROTO_TCP:
+            continue
+        ipHeaderLength = (packet[0] & 0x0f) * 4
+        ipLength = struct.unpack("!H", packet[2:4])[0]
+        segment = packet[ipHeaderLength:ipLength]
+        (sourcePort,) = struct.unpack("!H", segment[0:2])
+        tcpHeaderLength = (segment[12] >> 4) * 4
+        payload = segment[tcpHeaderLength:]
+        if sourcePort == port and payload:
+            payloads.append(payload)
+
+    return payloads
+
+
+# ResponseWriter as used by MyTCPHandler, without header pacing
+def writeResponse(sock, httpResponseObj):
+    ResponseWriter(sock).writeHead(httpResponseObj)
+    writeBody(sock.fileno(), httpResponseObj.body)
+
+
+# How MyTCPHandler wrote responses before ResponseWriter, through its
+# unbuffered wfile with a flush and a 10ms sleep after every head line
+def writeResponseWithSleeps(sock, httpResponseObj):
+    wfile = sock.makefile("wb", buffering=0)
+    for line in responseHeadLines(httpResponseObj):
+        wfile.write(line)
+        wfile.flush()
+        time.sleep(0.01)
+    for buffer in bodyBuffers(httpResponseObj.body):
+        wfile.write(buffer)
+    wfile.close()
+
+
+# Send a response from one end of a loopback connection with writeFunc and
+# return the TCP payloads it went out in.  warmUp is how many requests and
+# responses go over the connection first.
+def capturePayloads(writeFunc, httpResponseObj, warmUp=0):
+
+    # Skipped here if packets can't be captured
+    openCapture().close()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+
+    client = socket.create_connection(("127.0.0.1", port))
+    (server, address) = listener.accept()
+    # After a few requests and responses the client delays its ACKs, as a
+    # peer does in an exchange like this.  Without TCP_NODELAY, Nagle's
+    # algorithm then holds back and merges the lines after the first until
+    # the ACK comes.
+    for _ in range(warmUp):
+        client.sendall(b"GET /Alive HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        server.recv(65536)
+        server.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        client.recv(65536)
+    client.sendall(b"GET /systems/123/config HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    server.recv(65536)
+    # Only the response is captured
+    capture = openCapture()
+    received = []
+    reader = threading.Thread(target=lambda: received.append(readAll(client)))
+    reader.start()
+
+    try:
+        writeFunc(server, httpResponseObj)
+        server.shutdown(socket.SHUT_WR)
+        reader.join(5)
+        payloads = tcpPayloads(capture, port)
+    finally:
+        for sock in (server, client, listener, capture):
+            sock.close()
+
+    assert received and received[0] == b"".join(responseHeadLines(httpResponseObj)) + b"".join(bodyBuffers(httpResponseObj.body))
+    return payloads
+
+
+def readAll(sock):
+    data = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def configResponse():
+    body = [b"<config version=\"1.42\">", b"<zones/>" * 40, b"</config>"]
+    response = HttpResponse.okResponse()
+    response.headers.append(("Cache-Control", "private"))
+    response.addContentLengthHeader(sum(len(part) for part in body))
+    response.addContentTypeHeader("application/xml; charset=utf-8")
+    response.headers.append(("Etag", "\"00de388808d7b88cd8f146a1\""))
+    response.addServerHeader()
+    response.addRequestContextHeader()
+    response.addAccessControlHeader()
+    response.addDateHeader()
+    response.body = body
+    return response
+
+
+def headPayloads(payloads, httpResponseObj):
+    return payloads[:len(responseHeadLines(httpResponseObj))]
+
+
+@pytest.mark.parametrize("warmUp", [0, WARM_UP_EXCHANGES])
+def test_each_head_line_is_its_own_packet(warmUp):
+    response = configResponse()
+
+    for _ in range(10):
+        payloads = capturePayloads(writeResponse, response, warmUp)
+
+        assert headPayloads(payloads, response) == responseHeadLines(response)
+        assert b"".join(payloads[len(responseHeadLines(response)):]) == b"".join(response.body)
+
+
+# On a new connection, as the thermostat makes for each request
+def test_same_head_packets_as_flush_and_sleep():
+    response = configResponse()
+
+    before = capturePayloads(writeResponseWithSleeps, response)
+    after = capturePayloads(writeResponse, response)
+
+    assert headPayloads(after, response) == headPayloads(before, response)
+
+
+# Once ACKs are delayed, the 10ms sleeps weren't enough to keep the lines
+# apart, and nor is anything else without TCP_NODELAY.  This also shows the
+# capture would catch a writer that let the lines merge.
+def test_lines_merge_without_nodelay():
+    response = configResponse()
+
+    def writeResponseWithNagle(sock, httpResponseObj):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        for line in responseHeadLines(httpResponseObj):
+            sock.sendall(line)
+        writeBody(sock.fileno(), httpResponseObj.body)
+
+    for writeFunc in (writeResponseWithNagle, writeResponseWithSleeps):
+        payloads = capturePayloads(writeFunc, response, WARM_UP_EXCHANGES)
+        assert headPayloads(payloads, response) != responseHeadLines(response)
@@ -0,0 +1,165 @@
+import re
+import threading
+
+from custom_components.carrier_infinity.commands import FanCommand, HoldCommand, SetpointCommand
+from custom_components.carrier_infinity.configoverlay import ConfigTemplate, activityPath
+from custom_components.carrier_infinity.pendingchanges import PendingChanges
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import bodyBytes, get, post, postForm, readFixture
+
+
+def zoneXml(body, zoneId):
+    text = body.decode("utf-8")
+    start = text.index('<zone id="{}">'.format(zoneId))
+    return text[start:text.index("</zone>", start)]
+
+
+def test_submit_merges_changes_per_zone():
+    pending = PendingChanges()
+    pending.submit(HoldCommand("1", True, "away", "18:30"))
+    pending.submit(FanCommand("1", "high"))
+    pending.submit(HoldCommand("1", True, "sleep", "22:00"))
+    pending.submit(SetpointCommand("2", "home", 66, None))
+
+    (patches, versions) = pending.patches()
+
+    assert patches == {
+        ("1", "hold"): "on",
+        ("1", "holdActivity"): "sleep",
+        ("1", "otmr"): "22:00",
+        ("1", activityPath("manual", "fan")): "high",
+        ("2", activityPath("home", "htsp")): "66",
+    }
+    assert versions == {"1": 3, "2": 1}
+
+
+def test_acknowledge_keeps_later_edits():
+    pending = PendingChanges()
+    pending.submit(FanCommand("1", "med"))
+    pending.submit(FanCommand("2", "med"))
+    (patches, versions) = pending.patches()
+    pending.submit(FanCommand("2", "high"))
+
+    pending.acknowledge(versions)
+
+    assert list(pending.zones) == ["2"]
+    assert pending.zones["2"].settings == {activityPath("manual", "fan"): "high"}
+
+
+def test_discard_keeps_later_edits(caplog):
+    pending = PendingChanges()
+    pending.submit(FanCommand("1", "med"))
+    pending.submit(FanCommand("2", "med"))
+    versions = pending.versions()
+    pending.submit(FanCommand("2", "high"))
+
+    pending.discard(versions, "it is not enabled")
+
+    assert list(pending.zones) == ["2"]
+    assert pending.zones["2"].settings == {activityPath("manual", "fan"): "high"}
+    assert "zone 1, it is not enabled" in caplog.text
+
+
+def test_render_reports_patched_zones():
+    config = XmlDocument(readFixture("config.xml")).root.find("./config")
+    template = ConfigTemplate(config, "123")
+
+    # Zone 3 is disabled so has no slots
+    (parts, zoneIds) = template.render({("1", "hold"): "on", ("3", "hold"): "on"}, "2021-12-19T02:47:06Z")
+
+    assert zoneIds == {"1"}
+    body = b"".join(parts)
+    assert "<hold>on</hold>" in zoneXml(body, "1")
+    assert "<hold>off</hold>" in zoneXml(body, "3")
+
+
+def test_commands_for_disabled_zones_are_rejected(systems_state):
+    post("/systems/123", readFixture("config.xml"))
+
+    assert systems_state.submitCommand(FanCommand("1", "low"))
+    assert not systems_state.submitCommand(FanCommand("3", "low"))
+    assert not systems_state.submitCommand(FanCommand("9", "low"))
+    assert list(systems_state.pendingChanges.zones) == ["1"]
+
+    response = postForm("/api/config/zones/zone/3/fan/", {"fan": "low"})
+    assert response.code == 400
+
+
+def test_config_upload_drops_changes_for_disabled_zones(systems_state):
+    # Not known to be disabled until the configuration is read
+    assert systems_state.submitCommand(FanCommand("1", "low"))
+    assert systems_state.submitCommand(FanCommand("3", "low"))
+
+    post("/systems/123", readFixture("config.xml"))
+
+    assert list(systems_state.pendingChanges.zones) == ["1"]
+
+
+def test_config_fetch_acknowledges_only_sent_zones(systems_state):
+    post("/systems/123", readFixture("config.xml"))
+    systems_state.submitCommand(HoldCommand("1", True, "away", "18:30"))
+    systems_state.submitCommand(SetpointCommand("2", "home", 64, 80))
+
+    body = bodyBytes(get("/systems/123/config"))
+
+    assert "<hold>on</hold>" in zoneXml(body, "1")
+    assert "<holdActivity>away</holdActivity>" in zoneXml(body, "1")
+    assert "<otmr>18:30</otmr>" in zoneXml(body, "1")
+    assert re.search(r'<activity id="home">\s*<htsp>64</htsp>\s*<clsp>80</clsp>', zoneXml(body, "2"))
+    assert not systems_state.hasPendingActions()
+
+
+def test_config_fetch_renders_without_the_lock(systems_state, monkeypatch):
+    post("/systems/123", readFixture("config.xml"))
+    systems_state.submitCommand(FanCommand("1", "med"))
+
+    template = systems_state.configTemplates.get("123") or ConfigTemplate(systems_state.configFromDevice, "123")
+    systems_state.configTemplates["123"] = template
+    render = template.render
+
+    # A change submitted from another thread while the response is built
+    def renderWithEdit(patches, timestamp):
+        thread = threading.Thread(target=systems_state.submitCommand, args=(FanCommand("1", "high"),))
+        thread.start()
+        thread.join(1)
+        assert not thread.is_alive()
+        return render(patches, timestamp)
+    monkeypatch.setattr(template, "render", renderWithEdit)
+
+    body = bodyBytes(get("/systems/123/config"))
+
+    assert re.search(r'<activity id="manual">.*?<fan>med</fan>', zoneXml(body, "1"), re.S)
+    assert systems_state.pendingChanges.zones["1"].settings == {activityPath("manual", "fan"): "high"}
+
+
+# A zone whose changes weren't patched, but were edited while the response was
+# built, keeps the edit
+def test_config_fetch_keeps_edits_to_unpatched_zones(systems_state, monkeypatch, caplog):
+    post("/systems/123", readFixture("config.xml"))
+    systems_state.submitCommand(FanCommand("1", "med"))
+    systems_state.submitCommand(FanCommand("2", "med"))
+
+    template = systems_state.configTemplates.get("123") or ConfigTemplate(systems_state.configFromDevice, "123")
+    systems_state.configTemplates["123"] = template
+    render = template.render
+
+    # Nothing to patch for zone 2, which is edited meanwhile
+    def renderWithEdit(patches, timestamp):
+        systems_state.submitCommand(FanCommand("2", "high"))
+        return render({key: text for (key, text) in patches.items() if key[0] != "2"}, timestamp)
+    monkeypatch.setattr(template, "render", renderWithEdit)
+
+    get("/systems/123/config")
+
+    assert systems_state.pendingChanges.zones["2"].settings == {activityPath("manual", "fan"): "high"}
+    assert "1" not in systems_state.pendingChanges.zones
+    assert "not enabled" not in caplog.text
+
+    # Dropped once it still has nothing to patch
+    monkeypatch.setattr(template, "render", lambda patches, timestamp: render({}, timestamp))
+    get("/systems/123/config")
+
+    assert not systems_state.hasPendingActions()
+    assert "for zone 2, the configuration has nothing to patch" in caplog.text
+    assert "not enabled" not in caplog.text
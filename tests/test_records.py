@@ -0,0 +1,145 @@
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from custom_components.carrier_infinity.records import Activity, Period, ZoneStatus
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import bodyBytes, get, post, readFixture
+
+STATUS_TAGS = {
+    "name": "name",
+    "activity": "currentActivity",
+    "temperature": "rt",
+    "humidity": "rh",
+    "heatTo": "htsp",
+    "coolTo": "clsp",
+    "fan": "fan",
+    "hold": "hold",
+    "until": "otmr",
+    "zoneConditioning": "zoneconditioning"
+}
+
+
+# The zones of a status upload as /api/status gave them before the records,
+# which failed if an element was missing
+def oldStatusZones(xmlString):
+    statusZones = {}
+    for zone in ET.fromstring(xmlString).findall("./zones/zone"):
+        if zone.find("./enabled").text != "on":
+            continue
+        statusZones[zone.attrib["id"]] = {name: zone.find("./" + tag).text for (name, tag) in STATUS_TAGS.items()}
+    return statusZones
+
+
+# The zones of a configuration upload as /api/config gave them before
+def oldConfigZones(xmlString):
+    xmlRoot = ET.fromstring(xmlString)
+    configZones = {}
+    for zone in xmlRoot.findall("./config/zones/zone"):
+        configZoneObj = {"activities": {}, "schedule": {}}
+        for activity in zone.findall("./activities/activity"):
+            configZoneObj["activities"][activity.attrib["id"]] = {
+                "heatTo": activity.find("./htsp").text,
+                "coolTo": activity.find("./clsp").text,
+                "fan": activity.find("./fan").text
+            }
+        for day in zone.findall("./program/day"):
+            configZoneObj["schedule"][day.attrib["id"]] = {
+                int(period.attrib["id"]): {
+                    "activity": period.find("./activity").text,
+                    "time": period.find("./time").text,
+                    "enabled": period.find("./enabled").text == "on"
+                } for period in day.findall("./period")
+            }
+        configZoneObj["mode"] = xmlRoot.find("./config/mode").text
+        configZoneObj["units"] = xmlRoot.find("./config/cfgem").text
+        configZones[zone.attrib["id"]] = configZoneObj
+    return configZones
+
+
+# Home Assistant's view of the zones, which get_safe() reads
+def dictZones(xmlString, path):
+    zones = XmlDocument(xmlString).asDict()
+    for key in path:
+        zones = zones[key]
+    return {zone["@id"]: zone for zone in zones}
+
+
+# Zone 1 with an empty humidity and no temperature
+def statusWithGaps():
+    return readFixture("status.xml").replace("<rh>31</rh>", "<rh/>", 1).replace("<rt>69.0</rt>", "", 1)
+
+
+def test_status_json_same_as_before(systems_state):
+    xmlString = readFixture("status.xml")
+    post("/systems/123/status", xmlString)
+
+    for (zoneId, zoneObj) in oldStatusZones(xmlString).items():
+        assert bodyBytes(get("/api/status/" + zoneId)) == json.dumps(zoneObj).encode("utf-8")
+
+    assert set(systems_state.statusZones) == set(oldStatusZones(xmlString))
+
+
+def test_config_json_same_as_before(systems_state):
+    xmlString = readFixture("config.xml")
+    post("/systems/123", xmlString)
+
+    for (zoneId, zoneObj) in oldConfigZones(xmlString).items():
+        assert bodyBytes(get("/api/config/" + zoneId)) == json.dumps(zoneObj).encode("utf-8")
+        # Fetching it again gives the same, mode and units aren't stored
+        assert bodyBytes(get("/api/config/" + zoneId)) == json.dumps(zoneObj).encode("utf-8")
+
+
+@pytest.mark.parametrize("xmlString", [readFixture("status.xml"), statusWithGaps()])
+def test_status_same_as_get_safe(xmlString):
+    zones = dictZones(xmlString, ["status", "zones", "zone"])
+
+    for zone in ET.fromstring(xmlString).findall("./zones/zone"):
+        record = ZoneStatus.fromElement(zone)
+        for (name, tag) in STATUS_TAGS.items():
+            assert getattr(record, name) == zones[zone.attrib["id"]].get(tag), name
+        assert record.enabled == (zones[zone.attrib["id"]].get("enabled") == "on")
+
+
+def test_empty_and_missing_fields(systems_state):
+    post("/systems/123/status", statusWithGaps())
+    zone = systems_state.statusZones["1"]
+
+    assert (zone.humidity, zone.temperature) == (None, None)
+    assert zone.name == "Main Floor"
+    assert json.loads(bodyBytes(get("/api/status/1")))["humidity"] is None
+
+
+def test_config_same_as_get_safe():
+    xmlString = readFixture("config.xml")
+    zones = dictZones(xmlString, ["system", "config", "zones", "zone"])
+
+    for zone in ET.fromstring(xmlString).findall("./config/zones/zone"):
+        activities = zones[zone.attrib["id"]]["activities"]["activity"]
+        for (element, expected) in zip(zone.findall("./activities/activity"), activities):
+            activity = Activity.fromElement(element)
+            assert (activity.heatTo, activity.coolTo, activity.fan) == (expected.get("htsp"), expected.get("clsp"), expected.get("fan"))
+
+
+def test_period_defaults():
+    period = Period.fromElement(ET.fromstring('<period id="1"><activity/><time>06:30</time></period>'))
+
+    assert (period.activity, period.time, period.enabled) == (None, "06:30", False)
+    assert period.toJson() == json.dumps({"activity": None, "time": "06:30", "enabled": False})
+
+
+# The first of a repeated element is used, as find() did
+def test_first_repeated_element():
+    zone = ZoneStatus.fromElement(ET.fromstring("<zone><rt>70</rt><rt>71</rt><enabled>on</enabled></zone>"))
+
+    assert zone.temperature == "70"
+    assert zone.enabled
+
+
+def test_slots():
+    zone = ZoneStatus.fromElement(ET.fromstring("<zone/>"))
+
+    with pytest.raises(AttributeError):
+        zone.other = 1
@@ -0,0 +1,289 @@
+import socket
+import threading
+import time
+from urllib.parse import quote
+
+import pytest
+
+from custom_components.carrier_infinity import requestparser
+from custom_components.carrier_infinity.asyncserver import MyAsyncServer
+from custom_components.carrier_infinity.httpserver import MyTCPHandler, MyTCPServer
+from custom_components.carrier_infinity.requestparser import (
+    HEADER_TIMEOUT,
+    MAX_BODY_BYTES,
+    MAX_HEADER_BYTES,
+    MAX_HEADER_COUNT,
+    REQUEST_TIMEOUT,
+    HttpParseError,
+    HttpRequestParser,
+)
+
+BODY = ("data=" + quote("<status><zones/></status>")).encode("utf-8")
+
+POST = (b"POST /systems/123/status?x=1 HTTP/1.1\r\n"
+        b"Host: localhost\r\n"
+        b"Content-Type: application/x-www-form-urlencoded\r\n"
+        b"Content-Length: %d\r\n\r\n" % len(BODY)) + BODY
+
+
+def head(*headers, requestLine=b"GET /Alive HTTP/1.1"):
+    return b"\r\n".join((requestLine,) + headers) + b"\r\n\r\n"
+
+
+# Feed in pieces, returning whether the request was completed by the last
+def feedAll(parser, *pieces):
+    done = False
+    for piece in pieces:
+        assert not done
+        done = parser.feed(piece)
+    return done
+
+
+def parseError(*pieces):
+    with pytest.raises(HttpParseError) as excinfo:
+        feedAll(HttpRequestParser(), *pieces)
+    return excinfo.value
+
+
+def test_post_in_one_read():
+    parser = HttpRequestParser()
+    assert parser.feed(POST)
+
+    request = parser.request
+    assert (request.method, request.path, request.queryString) == ("POST", "/systems/123/status", {"x": ["1"]})
+    assert request.host == "localhost"
+    assert request.contentLength == len(BODY)
+    assert request.bodyDict == {"data": ["<status><zones/></status>"]}
+
+
+@pytest.mark.parametrize("split", range(1, len(POST)))
+def test_post_split_anywhere(split):
+    parser = HttpRequestParser()
+    assert feedAll(parser, POST[:split], POST[split:])
+    assert parser.request.bodyDict == {"data": ["<status><zones/></status>"]}
+
+
+def test_post_a_byte_at_a_time():
+    parser = HttpRequestParser()
+    assert feedAll(parser, *[POST[i:i + 1] for i in range(len(POST))])
+    assert parser.request.bodyDict == {"data": ["<status><zones/></status>"]}
+
+
+def test_body_read_into_buffer():
+    parser = HttpRequestParser()
+    headEnd = POST.index(b"\r\n\r\n") + 4
+    assert not parser.feed(POST[:headEnd + 3])
+    assert parser.state == HttpRequestParser.STATE_BODY
+    assert parser.bodyRemaining() == len(BODY) - 3
+
+    buffer = parser.bodyBuffer()
+    buffer[:len(BODY) - 3] = BODY[3:]
+    assert parser.bodyReceived(len(BODY) - 3)
+    assert parser.request.bodyDict == {"data": ["<status><zones/></status>"]}
+
+
+def test_bytes_after_body_are_ignored():
+    parser = HttpRequestParser()
+    assert parser.feed(POST + b"GET / HTTP/1.1\r\n\r\n")
+    assert parser.request.body == BODY.decode("utf-8")
+
+
+def test_post_without_length_has_no_body():
+    parser = HttpRequestParser()
+    assert parser.feed(head(b"Content-Type: application/x-www-form-urlencoded",
+                            requestLine=b"POST /systems/123 HTTP/1.1"))
+    assert parser.request.body is None
+
+
+def test_header_count_limit():
+    headers = [b"X-%d: %d" % (i, i) for i in range(MAX_HEADER_COUNT)]
+    parser = HttpRequestParser()
+    assert parser.feed(head(*headers))
+    assert len(parser.request.headers) == MAX_HEADER_COUNT
+
+    error = parseError(head(*headers, b"X-One-More: 1"))
+    assert error.code == 431
+    assert error.request is None
+
+
+def test_header_bytes_limit():
+    padding = b"X-Padding: " + b"a" * (MAX_HEADER_BYTES - 40)
+    parser = HttpRequestParser()
+    assert parser.feed(head(padding))
+
+    error = parseError(head(padding + b"a" * 40))
+    assert error.code == 431
+
+
+# Too much without the end of the headers fails without waiting for the rest
+def test_header_bytes_limit_without_end():
+    parser = HttpRequestParser()
+    assert not parser.feed(b"GET / HTTP/1.1\r\nX-Padding: " + b"a" * (MAX_HEADER_BYTES - 100))
+    with pytest.raises(HttpParseError) as excinfo:
+        parser.feed(b"a" * 200)
+    assert excinfo.value.code == 431
+
+
+def test_body_limit():
+    requestLine = b"POST /systems/123 HTTP/1.1"
+    contentType = b"Content-Type: application/x-www-form-urlencoded"
+
+    parser = HttpRequestParser()
+    assert not parser.feed(head(contentType, b"Content-Length: %d" % MAX_BODY_BYTES, requestLine=requestLine))
+    assert parser.bodyRemaining() == MAX_BODY_BYTES
+
+    error = parseError(head(contentType, b"Content-Length: %d" % (MAX_BODY_BYTES + 1), requestLine=requestLine))
+    assert error.code == 413
+    assert error.request.path == "/systems/123"
+
+
+@pytest.mark.parametrize("data", [
+    b"GET /\r\n\r\n",
+    b"GET / HTTP/1.1 extra\r\n\r\n",
+    b"\r\n\r\n",
+    b"GET /\xff HTTP/1.1\r\n\r\n",
+])
+def test_bad_request_line(data):
+    error = parseError(data)
+    assert error.code == 400
+    assert error.request is None
+
+
+@pytest.mark.parametrize("data", [
+    head(requestLine=b"GET / HTTP/1.0"),
+    head(b"No colon here"),
+    head(b"X-Bad: \xff"),
+    head(b"Content-Length: ten"),
+    head(b"Content-Length: -1"),
+    head(b"Host: a", b"Host: b"),
+])
+def test_bad_headers(data):
+    error = parseError(data)
+    assert error.code == 400
+    assert error.request is not None
+
+
+def test_bad_body():
+    error = parseError(head(b"Content-Type: text/plain", b"Content-Length: 2",
+                            requestLine=b"POST /systems/123 HTTP/1.1") + b"hi")
+    assert error.code == 400
+    assert error.request.path == "/systems/123"
+
+
+def test_deadlines():
+    parser = HttpRequestParser(startTime=100.0)
+    assert parser.deadline() == 100.0 + HEADER_TIMEOUT
+
+    headEnd = POST.index(b"\r\n\r\n") + 4
+    parser.feed(POST[:headEnd])
+    assert parser.deadline() == 100.0 + REQUEST_TIMEOUT
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 50.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_time_left(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(requestparser, "time", clock)
+
+    parser = HttpRequestParser()
+    assert parser.timeLeft() == HEADER_TIMEOUT
+    clock.now += HEADER_TIMEOUT + 1
+    assert parser.timeLeft() == -1
+
+
+#
+# Slow clients against each server, with short deadlines
+#
+
+@pytest.fixture
+def shortTimeouts(monkeypatch):
+    monkeypatch.setattr(requestparser, "HEADER_TIMEOUT", 0.2)
+    monkeypatch.setattr(requestparser, "REQUEST_TIMEOUT", 0.4)
+
+
+@pytest.fixture(params=["tcp", "asyncio"])
+def server(request, shortTimeouts):
+    if request.param == "asyncio":
+        server = MyAsyncServer(("127.0.0.1", 0), None)
+    else:
+        server = MyTCPServer(("127.0.0.1", 0), MyTCPHandler, None)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    if request.param == "asyncio":
+        while server.server is None:
+            time.sleep(0.01)
+        address = server.server.sockets[0].getsockname()[:2]
+    else:
+        address = server.server_address
+
+    yield address
+
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def receiveAll(client):
+    received = b""
+    while True:
+        data = client.recv(65536)
+        if not data:
+            return received
+        received += data
+
+
+def test_slow_headers_are_dropped(server):
+    with socket.create_connection(server) as client:
+        client.settimeout(5)
+        start = time.monotonic()
+        client.sendall(b"GET /Alive HTTP/1.1\r\nHost: loc")
+        assert receiveAll(client) == b""
+        assert time.monotonic() - start < 2
+
+
+# Trickling in the headers doesn't extend their deadline
+def test_trickled_headers_are_dropped(server):
+    with socket.create_connection(server) as client:
+        client.settimeout(5)
+        start = time.monotonic()
+        try:
+            for byte in b"GET /Alive HTTP/1.1\r\nHost: localhost\r\n":
+                client.sendall(bytes([byte]))
+                time.sleep(0.02)
+        except OSError:
+            pass
+        assert receiveAll(client) == b""
+        assert time.monotonic() - start < 2
+
+
+def test_slow_body_gets_400(server):
+    headEnd = POST.index(b"\r\n\r\n") + 4
+    with socket.create_connection(server) as client:
+        client.settimeout(5)
+        client.sendall(POST[:headEnd + 3])
+        assert receiveAll(client).startswith(b"HTTP/1.1 400 Bad Request\r\n")
+
+
+# Nothing sensible to respond to without a request line
+def test_too_many_headers_are_dropped(server):
+    with socket.create_connection(server) as client:
+        client.settimeout(5)
+        client.sendall(head(*[b"X-%d: %d" % (i, i) for i in range(MAX_HEADER_COUNT + 1)]))
+        assert receiveAll(client) == b""
+
+
+def test_oversized_body_gets_413(server):
+    with socket.create_connection(server) as client:
+        client.settimeout(5)
+        client.sendall(head(b"Content-Type: application/x-www-form-urlencoded",
+                            b"Content-Length: %d" % (MAX_BODY_BYTES + 1),
+                            requestLine=b"POST /systems/123 HTTP/1.1"))
+        assert receiveAll(client).startswith(b"HTTP/1.1 413 Payload Too Large\r\n")
@@ -0,0 +1,170 @@
+import os
+import time
+
+import pytest
+
+from custom_components.carrier_infinity import responsecache, urlmanifest
+from custom_components.carrier_infinity.httpobj import HttpResponse
+from custom_components.carrier_infinity.responsecache import ResponseCache
+from custom_components.carrier_infinity.responsewriter import responseHeadLines
+
+from helpers import get
+
+# 2021-12-19 02:47:06 UTC
+NOW = 1639882026
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = NOW
+        self.gmtime = time.gmtime
+        self.strftime = time.strftime
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(responsecache, "time", clock)
+    monkeypatch.setattr(responsecache, "lastDateLine", (None, None))
+    return clock
+
+
+def makeResponse(body=b"<body/>"):
+    response = HttpResponse.okResponse()
+    response.addContentLengthHeader(len(body))
+    response.addDateHeader()
+    response.headers.append(("Cache-Control", "private"))
+    response.body = body
+    return response
+
+
+def test_date_line_is_replaced(clock):
+    original = makeResponse()
+    head = responseHeadLines(original)
+
+    cached = ResponseCache().get("key", lambda: original).makeResponse()
+
+    assert cached.headLines[:2] == head[:2]
+    assert cached.headLines[2] == b"Date: Sun, 19 Dec 2021 02:47:06 GMT\r\n"
+    assert cached.headLines[3:] == head[3:]
+    assert cached.body == b"<body/>"
+
+    clock.now += 61
+    assert ResponseCache().get("key", lambda: original).makeResponse().headLines[2] == b"Date: Sun, 19 Dec 2021 02:48:07 GMT\r\n"
+
+
+# The copy gets its own list, the cached head keeps the first Date
+def test_cached_head_is_not_changed(clock):
+    entry = ResponseCache().get("key", makeResponse)
+    head = list(entry.headLines)
+
+    clock.now += 1
+    entry.makeResponse()
+
+    assert entry.headLines == head
+
+
+def test_body_is_replaced(clock):
+    entry = ResponseCache().get("key", makeResponse)
+
+    assert entry.makeResponse(b"<other>").body == b"<other>"
+    assert entry.makeResponse().body == b"<body/>"
+
+
+def test_built_once():
+    cache = ResponseCache()
+    built = []
+
+    def build():
+        built.append(1)
+        return makeResponse()
+
+    assert cache.get("key", build) is cache.get("key", build)
+    assert len(built) == 1
+
+
+def test_oldest_is_dropped():
+    cache = ResponseCache(maxEntries=2)
+    for key in ("a", "b", "c"):
+        cache.get(key, makeResponse)
+
+    assert list(cache.entries) == ["b", "c"]
+
+
+# A response built from data that changed while it was being built isn't kept
+def test_clear_while_building():
+    cache = ResponseCache()
+
+    def build():
+        cache.clear()
+        return makeResponse()
+
+    entry = cache.get("key", build)
+
+    assert entry.body == b"<body/>"
+    assert len(cache) == 0
+    assert cache.generation == 1
+
+
+#
+# /manifest
+#
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    path = tmp_path / "manifest.xml"
+    path.write_bytes(b"<manifest>one</manifest>")
+
+    monkeypatch.setattr(urlmanifest, "responseCache", ResponseCache())
+    monkeypatch.setattr(urlmanifest, "manifestPath", str(path))
+    monkeypatch.setattr(urlmanifest, "manifestMtime", None)
+    monkeypatch.setattr(urlmanifest, "responseManifest", None)
+
+    with urlmanifest.manifestLock:
+        urlmanifest.reloadManifest()
+
+    return path
+
+
+def setMtime(path, mtimeNs):
+    os.utime(path, ns=(mtimeNs, mtimeNs))
+
+
+def test_manifest_is_cached(manifest):
+    assert get("/manifest").body == b"<manifest>one</manifest>"
+    assert len(urlmanifest.responseCache) == 1
+
+    # Not read again while the mtime is the same
+    mtime = os.stat(manifest).st_mtime_ns
+    manifest.write_bytes(b"<manifest>two</manifest>")
+    setMtime(manifest, mtime)
+
+    assert get("/manifest").body == b"<manifest>one</manifest>"
+
+
+def test_manifest_reloaded_when_modified(manifest):
+    assert get("/manifest").body == b"<manifest>one</manifest>"
+    generation = urlmanifest.responseCache.generation
+
+    mtime = os.stat(manifest).st_mtime_ns
+    manifest.write_bytes(b"<manifest>second</manifest>")
+    setMtime(manifest, mtime + 1000000000)
+
+    response = get("/manifest")
+
+    assert response.body == b"<manifest>second</manifest>"
+    assert ("Content-Length", str(len(b"<manifest>second</manifest>"))) in response.headers
+    assert urlmanifest.responseCache.generation == generation + 1
+    assert urlmanifest.manifestMtime == mtime + 1000000000
+
+
+# The loaded manifest is kept if the file goes away
+def test_manifest_removed(manifest):
+    get("/manifest")
+    manifest.unlink()
+
+    assert get("/manifest").body == b"<manifest>one</manifest>"
@@ -0,0 +1,124 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from custom_components.carrier_infinity import responsewriter
+from custom_components.carrier_infinity.httpobj import bodyLength
+from custom_components.carrier_infinity.responsewriter import IOV_MAX, writeBody
+
+from helpers import bodyBytes, get, post, readFixture
+
+
+# Stands in for os in responsewriter, with a writev() that takes at most
+# limit bytes each call, like a socket with a full send buffer
+class ShortWrites:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.written = bytearray()
+        self.calls = []
+
+    def writev(self, fileno, buffers):
+        self.calls.append(len(buffers))
+        data = b"".join(bytes(buffer) for buffer in buffers)[:self.limit]
+        self.written += data
+        return len(data)
+
+
+@pytest.fixture
+def shortWrites(monkeypatch):
+    def install(limit):
+        fake = ShortWrites(limit)
+        monkeypatch.setattr(responsewriter, "os", fake)
+        return fake
+    return install
+
+
+@pytest.mark.parametrize("limit", [1, 3, 7, 1000])
+def test_short_writes(shortWrites, limit):
+    body = [b"<a>", b"", b"bcdefgh", b"i" * 20, b"</a>"]
+    fake = shortWrites(limit)
+
+    writeBody(0, body)
+
+    assert bytes(fake.written) == b"".join(body)
+
+
+# The response's own list is left as it was, it may be cached
+def test_body_list_not_changed(shortWrites):
+    body = [b"abc", b"defg"]
+    shortWrites(2)
+
+    writeBody(0, body)
+
+    assert body == [b"abc", b"defg"]
+
+
+def test_bytes_body(shortWrites):
+    fake = shortWrites(5)
+    writeBody(0, b"0123456789abc")
+    assert bytes(fake.written) == b"0123456789abc"
+    assert len(fake.calls) == 3
+
+
+def test_more_than_iov_max_buffers(shortWrites):
+    body = [b"%05d" % i for i in range(IOV_MAX * 2 + 10)]
+    fake = shortWrites(1 << 30)
+
+    writeBody(0, body)
+
+    assert bytes(fake.written) == b"".join(body)
+    assert fake.calls == [IOV_MAX, IOV_MAX, 10]
+
+
+def test_more_than_iov_max_buffers_short(shortWrites):
+    body = [b"%05d" % i for i in range(IOV_MAX + 1)]
+    fake = shortWrites(4099)
+
+    writeBody(0, body)
+
+    assert bytes(fake.written) == b"".join(body)
+    assert max(fake.calls) <= IOV_MAX
+
+
+# A real socket whose buffer fills, so the OS takes part of the body at a time
+def test_socketpair():
+    body = [os.urandom(1000) for _ in range(3000)]
+    (writer, reader) = socket.socketpair()
+    received = bytearray()
+
+    def readAll():
+        while True:
+            data = reader.recv(65536)
+            if not data:
+                return
+            received.extend(data)
+
+    thread = threading.Thread(target=readAll)
+    thread.start()
+    try:
+        writeBody(writer.fileno(), body)
+    finally:
+        writer.close()
+        thread.join()
+        reader.close()
+
+    assert bytes(received) == b"".join(body)
+
+
+def test_length_is_in_bytes():
+    assert bodyLength([b"caf\xc3\xa9", b"\xe2\x98\x83"]) == 8
+    assert bodyLength("café ☃".encode("utf-8")) == 9
+
+
+def test_content_length_of_non_ascii_body(systems_state):
+    post("/systems/123/status", readFixture("status.xml").replace("Main Floor", "Salle à manger ☃"))
+
+    for path in ("/api/status/1", "/api/status/1/name"):
+        response = get(path)
+        body = bodyBytes(response)
+        assert ("Content-Length", str(len(body))) in response.headers
+
+    assert body.decode("utf-8") == "Salle à manger ☃"
@@ -0,0 +1,101 @@
+import random
+import re
+
+import pytest
+
+# Registers every URL handler
+from custom_components.carrier_infinity import httpserver
+from custom_components.carrier_infinity.httpobj import urlRouter
+from custom_components.carrier_infinity.router import Router
+
+
+# How routes were matched before the router: each regular expression with
+# re.match() in the order they were added
+def scanMatch(routes, path):
+    for route in routes:
+        m = re.match(route.reStr, path)
+        if m:
+            return (route.reStr, m.groups(), m.groupdict())
+    return None
+
+
+def routerMatch(router, path):
+    found = router.match(path)
+    if found is None:
+        return None
+    return (found.route.reStr, found.pathGroup, found.pathDict)
+
+
+PATHS = [
+    "/Alive",
+    "/Alive/",
+    "/manifest",
+    "/releaseNotes/abc",
+    "/time/",
+    "/time/now",
+    "/systems/2118W123456",
+    "/systems/2118W123456/",
+    "/systems/2118W123456/status",
+    "/systems/2118W123456/config",
+    "/systems/a/b/status",
+    "/systems//status",
+    "/systems/status",
+    "/systems/2118W123456/unknown",
+    "/weather/10001/forecast",
+    "/weather/10001/extra/forecast",
+    "/api/status",
+    "/api/status/1",
+    "/api/status/1/rt",
+    "/api/status/1/a/b",
+    "/api/pendingActions",
+    "/api/energy",
+    "/api/config/zones/zone/1/fan/",
+    "/api/config/zones/zone/1/",
+    "/api/config/zones/zone/1/x/fan/",
+    "/api/config/1",
+    "/api/deviceConfig",
+    "/api/hold/1",
+    "http://www.example.com/releaseNotes/1",
+    "",
+    "/",
+    "//",
+    "/nothing",
+]
+
+
+@pytest.mark.parametrize("path", PATHS + [path + "\n" for path in PATHS] + [
+    "/systems/2118W123456\n/status",
+    "/systems/a\nb/status",
+    "/api/status/1\n/rt",
+    "/weather/100\n01/forecast",
+    "/systems/123/status\n\n",
+])
+def test_same_match_as_regex_scan(path):
+    assert routerMatch(urlRouter, path) == scanMatch(urlRouter.routes, path)
+
+
+def test_trailing_newline_routes_like_regex():
+    found = urlRouter.match("/systems/2118W123456/status\n")
+
+    assert found.route.func.__name__ == "urlSystemsStatus"
+    assert found.pathDict == {"serialNumber": "2118W123456"}
+
+
+def test_random_paths_match_like_regex_scan():
+    rnd = random.Random(4)
+    pieces = ["systems", "api", "status", "config", "zone", "zones", "fan", "1", "2118W123456", "weather",
+              "forecast", "time", "Alive", "", "hold", "x\n", "\n"]
+
+    for _ in range(5000):
+        path = "/" + "/".join(rnd.choice(pieces) for _ in range(rnd.randint(0, 6)))
+        assert routerMatch(urlRouter, path) == scanMatch(urlRouter.routes, path), path
+
+
+def test_earliest_route_wins():
+    router = Router()
+    router.addRoute("/a/(?P<x>.+)$", lambda request: "first")
+    router.addRoute("/a/b$", lambda request: "second")
+    router.addRoute("/a/(?P<y>[^/]+)$", lambda request: "third")
+
+    assert router.match("/a/b").route.func(None) == "first"
+    assert router.match("/a/b").pathDict == {"x": "b"}
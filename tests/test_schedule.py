@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import pytest
+
+from custom_components.carrier_infinity.schedule import WeeklySchedule, parseLocalTime
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import post, readFixture
+
+# 2021-12-12 is a Sunday, the start of the thermostat's week
+SUNDAY = 12
+
+
+def at(day, hour, minute=0):
+    return datetime(2021, 12, SUNDAY + day, hour, minute)
+
+
+def test_wraps_past_midnight():
+    schedule = WeeklySchedule([("Monday", "sleep", "22:00"), ("Tuesday", "wake", "06:30")])
+
+    assert schedule.scheduled(at(2, 1)) == ("sleep", at(1, 22))
+    assert schedule.next(at(1, 23, 59)) == ("wake", at(2, 6, 30))
+
+
+def test_wraps_at_end_of_week():
+    schedule = WeeklySchedule([("Sunday", "wake", "06:30"), ("Saturday", "sleep", "23:00")])
+
+    # Before the first period of the week is the last period of last week
+    assert schedule.scheduled(at(0, 3)) == ("sleep", at(-1, 23))
+    # After the last period of the week is the first period of next week
+    assert schedule.next(at(6, 23, 30)) == ("wake", at(7, 6, 30))
+
+
+def test_period_starts_at_its_time():
+    schedule = WeeklySchedule([("Monday", "home", "17:30"), ("Monday", "sleep", "22:00")])
+
+    assert schedule.next(at(1, 17, 30)) == ("home", at(1, 17, 30))
+    assert schedule.scheduled(datetime(2021, 12, 13, 17, 30, 1)) == ("home", at(1, 17, 30))
+
+
+def test_day_without_enabled_periods():
+    program = {"day": [
+        {"@id": "Tuesday", "period": [
+            {"activity": "wake", "time": "06:30", "enabled": "on"},
+            {"activity": "sleep", "time": "22:00", "enabled": "on"}]},
+        {"@id": "Wednesday", "period": [
+            {"activity": "wake", "time": "06:30", "enabled": "off"},
+            {"activity": "away", "time": "08:00", "enabled": "off"}]},
+        {"@id": "Thursday", "period": {"activity": "home", "time": "07:00", "enabled": "on"}},
+    ]}
+    schedule = WeeklySchedule.fromProgram(program)
+
+    assert len(schedule) == 3
+    assert schedule.scheduled(at(3, 12)) == ("sleep", at(2, 22))
+    assert schedule.next(at(3, 12)) == ("home", at(4, 7))
+
+
+def test_no_enabled_periods():
+    schedule = WeeklySchedule.fromProgram({"day": {"@id": "Monday", "period": {"activity": "home", "time": "07:00", "enabled": "off"}}})
+
+    assert len(schedule) == 0
+    assert schedule.scheduled(at(1, 12)) == (None, None)
+    assert schedule.next(at(1, 12)) == (None, None)
+
+
+@pytest.mark.parametrize("enabled", ["off", None, "", "yes"])
+def test_only_on_periods_are_enabled(enabled):
+    period = {"activity": "home", "time": "07:00"}
+    if enabled is not None:
+        period["enabled"] = enabled
+
+    assert len(WeeklySchedule.fromProgram({"day": {"@id": "Monday", "period": period}})) == 0
+
+
+def test_bad_periods_are_ignored():
+    schedule = WeeklySchedule([("Someday", "home", "07:00"), ("Monday", "home", "25:00"), ("Monday", "away", "08:00")])
+
+    assert len(schedule) == 1
+
+
+def test_records_and_program_compile_the_same(systems_state):
+    config = readFixture("config.xml")
+    post("/systems/123", config)
+    program = XmlDocument(config).asDict()["system"]["config"]["zones"]["zone"][0]["program"]
+
+    fromRecords = systems_state.configZones["1"].weeklySchedule
+    fromProgram = WeeklySchedule.fromProgram(program)
+
+    assert (fromRecords.offsets, fromRecords.activities) == (fromProgram.offsets, fromProgram.activities)
+    # The fixture's weekends have no "away" and its midnight period is off
+    assert len(fromProgram) == 5 * 4 + 2 * 3
+
+
+def test_local_time_offset_is_ignored():
+    assert parseLocalTime("2021-12-18T21:47:06-05:00") == datetime(2021, 12, 18, 21, 47, 6)
+    assert parseLocalTime("2021-12-18T21:47:06") == datetime(2021, 12, 18, 21, 47, 6)
+    with pytest.raises(ValueError):
+        parseLocalTime("18/12/2021 21:47")
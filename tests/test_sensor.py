@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from custom_components.carrier_infinity.deferredclose import DeferredCloseManager
+from custom_components.carrier_infinity.httpserver import MyTCPHandler, MyThreadPoolTCPServer
+
+
+def test_server_stats(ha_client):
+    from custom_components.carrier_infinity.sensor import InfinityServerSensor
+
+    ha_client.httpserver = SimpleNamespace(deferredCloseSockets=DeferredCloseManager())
+    ha_client.httpserver.deferredCloseSockets.add("a", lambda: None)
+
+    sensor = InfinityServerSensor(ha_client)
+    sensor.update()
+
+    assert sensor.native_value == "tcp"
+    assert sensor.extra_state_attributes["deferred_close"] == {"open": 1, "closed": 0, "evicted": 0}
+
+
+# They change all the time, so would write a new state for every zone
+def test_not_zone_attributes(ha_client):
+    from custom_components.carrier_infinity.climate import _HTTPClientZone
+
+    zone = _HTTPClientZone(ha_client, "1", "Main Floor")
+
+    assert zone.state_attributes["zone_id"] == "1"
+    assert "deferred_close" not in zone.state_attributes
+
+
+def test_thread_pool_stats(ha_client):
+    from custom_components.carrier_infinity.climate import _HTTPClientZone
+    from custom_components.carrier_infinity.sensor import InfinityServerSensor
+
+    ha_client.httpserver = MyThreadPoolTCPServer(("127.0.0.1", 0), MyTCPHandler, ha_client, poolSize=2)
+    try:
+        sensor = InfinityServerSensor(ha_client)
+        sensor.update()
+    finally:
+        ha_client.httpserver.server_close()
+
+    assert sensor.extra_state_attributes["thread_pool"]["workers"] == 2
+    assert "thread_pool" not in _HTTPClientZone(ha_client, "1", "Main Floor").state_attributes
+
+
+def test_upstream_stats(ha_client):
+    from custom_components.carrier_infinity.climate import _HTTPClientZone
+    from custom_components.carrier_infinity.sensor import InfinityServerSensor
+
+    sensor = InfinityServerSensor(ha_client)
+    sensor.update()
+
+    assert "pool_hit_rate" in sensor.extra_state_attributes["upstream"]
+    assert "upstream" not in _HTTPClientZone(ha_client, "1", "Main Floor").state_attributes
@@ -0,0 +1,60 @@
+import pytest
+
+from custom_components.carrier_infinity import urlsystems
+from custom_components.carrier_infinity.httpobj import HttpRequest
+
+from helpers import GoldenDatetime, bodyBytes, readFixture
+
+
+@pytest.fixture(autouse=True)
+def frozenTime(monkeypatch):
+    monkeypatch.setattr(urlsystems, "datetime", GoldenDatetime)
+
+
+@pytest.fixture(autouse=True)
+def templates(monkeypatch):
+    monkeypatch.setattr(urlsystems, "statusTemplates", {})
+    monkeypatch.setattr(urlsystems, "STATUS_PING_RATES", list(urlsystems.STATUS_PING_RATES))
+
+
+def statusRequest(serialNumber):
+    request = HttpRequest(HttpRequest.VERSION_1_1, HttpRequest.METHOD_GET, "/systems/{}/status".format(serialNumber), None)
+    request.pathDict = {"serialNumber": serialNumber}
+    return request
+
+
+@pytest.mark.parametrize("serverHasChanges", [False, True])
+@pytest.mark.parametrize("configHasChanges", [False, True])
+def test_same_bytes_as_element_tree(serverHasChanges, configHasChanges):
+    golden = readFixture("golden/status_{}_{}.xml".format(str(serverHasChanges).lower(), str(configHasChanges).lower()), "rb")
+
+    # Once to build the template and again from it
+    for _ in range(2):
+        response = urlsystems.makeSystemsStatusResponse(statusRequest("1234ABC"), serverHasChanges, configHasChanges)
+        assert bodyBytes(response) == golden
+        assert ("Content-Length", str(len(golden))) in response.headers
+
+
+def test_template_per_serial_number():
+    first = bodyBytes(urlsystems.makeSystemsStatusResponse(statusRequest("1234ABC"), False, False))
+    second = bodyBytes(urlsystems.makeSystemsStatusResponse(statusRequest("5678DEF"), False, False))
+
+    assert second == first.replace(b"1234ABC", b"5678DEF")
+    assert set(urlsystems.statusTemplates) == {"1234ABC", "5678DEF"}
+
+
+def test_serial_number_is_escaped():
+    body = bodyBytes(urlsystems.makeSystemsStatusResponse(statusRequest("12&34"), False, False))
+    assert b"/systems/12&amp;34/status" in body
+    assert body == urlsystems.renderSystemsStatusXml("12&34", "2021-12-19T02:47:06Z", "false", "false")
+
+
+def test_ping_rates():
+    urlsystems.makeSystemsStatusResponse(statusRequest("1234ABC"), False, False)
+    urlsystems.setStatusPingRates(pingRate=60, historyPingRate=3600)
+
+    body = bodyBytes(urlsystems.makeSystemsStatusResponse(statusRequest("1234ABC"), False, False))
+    golden = readFixture("golden/status_false_false.xml", "rb")
+
+    assert body == (golden.replace(b"<pingRate>30<", b"<pingRate>60<")
+                    .replace(b"<historyPingRate>75600<", b"<historyPingRate>3600<"))
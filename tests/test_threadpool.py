@@ -0,0 +1,92 @@
+import socket
+import socketserver
+import threading
+import time
+
+from custom_components.carrier_infinity.httpserver import MyThreadPoolTCPServer
+
+
+# Holds each connection until released, answering it with "done"
+class HeldHandler(socketserver.BaseRequestHandler):
+
+    release = None
+    started = None
+
+    def handle(self):
+        HeldHandler.started.release()
+        HeldHandler.release.wait(5)
+        self.request.sendall(b"done")
+
+
+def startServer(poolSize, queueDepth):
+    HeldHandler.release = threading.Event()
+    HeldHandler.started = threading.Semaphore(0)
+    server = MyThreadPoolTCPServer(("127.0.0.1", 0), HeldHandler, None, poolSize=poolSize, queueDepth=queueDepth)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.start()
+    return (server, thread)
+
+
+def connect(server):
+    client = socket.create_connection(server.server_address)
+    client.settimeout(5)
+    return client
+
+
+# Connect and wait for a worker to start on it
+def connectBusy(server):
+    client = connect(server)
+    assert HeldHandler.started.acquire(timeout=5)
+    return client
+
+
+# Connect and wait for it to be queued
+def connectQueued(server):
+    queued = server.poolStats()["queued"]
+    client = connect(server)
+    deadline = time.monotonic() + 5
+    while server.poolStats()["queued"] == queued and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client
+
+
+def test_pool_stats_show_busy_and_queued_workers():
+    (server, thread) = startServer(poolSize=2, queueDepth=4)
+    clients = []
+    try:
+        clients.append(connectBusy(server))
+        clients.append(connectBusy(server))
+        clients.append(connectQueued(server))
+
+        assert server.poolStats() == {"workers": 2, "busy": 2, "saturation": 1.0, "queued": 1, "rejected": 0}
+    finally:
+        HeldHandler.release.set()
+        server.shutdown()
+        thread.join()
+        server.server_close()
+        for client in clients:
+            client.close()
+
+
+def test_close_with_full_queue():
+    (server, thread) = startServer(poolSize=2, queueDepth=1)
+    busy = [connectBusy(server), connectBusy(server)]
+    queued = connectQueued(server)
+    server.shutdown()
+    thread.join()
+
+    # Both workers are busy and the queue is full
+    closer = threading.Thread(target=server.server_close)
+    closer.start()
+    # The queued connection is closed without being handled
+    assert queued.recv(16) == b""
+    assert closer.is_alive()
+
+    HeldHandler.release.set()
+    closer.join(5)
+
+    assert not closer.is_alive()
+    assert [client.recv(16) for client in busy] == [b"done", b"done"]
+    assert not any(worker.is_alive() for worker in server.workers)
+    for client in busy + [queued]:
+        client.close()
@@ -0,0 +1,300 @@
+from datetime import date, datetime
+import json
+import math
+from urllib.parse import urlencode
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from custom_components.carrier_infinity.timeseries import (
+    DEFAULT_MAX_BYTES,
+    DEFAULT_MAX_COLUMNS,
+    EnergyStore,
+    HistoryStore,
+    RingStore,
+)
+
+from helpers import bodyBytes, get, post, readFixture
+
+
+def at(*args):
+    return datetime(*args).timestamp()
+
+
+# An energy upload with the gas usage for today and yesterday, and costs of a
+# tenth of that
+def energy(today, yesterday):
+    periods = lambda scale: "".join(
+        '<period id="{}"><gas>{}</gas><fan>{}</fan></period>'.format(period, value * scale, value * scale / 2)
+        for (period, value) in (("day1", today), ("day2", yesterday), ("month1", 100)))
+    return ET.fromstring('<energy version="1.7"><usage>{}</usage><cost>{}</cost></energy>'.format(periods(1), periods(0.1)))
+
+
+def same(values, expected):
+    return [str(value) for value in values] == [str(value) for value in expected]
+
+
+#
+# RingStore
+#
+
+def test_default_capacity():
+    store = RingStore()
+
+    assert store.capacity == DEFAULT_MAX_BYTES // (8 * (DEFAULT_MAX_COLUMNS + 1))
+    assert store.capacity == 1016
+
+
+# Every slice of a store that has wrapped matches a plain list of the rows
+def test_wrap_around():
+    store = RingStore(maxBytes=8 * 3 * 10, maxColumns=2)
+    rows = []
+    for i in range(57):
+        values = {"a": float(i)} if i % 3 else {"a": float(i), "b": -float(i)}
+        store.append(float(i), values)
+        rows.append((float(i), values))
+
+    kept = rows[-store.capacity:]
+    assert len(store) == store.capacity == 10
+    assert list(store.orderedTimestamps()) == [timestamp for (timestamp, values) in kept]
+
+    for i in range(len(kept) + 1):
+        for j in range(i, len(kept) + 1):
+            assert same(store.columnSlice("b", i, j), [values.get("b", math.nan) for (timestamp, values) in kept[i:j]])
+    for (row, (timestamp, values)) in enumerate(kept):
+        assert store.value("a", row) == values["a"]
+
+    assert len(store.columnSlice("missing", 0, 10)) == 0
+    assert math.isnan(store.value("missing", 0))
+
+
+# Once the budget is used up the oldest rows go and nothing more is allocated
+def test_evicted_at_budget():
+    store = RingStore()
+    values = {"c{}".format(i): float(i) for i in range(DEFAULT_MAX_COLUMNS)}
+    for i in range(store.capacity + 5):
+        store.append(float(i), values)
+
+    assert len(store) == store.capacity
+    assert store.orderedTimestamps()[0] == 5.0
+    assert store.orderedTimestamps()[-1] == float(store.capacity + 4)
+
+    arrays = [store.timestamps] + list(store.columns.values())
+    assert all(len(column) == store.capacity for column in arrays)
+    assert sum(column.buffer_info()[1] * column.itemsize for column in arrays) <= DEFAULT_MAX_BYTES
+
+
+def test_column_limit(caplog):
+    store = RingStore(maxColumns=DEFAULT_MAX_COLUMNS)
+    values = {"c{:03}".format(i): float(i) for i in range(DEFAULT_MAX_COLUMNS + 2)}
+
+    store.append(1.0, values)
+    store.append(2.0, values)
+
+    assert len(store.columns) == DEFAULT_MAX_COLUMNS
+    assert store.droppedColumns == {"c128", "c129"}
+    # Logged once for each
+    assert len([record for record in caplog.records if "Too many columns" in record.message]) == 2
+
+
+# A column first seen after other rows is missing from them
+def test_missing_values():
+    store = RingStore(maxBytes=8 * 3 * 10, maxColumns=2)
+    store.append(1.0, {"a": 1.0})
+    store.append(2.0, {"a": 2.0, "b": 20.0})
+    store.append(3.0, {"b": 30.0})
+
+    assert same(store.columnSlice("a", 0, 3), [1.0, 2.0, math.nan])
+    assert same(store.columnSlice("b", 0, 3), [math.nan, 20.0, 30.0])
+
+
+def test_row_before_last_is_dropped(caplog):
+    store = RingStore(maxBytes=8 * 3 * 10, maxColumns=2)
+
+    assert store.append(100.0, {"a": 1.0})
+    assert store.append(100.0, {"a": 2.0})
+    assert not store.append(99.0, {"a": 3.0})
+    assert store.append(101.0, {"a": 4.0})
+
+    assert list(store.orderedTimestamps()) == [100.0, 100.0, 101.0]
+    assert list(store.columnSlice("a", 0, 3)) == [1.0, 2.0, 4.0]
+    assert "before the last one" in caplog.text
+
+
+# Also once the store has wrapped and the last row is at the end of the arrays
+def test_row_before_last_is_dropped_after_wrapping():
+    store = RingStore(maxBytes=8 * 3 * 4, maxColumns=2)
+    for i in range(store.capacity):
+        store.append(float(i), {"a": float(i)})
+
+    assert store.next == 0
+    assert not store.append(0.5, {"a": 0.5})
+    assert store.append(float(store.capacity), {"a": 9.0})
+    assert list(store.orderedTimestamps()) == [1.0, 2.0, 3.0, 4.0]
+
+
+#
+# HistoryStore
+#
+
+def test_history_columns():
+    store = HistoryStore()
+    store.addUpload(at(2021, 12, 18, 10), ET.fromstring(readFixture("history.xml")))
+
+    assert store.value("sample[1]/zones/zone[2]/htsp", 0) == 68.0
+    assert "sample[1]/time" not in store.columns
+    assert "sample[1]/mode" not in store.columns
+
+
+def test_history_aggregate():
+    store = HistoryStore()
+    store.addUpload(at(2026, 10, 1, 8), ET.fromstring('<history><oat>30</oat><zone id="1"><rt>68</rt></zone></history>'))
+    store.addUpload(at(2026, 10, 2, 8), ET.fromstring('<history><oat>40</oat></history>'))
+    store.addUpload(at(2026, 10, 3, 8), ET.fromstring('<history><oat>35</oat><zone id="1"><rt>70</rt></zone></history>'))
+
+    result = store.aggregate()
+    assert result["samples"] == 3
+    assert (result["start"], result["end"]) == ("2026-10-01T08:00:00", "2026-10-03T08:00:00")
+    assert result["columns"] == {
+        "oat": {"count": 3, "sum": 105.0, "min": 30.0, "max": 40.0, "last": 35.0},
+        "zone[1]/rt": {"count": 2, "sum": 138.0, "min": 68.0, "max": 70.0, "last": 70.0}
+    }
+
+    # Up to but not including the end
+    result = store.aggregate(at(2026, 10, 2), at(2026, 10, 3, 8))
+    assert result["samples"] == 1
+    assert result["columns"] == {"oat": {"count": 1, "sum": 40.0, "min": 40.0, "max": 40.0, "last": 40.0}}
+
+    assert store.aggregate(at(2026, 11, 1)) == {"samples": 0, "start": None, "end": None, "columns": {}}
+
+
+#
+# EnergyStore
+#
+
+def test_energy_columns():
+    store = EnergyStore()
+    store.addUpload(at(2021, 12, 18, 10), ET.fromstring(readFixture("energy.xml")))
+
+    # 2 sections of 6 periods of 8 categories
+    assert len(store.columns) == 96
+    assert set(store.periodColumns("day2")["cost"]) == {"hpheat", "eheat", "reheat", "fangas", "looppump", "cooling", "fan", "gas"}
+
+
+def test_energy_days():
+    store = EnergyStore()
+    store.addUpload(at(2026, 10, 1, 8), energy(3, 10))
+    store.addUpload(at(2026, 10, 1, 20), energy(7, 10))
+    store.addUpload(at(2026, 10, 2, 0, 5), energy(0.5, 7.5))
+    store.addUpload(at(2026, 10, 2, 12), energy(4, 7.5))
+    store.addUpload(at(2026, 10, 4, 12), energy(5, 2))
+    store.addUpload(at(2026, 10, 7, 12), energy(1, 6))
+
+    result = store.aggregateDays()
+
+    assert {day: figures["usage"]["gas"] for (day, figures) in result["days"].items()} == {
+        # day2 of the first upload of the next day, the whole day
+        "2026-10-01": 7.5,
+        # No upload on the 3rd, so day1 of the last upload of the day
+        "2026-10-02": 4.0,
+        # No uploads on the 3rd itself, but the 4th has it as day2
+        "2026-10-03": 2.0,
+        "2026-10-04": 5.0,
+        # Nothing for the 5th
+        "2026-10-06": 6.0,
+        # The last upload, today so far
+        "2026-10-07": 1.0,
+    }
+    assert result["days"]["2026-10-01"]["usage"] == {"gas": 7.5, "fan": 3.75}
+    assert result["days"]["2026-10-01"]["cost"] == pytest.approx({"gas": 0.75, "fan": 0.375})
+    assert result["total"]["usage"] == {"gas": 25.5, "fan": 12.75}
+    assert result["total"]["cost"] == pytest.approx({"gas": 2.55, "fan": 1.275})
+
+
+def test_energy_day_range():
+    store = EnergyStore()
+    store.addUpload(at(2026, 10, 1, 8), energy(3, 10))
+    store.addUpload(at(2026, 10, 2, 8), energy(4, 6))
+    store.addUpload(at(2026, 10, 3, 8), energy(5, 8))
+
+    result = store.aggregateDays(date(2026, 10, 2), date(2026, 10, 2))
+    assert list(result["days"]) == ["2026-10-02"]
+    assert result["days"]["2026-10-02"]["usage"]["gas"] == 8.0
+
+    # Days before the first upload have nothing
+    result = store.aggregateDays(date(2026, 9, 1), date(2026, 10, 1))
+    assert list(result["days"]) == ["2026-10-01"]
+    assert result["days"]["2026-10-01"]["usage"] == {"gas": 6.0, "fan": 3.0}
+
+
+def test_energy_empty():
+    assert EnergyStore().aggregateDays() == {"days": {}, "total": {"usage": {}, "cost": {}}}
+
+
+#
+# /api/energy and /api/history
+#
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(systems_state, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(systems_state, "time", clock)
+    return clock
+
+
+def upload(clock, timestamp, kind, xmlString):
+    clock.now = timestamp
+    assert post("/systems/123/" + kind, xmlString).code == 200
+
+
+def energyXml(today, yesterday):
+    return ET.tostring(energy(today, yesterday), "unicode")
+
+
+def getJson(path, **query):
+    response = get(path, urlencode(query))
+    assert response.code == 200
+    return json.loads(bodyBytes(response))
+
+
+def test_api_energy(clock):
+    upload(clock, at(2026, 10, 1, 8), "energy", energyXml(3, 10))
+    upload(clock, at(2026, 10, 2, 0, 5), "energy", energyXml(0.5, 7.5))
+    upload(clock, at(2026, 10, 3, 12), "energy", energyXml(4, 6))
+
+    assert set(getJson("/api/energy")["days"]) == {"2026-10-01", "2026-10-02", "2026-10-03"}
+    result = getJson("/api/energy", start="2026-10-02")
+    assert set(result["days"]) == {"2026-10-02", "2026-10-03"}
+    assert result["total"]["usage"]["gas"] == 10.0
+    assert set(getJson("/api/energy", start="2026-10-01", end="2026-10-01")["days"]) == {"2026-10-01"}
+
+
+def test_api_history(clock):
+    upload(clock, at(2026, 10, 1, 8), "history", "<history><oat>30</oat></history>")
+    upload(clock, at(2026, 10, 2, 8), "history", "<history><oat>40</oat></history>")
+
+    assert getJson("/api/history")["columns"]["oat"]["sum"] == 70.0
+    result = getJson("/api/history", start="2026-10-02", end="2026-10-02")
+    assert (result["samples"], result["start"]) == (1, "2026-10-02T08:00:00")
+
+
+@pytest.mark.parametrize("path", ["/api/energy", "/api/history"])
+def test_api_bad_date(systems_state, path):
+    assert get(path, "start=yesterday").code == 400
+
+
+# The thermostat still gets its response
+def test_bad_upload(systems_state, clock, caplog):
+    upload(clock, at(2026, 10, 1, 8), "energy", "<energy><bad")
+
+    assert len(systems_state.energyStore) == 0
+    assert "Unable to read" in caplog.text
@@ -0,0 +1,248 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from custom_components.carrier_infinity import upstream
+from custom_components.carrier_infinity.upstream import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitOpenError,
+    UpstreamClient,
+    attemptTimeout,
+)
+
+
+# A stand-in for Carrier's server that answers each request with the next
+# of a list of status codes, after a delay if one is given as (code, seconds)
+class StandInServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.answers = []
+        self.paths = []
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/weather/10001/forecast".format(self.server_address[1])
+
+    # A client that timed out has gone by the time a slow answer is written
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        answer = self.server.answers.pop(0) if self.server.answers else 200
+        (code, delay) = answer if isinstance(answer, tuple) else (answer, 0)
+        time.sleep(delay)
+        body = b"<weather_forecast/>"
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Stands in for time in upstream.py, so waits and timeouts don't take real
+# time.  Requests to the stand-in server still do.
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def jitter(monkeypatch):
+    # Record the range of each wait, and wait for its longest
+    ranges = []
+
+    def uniform(low, high):
+        ranges.append((low, high))
+        return high
+    monkeypatch.setattr(upstream.random, "uniform", uniform)
+    return ranges
+
+
+def test_retries_with_backoff(server, clock, jitter):
+    server.answers = [503, 502, 200]
+    client = UpstreamClient()
+
+    response = client.request("GET", server.url)
+
+    assert response.status_code == 200
+    assert len(server.paths) == 3
+    assert jitter == [(0, 0.2), (0, 0.4)]
+    assert clock.sleeps == [0.2, 0.4]
+    assert client.stats()["retries"] == 2
+    assert client.stats()["failures"] == 0
+
+
+def test_gives_up_after_retries(server, clock, jitter):
+    server.answers = [503, 503, 503, 200]
+    client = UpstreamClient()
+
+    response = client.request("GET", server.url)
+
+    assert response.status_code == 503
+    assert len(server.paths) == 3
+    assert client.stats()["failures"] == 1
+
+
+def test_post_is_not_retried(server, clock, jitter):
+    server.answers = [503, 200]
+    client = UpstreamClient()
+
+    assert client.request("POST", server.url, data=b"x").status_code == 503
+    assert len(server.paths) == 1
+    assert jitter == []
+
+
+def test_connection_errors_are_retried(clock, jitter):
+    # Nothing listens on a closed server's port
+    closed = StandInServer()
+    url = closed.url
+    closed.server_close()
+    client = UpstreamClient()
+
+    with pytest.raises(requests.ConnectionError):
+        client.request("GET", url)
+    assert len(jitter) == 2
+
+
+def test_no_retry_past_deadline(server, clock, jitter):
+    server.answers = [503, 503, 200]
+    client = UpstreamClient(deadline=0.9)
+
+    # The first wait of up to 0.2s leaves time for another attempt, the
+    # second of up to 0.4s does not
+    response = client.request("GET", server.url)
+
+    assert response.status_code == 503
+    assert len(server.paths) == 2
+    assert clock.sleeps == [0.2]
+
+
+def test_attempt_timeout_is_cut_to_deadline():
+    assert attemptTimeout((3.05, 10), 20) == (3.05, 10)
+    assert attemptTimeout((3.05, 10), 2.5) == (2.5, 2.5)
+    assert attemptTimeout(10, 2.5) == 2.5
+    assert attemptTimeout(None, 2.5) == 2.5
+    assert attemptTimeout((3.05, 10), -1) == (0.001, 0.001)
+
+
+def test_slow_server_is_timed_out_at_deadline(server):
+    server.answers = [(200, 2)]
+    client = UpstreamClient(maxRetries=0, deadline=0.3)
+
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.request("GET", server.url)
+    assert time.monotonic() - start < 1.5
+
+
+def test_circuit_opens_after_failures(server, clock, jitter):
+    server.answers = [503] * 3
+    client = UpstreamClient(maxRetries=0, failureThreshold=3, resetTimeout=30)
+
+    for _ in range(3):
+        client.request("GET", server.url)
+    assert client.state == CIRCUIT_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", server.url)
+    assert len(server.paths) == 3
+    assert client.stats()["rejected"] == 1
+
+
+def test_half_open_success_closes(server, clock, jitter):
+    server.answers = [503, 200]
+    client = UpstreamClient(maxRetries=0, failureThreshold=1, resetTimeout=30)
+    client.request("GET", server.url)
+    assert client.state == CIRCUIT_OPEN
+
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", server.url)
+
+    clock.now += 1
+    assert client.request("GET", server.url).status_code == 200
+    assert client.state == CIRCUIT_CLOSED
+    assert client.failures == 0
+
+
+def test_half_open_failure_reopens(server, clock, jitter):
+    server.answers = [503, 503, 200]
+    client = UpstreamClient(maxRetries=0, failureThreshold=3, resetTimeout=30)
+    client.state = CIRCUIT_OPEN
+    client.openedAt = clock.now - 30
+
+    # Only the one trial request goes through, and one failure opens it again
+    assert client.request("GET", server.url).status_code == 503
+    assert client.state == CIRCUIT_OPEN
+    assert client.openedAt == clock.now
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", server.url)
+    assert len(server.paths) == 1
+
+
+def test_half_open_lets_one_request_through(server, clock, jitter):
+    client = UpstreamClient(maxRetries=0)
+    client.state = CIRCUIT_OPEN
+    client.openedAt = clock.now - client.resetTimeout
+
+    client.checkCircuit()
+    assert client.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        client.checkCircuit()
+
+
+def test_connections_are_reused(server):
+    client = UpstreamClient()
+
+    for _ in range(4):
+        assert client.request("GET", server.url).content == b"<weather_forecast/>"
+
+    stats = client.stats()
+    assert stats["connections"] == 1
+    assert stats["pool_hit_rate"] == 0.75
@@ -0,0 +1,141 @@
+import threading
+import types
+
+import pytest
+import requests
+
+from custom_components.carrier_infinity import urlweather
+from custom_components.carrier_infinity.urlweather import MAX_WEATHER_ENTRIES, WeatherCache, makeWeatherResponse
+from custom_components.carrier_infinity.httpobj import HttpResponse
+
+KEY = ("www.api.ing.carrier.com", "10001")
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+# Background refreshes are kept to be run by the test when it chooses
+class HeldThread:
+
+    started = []
+
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        HeldThread.started.append(self)
+
+    @classmethod
+    def runAll(cls):
+        (started, cls.started) = (cls.started, [])
+        for thread in started:
+            thread.target(*thread.args)
+
+
+# Forecasts numbered in the order they are fetched
+class Upstream:
+
+    def __init__(self):
+        self.fetches = 0
+        self.failing = False
+
+    def fetch(self):
+        if self.failing:
+            raise requests.ConnectionError("down")
+        self.fetches += 1
+        return makeWeatherResponse("<forecast>{}</forecast>".format(self.fetches).encode("utf-8"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(urlweather, "time", clock)
+    monkeypatch.setattr(urlweather, "threading", types.SimpleNamespace(Lock=threading.Lock, Thread=HeldThread))
+    HeldThread.started = []
+    return clock
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+def test_fresh_forecast_is_served_from_cache(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>1</forecast>"
+    clock.now += 899
+    response = cache.get(KEY, upstream.fetch)
+
+    assert response.code == 200
+    assert response.body == b"<forecast>1</forecast>"
+    assert upstream.fetches == 1
+    assert HeldThread.started == []
+
+
+def test_stale_forecast_is_served_while_refreshed(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+    cache.get(KEY, upstream.fetch)
+
+    clock.now += 900
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>1</forecast>"
+    # Only one refresh at a time
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>1</forecast>"
+    assert len(HeldThread.started) == 1
+    assert upstream.fetches == 1
+
+    HeldThread.runAll()
+
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>2</forecast>"
+    assert HeldThread.started == []
+
+
+def test_failed_refresh_keeps_stale_forecast(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+    cache.get(KEY, upstream.fetch)
+
+    clock.now += 1000
+    upstream.failing = True
+    cache.get(KEY, upstream.fetch)
+    HeldThread.runAll()
+
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>1</forecast>"
+    # And a later request tries again
+    assert len(HeldThread.started) == 1
+
+
+def test_forecast_expires_after_max_stale(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+    cache.get(KEY, upstream.fetch)
+
+    clock.now += 3600
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>2</forecast>"
+    assert HeldThread.started == []
+
+    clock.now += 3600
+    upstream.failing = True
+    assert cache.get(KEY, upstream.fetch).code == 503
+
+
+def test_errors_are_not_cached(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+
+    assert cache.get(KEY, lambda: HttpResponse.errorResponse(502, "Message")).code == 502
+    assert cache.get(KEY, upstream.fetch).body == b"<forecast>1</forecast>"
+
+
+def test_oldest_postal_code_is_dropped(clock, upstream):
+    cache = WeatherCache(ttl=900, maxStale=3600)
+
+    for postalCode in range(MAX_WEATHER_ENTRIES + 1):
+        cache.get(("host", str(postalCode)), upstream.fetch)
+
+    assert len(cache.entries) == MAX_WEATHER_ENTRIES
+    assert ("host", "0") not in cache.entries
@@ -0,0 +1,124 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from custom_components.carrier_infinity import xmlbackend
+from custom_components.carrier_infinity.commands import HoldCommand
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+
+from helpers import GoldenDatetime, bodyBytes, get, post, readFixture
+
+pytest.importorskip("lxml")
+
+
+@pytest.fixture(params=[xmlbackend.BACKEND_ETREE, xmlbackend.BACKEND_LXML])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(xmlbackend, "backendName", xmlbackend.backendName)
+    xmlbackend.useBackend(request.param)
+    return request.param
+
+
+@pytest.fixture
+def systems(systems_state, backend, monkeypatch):
+    monkeypatch.setattr(systems_state, "datetime", GoldenDatetime)
+    post("/systems/1234ABC", readFixture("config.xml"))
+    post("/systems/1234ABC/status", readFixture("status.xml"))
+    return systems_state
+
+
+def test_use_backend(monkeypatch):
+    monkeypatch.setattr(xmlbackend, "backendName", xmlbackend.BACKEND_ETREE)
+
+    xmlbackend.useBackend(xmlbackend.BACKEND_AUTO)
+    assert xmlbackend.backendName == xmlbackend.BACKEND_LXML
+
+    with pytest.raises(ValueError):
+        xmlbackend.useBackend("expat")
+
+
+def test_lxml_not_installed(monkeypatch):
+    monkeypatch.setattr(xmlbackend, "backendName", xmlbackend.BACKEND_ETREE)
+    monkeypatch.setattr(xmlbackend, "lxmlEtree", None)
+
+    xmlbackend.useBackend(xmlbackend.BACKEND_LXML)
+    assert xmlbackend.backendName == xmlbackend.BACKEND_ETREE
+    xmlbackend.useBackend(xmlbackend.BACKEND_AUTO)
+    assert xmlbackend.backendName == xmlbackend.BACKEND_ETREE
+
+
+@pytest.mark.parametrize("fixture", ["config.xml", "status.xml"])
+def test_serialize_matches_element_tree(backend, fixture):
+    xmlString = readFixture(fixture)
+    root = xmlbackend.fromstring(xmlString)
+
+    assert xmlbackend.isStdlibElement(root) == (backend == xmlbackend.BACKEND_ETREE)
+    assert xmlbackend.serialize(root) == ET.tostring(ET.fromstring(xmlString), "utf-8")
+
+
+# lxml keeps comments and processing instructions by default
+def test_comments_are_dropped(backend):
+    xmlString = "<?xml version=\"1.0\" encoding=\"UTF-8\"?><a><!-- note --><b>1</b><?pi x?><c/></a>"
+    assert xmlbackend.serialize(xmlbackend.fromstring(xmlString)) == b"<a><b>1</b><c /></a>"
+
+
+# Nothing outside the document is read, and an entity reference gives no text
+def test_lxml_entities_not_resolved(tmp_path, monkeypatch):
+    monkeypatch.setattr(xmlbackend, "backendName", xmlbackend.BACKEND_LXML)
+    secret = tmp_path / "secret.txt"
+    secret.write_text("secret")
+    xmlString = ('<!DOCTYPE a [<!ENTITY e SYSTEM "{}"><!ENTITY i "inner">]>'
+                 '<a><b>x&e;y</b><c>&i;</c><d/>z</a>').format(secret.as_uri())
+    expected = {"a": {"b": "xy", "c": None, "d": None, "#text": "z"}}
+
+    assert xmlbackend.serialize(xmlbackend.fromstring(xmlString)) == b"<a><b>xy</b><c /><d />z</a>"
+    assert XmlDocument(xmlString).asDict() == expected
+    document = XmlDocument(xmlString)
+    document.root
+    assert document.asDict() == expected
+
+
+def test_copy_tree_is_element_tree(backend):
+    root = xmlbackend.fromstring(readFixture("config.xml"))
+    copied = xmlbackend.copyTree(root)
+
+    assert xmlbackend.isStdlibElement(copied)
+    assert all(xmlbackend.isStdlibElement(element) for element in copied.iter())
+    assert ET.tostring(copied, "utf-8") == xmlbackend.serialize(root)
+
+
+@pytest.mark.parametrize("fixture", ["config.xml", "status.xml"])
+def test_same_dict(backend, fixture):
+    xmlString = readFixture(fixture)
+    xmlbackend.useBackend(xmlbackend.BACKEND_ETREE)
+    expected = XmlDocument(xmlString).asDict()
+    xmlbackend.useBackend(backend)
+
+    assert XmlDocument(xmlString).asDict() == expected
+
+    document = XmlDocument(xmlString)
+    document.root
+    assert document.asDict() == expected
+
+
+@pytest.mark.parametrize(("command", "golden"), [
+    (None, "config_none.xml"),
+    (HoldCommand("1", True, "manual", "", 71), "config_hold_manual.xml"),
+])
+def test_config_response(systems, command, golden):
+    if command:
+        systems.submitCommand(command)
+    assert bodyBytes(get("/systems/1234ABC/config")) == readFixture("golden/" + golden, "rb")
+
+
+def test_device_config_response(systems):
+    expected = ET.fromstring(readFixture("config.xml")).find("./config")
+    assert bodyBytes(get("/api/deviceConfig")) == ET.tostring(expected, "utf-8")
+
+
+def test_status_response(systems):
+    xmlString = readFixture("status.xml").replace(
+        "<oat>", '<status id="1">\n <a x="1">a &amp; b</a>\n <b/><!-- c -->\n</status><oat>', 1)
+    post("/systems/1234ABC/status", xmlString)
+
+    expected = ET.fromstring(xmlString).find("./status")
+    assert bodyBytes(get("/api/status")) == ET.tostring(expected, "utf-8")
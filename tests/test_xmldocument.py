@@ -0,0 +1,84 @@
+from urllib.parse import quote
+
+import pytest
+
+from custom_components.carrier_infinity.httpobj import HttpRequest
+from custom_components.carrier_infinity.httpserver import dispatchRequest
+from custom_components.carrier_infinity.xmldocument import XmlDocument, XmlExtractor
+
+from helpers import readFixture
+
+xmltodict = pytest.importorskip("xmltodict")
+
+DOCUMENTS = [
+    readFixture("config.xml"),
+    readFixture("status.xml"),
+    "<a/>",
+    "<a>text</a>",
+    "<a>  \n  </a>",
+    '<a id="1"/>',
+    '<a id="1">text</a>',
+    "<a><b>1</b><b>2</b><c/><b>3</b></a>",
+    "<a><b><c>deep</c></b></a>",
+    "<a>before<b/>middle<c/>after</a>",
+    "<a>x &lt; y &amp; z</a>",
+    "<a><![CDATA[ <not/> a tag ]]></a>",
+    "<?xml version=\"1.0\" encoding=\"UTF-8\"?><a><!-- note --><b>1</b><?pi x?></a>",
+    '<a xmlns:atom="http://www.w3.org/2005/Atom"><atom:link rel="self" href="h"/><b/></a>',
+    '<a xmlns="urn:default"><b>1</b></a>',
+    '<a xmlns:q="urn:q"><q:b q:x="1">t</q:b><c xmlns:r="urn:r"><r:d/></c></a>',
+    "<a>café ☃</a>",
+]
+
+
+def expected(xmlString):
+    return xmltodict.parse(xmlString, dict_constructor=dict)
+
+
+@pytest.mark.parametrize("xmlString", DOCUMENTS)
+def test_streamed_dict_matches_xmltodict(xmlString):
+    assert XmlDocument(xmlString).asDict() == expected(xmlString)
+
+
+@pytest.mark.parametrize("xmlString", DOCUMENTS)
+def test_tree_dict_matches_xmltodict(xmlString):
+    document = XmlDocument(xmlString)
+    document.root
+    assert document.asDict() == expected(xmlString)
+
+
+# Streaming frees the elements it doesn't keep, which mustn't change the dict
+@pytest.mark.parametrize("keepPath", ["config", "config/mode"])
+def test_extract_then_dict(keepPath):
+    xmlString = readFixture("config.xml")
+    document = XmlDocument(xmlString)
+
+    zoneIds = []
+    extractor = XmlExtractor()
+    extractor.onElement("config/zones/zone", lambda zone, ancestors: zoneIds.append(zone.get("id")))
+    extractor.keep(keepPath)
+    kept = document.extract(extractor)
+
+    assert zoneIds == ["1", "2", "3", "4", "5", "6", "7", "8"]
+    assert len(kept[keepPath]) == 1
+    assert document.asDict() == expected(xmlString)
+
+
+def test_dict_is_built_once():
+    document = XmlDocument(readFixture("status.xml"))
+    assert document.asDict() is document.asDict()
+
+
+# The handler's parse is the one Home Assistant is given
+def test_upload_parsed_once(systems_state):
+    request = HttpRequest(HttpRequest.VERSION_1_1, HttpRequest.METHOD_POST, "/systems/1234ABC/status", None)
+    request.body = "data=" + quote(readFixture("status.xml"))
+    request.contentType = "application/x-www-form-urlencoded"
+    request.parseBody()
+
+    dispatchRequest(request)
+
+    document = request.document
+    assert document.tree is not None
+    assert request.xmlDocument() is document
+    assert document.asDict() == expected(readFixture("status.xml"))
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+from custom_components.carrier_infinity.xmldocument import XmlDocument
+from custom_components.carrier_infinity.zonechanges import ZoneChangeTracker, ZoneSnapshot
+
+from helpers import readFixture
+
+ZONE_IDS = ["1", "2"]
+
+
+def statusUpload(text):
+    return XmlDocument(text).asDict()["status"]
+
+
+def test_local_time_alone_changes_nothing():
+    tracker = ZoneChangeTracker()
+    status = readFixture("status.xml")
+    tracker.update("status", statusUpload(status))
+    assert tracker.zonesToRefresh(ZONE_IDS, {}) == ZONE_IDS
+
+    changes = tracker.update("status", statusUpload(status.replace("21:47:06", "21:47:36")))
+
+    assert changes == {}
+    assert tracker.zonesToRefresh(ZONE_IDS, changes, datetime(2021, 12, 18, 21, 47, 36)) == []
+
+
+def test_zone_change_refreshes_only_that_zone():
+    tracker = ZoneChangeTracker()
+    status = readFixture("status.xml")
+    tracker.update("status", statusUpload(status))
+    tracker.zonesToRefresh(ZONE_IDS, {})
+
+    changes = tracker.update("status", statusUpload(status.replace("<rt>69.0</rt>", "<rt>69.5</rt>")))
+
+    assert changes == {"1": {"rt": ("69.0", "69.5")}}
+    assert tracker.zonesToRefresh(ZONE_IDS, changes) == ["1"]
+    assert tracker.generation("1", "status") == 2
+    assert tracker.generation("2", "status") == 1
+
+
+def test_refresh_when_next_period_starts():
+    tracker = ZoneChangeTracker()
+    tracker.zonesToRefresh(ZONE_IDS, {})
+    tracker.refreshAt("1", datetime(2021, 12, 18, 22, 0))
+
+    assert tracker.zonesToRefresh(ZONE_IDS, {}, datetime(2021, 12, 18, 21, 59, 59)) == []
+    assert tracker.zonesToRefresh(ZONE_IDS, {}, datetime(2021, 12, 18, 22, 0, 6)) == ["1"]
+    # Until the entity gives the start of the period after that one
+    assert tracker.zonesToRefresh(ZONE_IDS, {}, datetime(2021, 12, 18, 22, 0, 36)) == []
+
+
+def test_refresh_at_none_cancels():
+    tracker = ZoneChangeTracker()
+    tracker.zonesToRefresh(ZONE_IDS, {})
+    tracker.refreshAt("2", datetime(2021, 12, 18, 22, 0))
+    tracker.refreshAt("2", None)
+
+    assert tracker.zonesToRefresh(ZONE_IDS, {}, datetime(2021, 12, 19, 0, 0)) == []
+
+
+def test_refresh_after_max_interval(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("custom_components.carrier_infinity.zonechanges.time.monotonic", lambda: now[0])
+    tracker = ZoneChangeTracker(maxRefreshInterval=300)
+    tracker.zonesToRefresh(ZONE_IDS, {})
+
+    now[0] += 299
+    assert tracker.zonesToRefresh(ZONE_IDS, {}) == []
+    now[0] += 1
+    assert tracker.zonesToRefresh(ZONE_IDS, {}) == ZONE_IDS
+
+
+def snapshot():
+    return ZoneSnapshot(statusUpload(readFixture("status.xml")), XmlDocument(readFixture("config.xml")).asDict()["system"]["config"])
+
+
+# Shared by the entities of every zone, so none of them can change it
+def test_snapshot_is_read_only():
+    zones = snapshot()
+
+    with pytest.raises(TypeError):
+        zones.statusZones["9"] = {}
+    with pytest.raises(TypeError):
+        del zones.configZones["1"]
+    with pytest.raises(TypeError):
+        zones.activities[("1", "home")] = {}
+    with pytest.raises(AttributeError):
+        zones.status = {}
+    with pytest.raises(AttributeError):
+        zones.other = 1
+
+    assert "9" not in zones.statusZones
+    assert zones.zoneConfig("1") is not None
+
+
+def test_replace_shares_the_other_index():
+    zones = snapshot()
+    status = statusUpload(readFixture("status.xml").replace("<rt>69.0</rt>", "<rt>69.5</rt>"))
+
+    replaced = zones.replace("status", status)
+
+    assert replaced.zoneStatus("1")["rt"] == "69.5"
+    assert zones.zoneStatus("1")["rt"] == "69.0"
+    assert replaced.configZones is zones.configZones